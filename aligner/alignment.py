@@ -0,0 +1,223 @@
+"""
+Phoneme sequence alignment trên mảng int.
+
+Phoneme được intern 1 lần thành id nhỏ (theo dạng đã normalize), CONFUSABLE
+được compile thành ma trận chi phí thay thế dày (NumPy). Edit distance chạy
+theo từng hàng: min(delete, substitute) vector hóa, còn insert (phụ thuộc
+ngang trong cùng hàng) là 1 prefix-min:
+
+    cur[j] = min_k<=j (cand[k] + INDEL * (j - k))
+
+Chi phí được nhân COST_SCALE (=2) để mọi phép tính là số nguyên:
+insert/delete = 1.0, substitute = 0.0 / 0.5 / 1.0 → 2 / 0, 1, 2.
+"""
+
+import threading
+
+import numpy as np
+
+COST_SCALE = 2
+INDEL_COST = 1 * COST_SCALE
+CONFUSABLE_COST = 1  # 0.5 × COST_SCALE
+MISMATCH_COST = 1 * COST_SCALE
+
+
+class PhonemeInventory:
+    """
+    Intern phoneme (string) → id của dạng normalize, kèm ma trận chi phí
+    thay thế (n_symbols, n_symbols) int32.
+
+    Symbol mới được thêm khi gặp lần đầu; ma trận được build lại (hiếm, vocab
+    chỉ vài trăm phoneme).
+    """
+
+    def __init__(self, normalize, confusable: set[tuple[str, str]]):
+        self._normalize = normalize
+        self._confusable = confusable
+        self._lock = threading.Lock()
+        self._raw_to_id: dict[str, int] = {}
+        self._norm_to_id: dict[str, int] = {}
+        self.symbols: list[str] = []
+        self.costs = np.zeros((0, 0), dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def _sub_cost(self, a_norm: str, b_norm: str) -> int:
+        if a_norm == b_norm:
+            return 0
+        # base character (ký tự đầu) để check CONFUSABLE, giống phoneme_sub_cost
+        if (a_norm[:1], b_norm[:1]) in self._confusable:
+            return CONFUSABLE_COST
+        return MISMATCH_COST
+
+    def _intern_locked(self, token: str) -> int:
+        norm = self._normalize(token) if token else ""
+        idx = self._norm_to_id.get(norm)
+        if idx is None:
+            idx = len(self.symbols)
+            self._norm_to_id[norm] = idx
+            self.symbols.append(norm)
+        self._raw_to_id[token] = idx
+        return idx
+
+    def _rebuild_costs_locked(self) -> None:
+        n = len(self.symbols)
+        costs = np.empty((n, n), dtype=np.int32)
+        for i, a in enumerate(self.symbols):
+            for j, b in enumerate(self.symbols):
+                costs[i, j] = self._sub_cost(a, b)
+        self.costs = costs
+
+    def encode(self, tokens: list[str]) -> np.ndarray:
+        """list phoneme → np.ndarray int32 id."""
+        raw_to_id = self._raw_to_id
+        try:
+            return np.fromiter((raw_to_id[t] for t in tokens), dtype=np.int32, count=len(tokens))
+        except KeyError:
+            pass
+        with self._lock:
+            ids = [raw_to_id.get(t) for t in tokens]
+            n_before = len(self.symbols)
+            ids = [self._intern_locked(t) if i is None else i for t, i in zip(tokens, ids)]
+            if len(self.symbols) != n_before:
+                self._rebuild_costs_locked()
+        return np.asarray(ids, dtype=np.int32)
+
+
+def edit_distance_ids(a: np.ndarray, b: np.ndarray, costs: np.ndarray) -> int:
+    """
+    Weighted edit distance (đã scale ×COST_SCALE) giữa 2 dãy id.
+    """
+    m, n = len(a), len(b)
+    if m == 0:
+        return n * INDEL_COST
+    if n == 0:
+        return m * INDEL_COST
+
+    sub = costs[np.ix_(a, b)]  # (m, n)
+    ramp = np.arange(n + 1, dtype=np.int64) * INDEL_COST
+    prev = ramp.copy()
+    cand = np.empty(n + 1, dtype=np.int64)
+    for i in range(1, m + 1):
+        cand[0] = i * INDEL_COST
+        np.minimum(prev[1:] + INDEL_COST, prev[:-1] + sub[i - 1], out=cand[1:])
+        prev = np.minimum.accumulate(cand - ramp) + ramp
+    return int(prev[n])
+
+
+def substring_distances_ids(
+    refs: list[np.ndarray], pred: np.ndarray, costs: np.ndarray
+) -> np.ndarray:
+    """
+    Khoảng cách (scaled) từ mỗi ref tới đoạn khớp nhất trong pred, tất cả
+    ref trong 1 DP batch (W, Lp + 1).
+
+    - len(pred) > len(ref): semi-global — gap ở 2 đầu pred miễn phí
+      (hàng 0 = 0, lấy min của hàng cuối), O(Lp·Lr) thay vì trượt cửa sổ.
+    - len(pred) <= len(ref): global như edit_distance_ids.
+    """
+    n_refs = len(refs)
+    n = len(pred)
+    if n_refs == 0:
+        return np.zeros(0, dtype=np.int64)
+    lengths = np.array([len(r) for r in refs], dtype=np.int64)
+    if n == 0:
+        return lengths * INDEL_COST
+
+    max_len = int(lengths.max())
+    padded = np.zeros((n_refs, max_len), dtype=np.int32)
+    for w, ref in enumerate(refs):
+        padded[w, : len(ref)] = ref
+
+    ramp = np.arange(n + 1, dtype=np.int64) * INDEL_COST
+    is_global = lengths >= n
+    prev = np.where(is_global[:, None], ramp[None, :], 0)
+    best = np.where(is_global, n * INDEL_COST, 0)  # ref rỗng
+    cand = np.empty((n_refs, n + 1), dtype=np.int64)
+    for i in range(1, max_len + 1):
+        sub = costs[np.ix_(padded[:, i - 1], pred)]  # (W, n)
+        cand[:, 0] = i * INDEL_COST
+        np.minimum(prev[:, 1:] + INDEL_COST, prev[:, :-1] + sub, out=cand[:, 1:])
+        prev = np.minimum.accumulate(cand - ramp, axis=1) + ramp
+        done = np.flatnonzero(lengths == i)
+        if done.size:
+            best[done] = np.where(is_global[done], prev[done, n], prev[done].min(axis=1))
+    return best
+
+
+# ----------------- Alignment + backtrace -----------------
+OP_MATCH = 0
+OP_CONFUSABLE = 1
+OP_SUBSTITUTE = 2
+OP_DELETE = 3
+OP_NAMES = ("match", "confusable", "substitution", "deletion")
+# Partial credit theo op (confusable = nửa điểm, giống chi phí 0.5)
+OP_CREDIT = np.array([1.0, 0.5, 0.0, 0.0])
+
+
+def align_ids(ref: np.ndarray, pred: np.ndarray, costs: np.ndarray) -> dict:
+    """
+    Align ref với pred trong 1 DP (cùng chế độ global / semi-global như
+    substring_distances_ids), giữ full matrix để backtrace.
+
+    Returns dict:
+        distance   : khoảng cách (scaled ×COST_SCALE)
+        ops        : int8 (Lr,) OP_* cho từng phoneme ref
+        pred_index : int32 (Lr,) vị trí pred được ghép, -1 nếu bị xóa
+        credit     : float (Lr,) 1.0 / 0.5 / 0.0
+        insertions : số phoneme pred thừa nằm trong đoạn được align
+    """
+    m, n = len(ref), len(pred)
+    ops = np.full(m, OP_DELETE, dtype=np.int8)
+    pred_index = np.full(m, -1, dtype=np.int32)
+    if m == 0:
+        return {
+            "distance": n * INDEL_COST,
+            "ops": ops,
+            "pred_index": pred_index,
+            "credit": OP_CREDIT[ops],
+            "insertions": n,
+        }
+
+    semiglobal = n > m
+    ramp = np.arange(n + 1, dtype=np.int64) * INDEL_COST
+    sub = costs[np.ix_(ref, pred)]  # (m, n)
+    dp = np.empty((m + 1, n + 1), dtype=np.int64)
+    dp[0] = 0 if semiglobal else ramp
+    cand = np.empty(n + 1, dtype=np.int64)
+    for i in range(1, m + 1):
+        cand[0] = i * INDEL_COST
+        np.minimum(dp[i - 1, 1:] + INDEL_COST, dp[i - 1, :-1] + sub[i - 1], out=cand[1:])
+        dp[i] = np.minimum.accumulate(cand - ramp) + ramp
+
+    j = int(np.argmin(dp[m])) if semiglobal else n
+    distance = int(dp[m, j])
+
+    # Backtrace: ưu tiên diag, rồi delete, rồi insert
+    insertions = 0
+    i = m
+    while i > 0:
+        if j > 0 and dp[i, j] == dp[i - 1, j - 1] + sub[i - 1, j - 1]:
+            c = sub[i - 1, j - 1]
+            ops[i - 1] = (
+                OP_MATCH if c == 0 else OP_CONFUSABLE if c < MISMATCH_COST else OP_SUBSTITUTE
+            )
+            pred_index[i - 1] = j - 1
+            i -= 1
+            j -= 1
+        elif dp[i, j] == dp[i - 1, j] + INDEL_COST:
+            i -= 1  # ref phoneme bị xóa
+        else:
+            insertions += 1
+            j -= 1
+    if not semiglobal:
+        insertions += j
+
+    return {
+        "distance": distance,
+        "ops": ops,
+        "pred_index": pred_index,
+        "credit": OP_CREDIT[ops],
+        "insertions": insertions,
+    }
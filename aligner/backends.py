@@ -0,0 +1,363 @@
+"""
+Inference backend cho phoneme CTC model (dưới audio_to_phoneme_ids /
+forward_log_probs_batch).
+
+Mỗi backend nhận input_values (B, S) float32 + attention_mask (B, S) đã pad
+bởi Wav2Vec2Processor và trả logits (B, T, V) float32 NumPy:
+  torch : Wav2Vec2ForCTC, precision fp32 / int8 (dynamic quant) / bf16 (autocast)
+  onnx  : ONNX Runtime trên file export 1 lần từ model local (dynamic batch +
+          time axes); int8 = onnxruntime dynamic quantization của file fp32
+  stub  : không cần weight — logits giả (xác định theo độ dài input) trên 1
+          vocab IPA cố định, để benchmark / test các stage chấm điểm
+
+Cấu hình (env):
+  PHONEME_BACKEND          : "torch" (mặc định) | "onnx" | "stub"
+  PHONEME_ONNX_PATH        : file .onnx (mặc định <PHONEME_MODEL_PATH>/phoneme_ctc.onnx),
+                             chưa có → export lúc startup
+  ORT_INTRA_OP_THREADS     : mặc định = torch.get_num_threads() của worker (executor chia core)
+  ORT_GRAPH_OPTIMIZATION   : "disable" | "basic" | "extended" | "all" (mặc định all)
+  ORT_ENABLE_MEM_ARENA     : 1 (mặc định) | 0
+  ORT_ALLOW_SPINNING       : 0 (mặc định, nhiều worker chạy song song) | 1
+  ORT_OPTIMIZED_MODEL_PATH : lưu graph đã optimize để xem / load lại (tùy chọn)
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "stub")
+PRECISION_MODES = ("fp32", "int8", "bf16")
+
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", "0"))
+ORT_GRAPH_OPTIMIZATION = os.getenv("ORT_GRAPH_OPTIMIZATION", "all").strip().lower()
+ORT_ENABLE_MEM_ARENA = os.getenv("ORT_ENABLE_MEM_ARENA", "1") == "1"
+ORT_ALLOW_SPINNING = os.getenv("ORT_ALLOW_SPINNING", "0") == "1"
+ORT_OPTIMIZED_MODEL_PATH = os.getenv("ORT_OPTIMIZED_MODEL_PATH", "")
+
+ONNX_OPSET = 17
+
+
+def feat_extract_output_lengths(config, lengths: np.ndarray) -> np.ndarray:
+    """Số frame CTC cho mỗi độ dài input (conv feature extractor, không padding)."""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    for kernel, stride in zip(config.conv_kernel, config.conv_stride):
+        lengths = (lengths - kernel) // stride + 1
+    return np.maximum(lengths, 0)
+
+
+# ----------------- Precision (torch) -----------------
+def cpu_supports_bf16() -> bool:
+    """CPU có lệnh bf16 native (AVX512-BF16 / AMX / ARM BF16) hay không."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        pass
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = set(f.read().split())
+    except OSError:
+        return False
+    return bool(flags & {"avx512_bf16", "amx_bf16", "bf16"})
+
+
+def apply_precision(model: torch.nn.Module, mode: str, device: torch.device) -> tuple[torch.nn.Module, str]:
+    """
+    Áp precision mode cho model đã load. Trả (model, mode thực tế):
+    mode không dùng được trên máy hiện tại → fallback fp32 (có log warning).
+    """
+    if mode == "fp32":
+        return model, mode
+    if device.type != "cpu":
+        logger.warning(f"Precision mode '{mode}' is CPU-only; using fp32 on {device}")
+        return model, "fp32"
+    if mode == "int8":
+        quantized = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        return quantized.eval(), mode
+    if mode == "bf16":
+        if not cpu_supports_bf16():
+            logger.warning("CPU has no native bfloat16 support; using fp32")
+            return model, "fp32"
+        return model, mode
+    raise ValueError(f"unknown precision mode '{mode}'")
+
+
+def model_nbytes(model: torch.nn.Module) -> int:
+    """Kích thước weight + buffer (kể cả packed params của Linear int8)."""
+
+    def nbytes(value) -> int:
+        if isinstance(value, torch.Tensor):
+            return value.element_size() * value.nelement()
+        if isinstance(value, (tuple, list)):
+            return sum(nbytes(v) for v in value)
+        return 0
+
+    return sum(nbytes(v) for v in model.state_dict().values())
+
+
+# ----------------- Backends -----------------
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, model: torch.nn.Module, device: torch.device, precision: str = "fp32"):
+        self.device = device
+        self.config = model.config
+        self.model, self.precision = apply_precision(model, precision, device)
+
+    def _autocast(self):
+        if self.precision == "bf16":
+            return torch.autocast(device_type="cpu", dtype=torch.bfloat16)
+        return contextlib.nullcontext()
+
+    def logits(self, input_values: np.ndarray, attention_mask: np.ndarray | None = None) -> np.ndarray:
+        with torch.no_grad(), self._autocast():
+            inputs = torch.from_numpy(input_values).to(self.device)
+            mask = None if attention_mask is None else torch.from_numpy(attention_mask).to(self.device)
+            logits = self.model(inputs, attention_mask=mask).logits
+        return logits.float().cpu().numpy()
+
+    def nbytes(self) -> int:
+        return model_nbytes(self.model)
+
+
+class OnnxBackend:
+    """
+    ONNX Runtime (CPUExecutionProvider). Session tạo lazily ở lần forward đầu
+    tiên trong worker, để số thread theo torch.get_num_threads() đã được
+    executor cấu hình (và không share session qua fork).
+    """
+
+    name = "onnx"
+
+    def __init__(self, path: str, config, precision: str = "fp32"):
+        if precision == "bf16":
+            logger.warning("bf16 is not supported by the ONNX backend; using fp32")
+            precision = "fp32"
+        if precision == "int8":
+            path = quantize_onnx(path)
+        self.path = path
+        self.config = config
+        self.precision = precision
+        self._session = None
+        self._lock = threading.Lock()
+        # Thread pool của session không sống qua fork → process con tạo session mới
+        os.register_at_fork(after_in_child=self._reset_session)
+
+    def _reset_session(self) -> None:
+        self._session = None
+        self._lock = threading.Lock()
+
+    def session_options(self):
+        import onnxruntime as ort
+
+        levels = {
+            "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        }
+        if ORT_GRAPH_OPTIMIZATION not in levels:
+            raise ValueError(f"ORT_GRAPH_OPTIMIZATION={ORT_GRAPH_OPTIMIZATION!r} is not one of {tuple(levels)}")
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = levels[ORT_GRAPH_OPTIMIZATION]
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.intra_op_num_threads = ORT_INTRA_OP_THREADS or torch.get_num_threads()
+        opts.inter_op_num_threads = 1
+        opts.enable_cpu_mem_arena = ORT_ENABLE_MEM_ARENA
+        # Shape thay đổi theo từng request → memory pattern không tái sử dụng được
+        opts.enable_mem_pattern = False
+        opts.add_session_config_entry(
+            "session.intra_op.allow_spinning", "1" if ORT_ALLOW_SPINNING else "0"
+        )
+        if ORT_OPTIMIZED_MODEL_PATH:
+            opts.optimized_model_filepath = ORT_OPTIMIZED_MODEL_PATH
+        return opts
+
+    def _get_session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import onnxruntime as ort
+
+                    opts = self.session_options()
+                    self._session = ort.InferenceSession(
+                        self.path, opts, providers=["CPUExecutionProvider"]
+                    )
+                    logger.info(
+                        f"ONNX Runtime session ready: {self.path} "
+                        f"(intra_op={opts.intra_op_num_threads}, opt={ORT_GRAPH_OPTIMIZATION})"
+                    )
+        return self._session
+
+    def logits(self, input_values: np.ndarray, attention_mask: np.ndarray | None = None) -> np.ndarray:
+        if attention_mask is None:
+            attention_mask = np.ones(input_values.shape, dtype=np.int64)
+        (logits,) = self._get_session().run(
+            ["logits"],
+            {
+                "input_values": np.ascontiguousarray(input_values, dtype=np.float32),
+                "attention_mask": attention_mask.astype(np.int64, copy=False),
+            },
+        )
+        return logits
+
+    def nbytes(self) -> int:
+        return os.path.getsize(self.path)
+
+
+class StubBackend:
+    """
+    Logits giả không cần model: mỗi utterance là chuỗi phoneme ngẫu nhiên
+    (seed theo độ dài) ~12 phoneme/s, mỗi phoneme 2-6 frame, xen blank và
+    thỉnh thoảng 1 pause dài. Chi phí gần 0 → đo riêng các stage sau forward.
+    """
+
+    name = "stub"
+    precision = "fp32"
+
+    def __init__(self, config):
+        self.config = config
+        self.vocab_size = config.vocab_size
+        self.blank_id = config.pad_token_id
+
+    def _frame_ids(self, n_frames: int, seed: int) -> np.ndarray:
+        rng = np.random.default_rng(seed)
+        n_units = n_frames // 2 + 1
+        # phoneme (id >= 4, bỏ special tokens) xen kẽ đoạn blank
+        ids = np.empty(2 * n_units, dtype=np.int64)
+        ids[0::2] = rng.integers(4, self.vocab_size, n_units)
+        ids[1::2] = self.blank_id
+        durations = np.empty(2 * n_units, dtype=np.int64)
+        durations[0::2] = rng.integers(2, 7, n_units)
+        durations[1::2] = np.where(rng.random(n_units) < 0.05, rng.integers(15, 40, n_units), 1)
+        return np.repeat(ids, durations)[:n_frames]
+
+    def logits(self, input_values: np.ndarray, attention_mask: np.ndarray | None = None) -> np.ndarray:
+        batch, n_samples = input_values.shape
+        lengths = (
+            attention_mask.sum(axis=-1) if attention_mask is not None else np.full(batch, n_samples)
+        )
+        n_frames = int(feat_extract_output_lengths(self.config, [n_samples])[0])
+        logits = np.full((batch, n_frames, self.vocab_size), -8.0, dtype=np.float32)
+        for b, length in enumerate(feat_extract_output_lengths(self.config, lengths)):
+            ids = self._frame_ids(n_frames, seed=int(length))
+            logits[b, np.arange(n_frames), ids] = 4.0
+        return logits
+
+    def nbytes(self) -> int:
+        return 0
+
+
+# Vocab IPA (subset của wav2vec2-lv-60-espeak-cv-ft), id 0 = <pad> = CTC blank
+STUB_VOCAB = [
+    "<pad>", "<s>", "</s>", "<unk>",
+    "p", "b", "t", "d", "k", "ɡ", "f", "v", "θ", "ð", "s", "z", "ʃ", "ʒ", "h",
+    "tʃ", "dʒ", "m", "n", "ŋ", "l", "ɹ", "w", "j", "ɾ",
+    "iː", "ɪ", "eɪ", "ɛ", "æ", "ɑː", "ɔː", "oʊ", "ʊ", "uː", "ʌ", "ə", "ɚ", "ɜː", "aɪ", "aʊ", "ɔɪ", "ᵻ",
+]
+
+
+def build_stub_processor():
+    """(Wav2Vec2Processor, Wav2Vec2Config) cho STUB_VOCAB, không đọc file model."""
+    from transformers import (
+        Wav2Vec2Config,
+        Wav2Vec2FeatureExtractor,
+        Wav2Vec2PhonemeCTCTokenizer,
+        Wav2Vec2Processor,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vocab_path = os.path.join(tmp, "vocab.json")
+        with open(vocab_path, "w", encoding="utf-8") as f:
+            json.dump({tok: i for i, tok in enumerate(STUB_VOCAB)}, f, ensure_ascii=False)
+        tokenizer = Wav2Vec2PhonemeCTCTokenizer(vocab_path, do_phonemize=False)
+    feature_extractor = Wav2Vec2FeatureExtractor(
+        feature_size=1,
+        sampling_rate=16000,
+        padding_value=0.0,
+        do_normalize=True,
+        return_attention_mask=True,
+    )
+    config = Wav2Vec2Config(vocab_size=len(STUB_VOCAB), pad_token_id=0)
+    return Wav2Vec2Processor(feature_extractor=feature_extractor, tokenizer=tokenizer), config
+
+
+# ----------------- Export -----------------
+def export_onnx(model: torch.nn.Module, path: str) -> str:
+    """Export Wav2Vec2ForCTC → ONNX (dynamic batch / samples / frames), ghi atomic."""
+    logger.info(f"Exporting phoneme model to ONNX: {path}")
+    model = model.float().eval()
+    dummy = torch.zeros(1, 16000, dtype=torch.float32)
+    mask = torch.ones(1, 16000, dtype=torch.int64)
+    tmp_path = f"{path}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy, mask),
+            tmp_path,
+            input_names=["input_values", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_values": {0: "batch", 1: "samples"},
+                "attention_mask": {0: "batch", 1: "samples"},
+                "logits": {0: "batch", 1: "frames"},
+            },
+            opset_version=ONNX_OPSET,
+            do_constant_folding=True,
+            dynamo=False,
+        )
+    os.replace(tmp_path, path)
+    logger.info(f"ONNX export done: {path} ({os.path.getsize(path) / 2**20:.1f} MiB)")
+    return path
+
+
+def quantize_onnx(path: str) -> str:
+    """File int8 (dynamic quantization) cạnh file fp32, tạo 1 lần."""
+    stem, ext = os.path.splitext(path)
+    int8_path = f"{stem}.int8{ext}"
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        logger.info(f"Quantizing ONNX model to int8: {int8_path}")
+        tmp_path = f"{int8_path}.tmp"
+        quantize_dynamic(path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+    return int8_path
+
+
+def default_onnx_path(model_dir: str) -> str:
+    return os.getenv("PHONEME_ONNX_PATH") or os.path.join(model_dir, "phoneme_ctc.onnx")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Phoneme model backend tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="export the local model to ONNX")
+    export.add_argument("--model", default=os.getenv("PHONEME_MODEL_PATH", "/opt/phoneme_model"))
+    export.add_argument("--output", help="default: PHONEME_ONNX_PATH or <model>/phoneme_ctc.onnx")
+    export.add_argument("--int8", action="store_true", help="also write the int8 quantized file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    from transformers import Wav2Vec2ForCTC
+
+    model = Wav2Vec2ForCTC.from_pretrained(args.model, local_files_only=True)
+    path = export_onnx(model, args.output or default_onnx_path(args.model))
+    if args.int8:
+        quantize_onnx(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Dynamic micro-batching cho Wav2Vec2 forward.
+
+Các request /align đồng thời được gom trong vài ms, chia theo length bucket
+rồi chạy chung 1 forward (pad + attention_mask). Mỗi request chỉ nhận lại
+log-probs của chính nó.
+
+Cấu hình (env):
+  ALIGN_BATCH_MAX_SIZE     : số utterance tối đa / batch (1 = tắt batching)
+  ALIGN_BATCH_MAX_WAIT_MS  : thời gian gom tối đa, tính từ request đầu tiên
+  ALIGN_BATCH_BUCKETS_S    : biên length bucket (giây), vd "2,5,10,20"
+"""
+
+import asyncio
+import bisect
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from metrics import QUEUE_WAIT_SECONDS, STAGE_SECONDS, observe_forward
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+BATCH_MAX_SIZE = int(os.getenv("ALIGN_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("ALIGN_BATCH_MAX_WAIT_MS", "10"))
+BATCH_BUCKETS_S = [
+    float(x) for x in os.getenv("ALIGN_BATCH_BUCKETS_S", "2,5,10,20").split(",") if x.strip()
+]
+
+
+def plan_batches(
+    lengths: list[int],
+    max_batch_size: int = BATCH_MAX_SIZE,
+    bucket_edges_s: list[float] | None = None,
+) -> list[list[int]]:
+    """
+    Chia 1 tập utterance đã có sẵn (vd. /align/batch) thành các batch forward:
+    cùng length bucket, sắp theo độ dài để padding ít nhất, tối đa
+    max_batch_size item / batch. Trả về list index của từng batch.
+    """
+    edges_s = BATCH_BUCKETS_S if bucket_edges_s is None else bucket_edges_s
+    edges = sorted(int(s * SAMPLE_RATE) for s in edges_s)
+    size = max(1, int(max_batch_size))
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches: list[list[int]] = []
+    current: list[int] = []
+    current_bucket = None
+    for i in order:
+        bucket = bisect.bisect_left(edges, lengths[i])
+        if current and (bucket != current_bucket or len(current) >= size):
+            batches.append(current)
+            current = []
+        current.append(i)
+        current_bucket = bucket
+    if current:
+        batches.append(current)
+    return batches
+
+
+@dataclass
+class _Pending:
+    wav: np.ndarray
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class InferenceBatcher:
+    """
+    Gom các forward đồng thời thành batch.
+
+    forward_fn(list[np.ndarray]) -> list[np.ndarray] chạy blocking trên
+    executor (InferenceExecutor), hoặc thread pool mặc định của event loop.
+    """
+
+    def __init__(
+        self,
+        forward_fn,
+        executor=None,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+        bucket_edges_s: list[float] | None = None,
+    ):
+        self._forward_fn = forward_fn
+        self._executor = executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        edges = BATCH_BUCKETS_S if bucket_edges_s is None else bucket_edges_s
+        self._bucket_edges = sorted(int(s * SAMPLE_RATE) for s in edges)
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+
+        # Stats
+        self._batches = 0
+        self._items = 0
+        self._size_hist = [0] * (self.max_batch_size + 1)
+        self._queue_wait_s = 0.0
+        self._forward_s = 0.0
+        self._last_occupancy = 0.0
+
+    def _bucket_of(self, wav: np.ndarray) -> int:
+        return bisect.bisect_left(self._bucket_edges, len(wav))
+
+    def _ensure_worker(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            # Worker chết (lỗi ngoài dự kiến) → chạy lại, item đang chờ trong queue vẫn giữ
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, wav_16k: np.ndarray) -> np.ndarray:
+        """Đưa 1 utterance vào hàng đợi, trả về log_probs (T, V) của nó."""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Pending(wav_16k, future))
+        return await future
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def _collect(self, batch: list[_Pending]) -> None:
+        """Gom item vào batch (list của caller: lỗi giữa chừng vẫn biết item nào đã lấy)."""
+        loop = asyncio.get_running_loop()
+        batch.append(await self._queue.get())
+        deadline = loop.time() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+    async def _forward(self, wavs: list[np.ndarray]) -> list[np.ndarray]:
+        if self._executor is not None:
+            return await self._executor.run(self._forward_fn, wavs)
+        return await asyncio.get_running_loop().run_in_executor(None, self._forward_fn, wavs)
+
+    @staticmethod
+    def _fail(items: list[_Pending], error: BaseException | None) -> None:
+        """Kết thúc các future chưa xong: set_exception(error), None → cancel."""
+        for it in items:
+            if not it.future.done():
+                if error is None:
+                    it.future.cancel()
+                else:
+                    it.future.set_exception(error)
+
+    async def _run(self) -> None:
+        while True:
+            pending: list[_Pending] = []
+            try:
+                await self._collect(pending)
+                await self._run_batch(pending)
+            except asyncio.CancelledError:
+                self._fail(pending, None)
+                raise
+            except Exception as e:
+                # Lỗi ngoài forward (gom batch, bucket, thống kê...): không để
+                # request nào chờ mãi, worker chạy tiếp với batch sau
+                logger.exception(f"InferenceBatcher: batch failed: {e}")
+                self._fail(pending, e)
+
+    async def _run_batch(self, pending: list[_Pending]) -> None:
+        buckets: dict[int, list[_Pending]] = {}
+        for item in pending:
+            if not item.future.done():  # request đã bị hủy thì bỏ qua
+                buckets.setdefault(self._bucket_of(item.wav), []).append(item)
+
+        for bucket, items in sorted(buckets.items()):
+            started = time.perf_counter()
+            try:
+                outputs = await self._forward([it.wav for it in items])
+                if len(outputs) != len(items):
+                    raise RuntimeError(f"forward returned {len(outputs)} outputs for {len(items)} inputs")
+            except Exception as e:
+                logger.error(f"InferenceBatcher: batch forward failed: {e}")
+                self._fail(items, e)
+                continue
+            forward_s = time.perf_counter() - started
+            for it, out in zip(items, outputs):
+                if not it.future.done():
+                    it.future.set_result(out)
+            self._record(bucket, items, started, forward_s)
+
+    def _record(self, bucket: int, items: list[_Pending], started: float, forward_s: float) -> None:
+        size = len(items)
+        self._batches += 1
+        self._items += size
+        self._size_hist[size] += 1
+        self._queue_wait_s += sum(started - it.enqueued_at for it in items)
+        self._forward_s += forward_s
+        for it in items:
+            QUEUE_WAIT_SECONDS.labels("batch").observe(started - it.enqueued_at)
+            STAGE_SECONDS.labels("forward").observe(forward_s)
+        observe_forward(forward_s, sum(len(it.wav) for it in items) / SAMPLE_RATE)
+        self._last_occupancy = size / self.max_batch_size
+        logger.debug(
+            "InferenceBatcher: bucket=%d size=%d/%d occupancy=%.0f%% forward=%.1fms",
+            bucket,
+            size,
+            self.max_batch_size,
+            self._last_occupancy * 100,
+            forward_s * 1000,
+        )
+
+    def stats(self) -> dict:
+        batches = max(1, self._batches)
+        items = max(1, self._items)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_s * 1000.0,
+            "bucket_edges_s": [e / SAMPLE_RATE for e in self._bucket_edges],
+            "batches": self._batches,
+            "items": self._items,
+            "mean_batch_size": self._items / batches,
+            "mean_occupancy": self._items / (batches * self.max_batch_size),
+            "last_occupancy": self._last_occupancy,
+            "batch_size_histogram": {
+                str(size): count for size, count in enumerate(self._size_hist) if count
+            },
+            "mean_queue_wait_ms": self._queue_wait_s / items * 1000.0,
+            "mean_forward_ms": self._forward_s / batches * 1000.0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
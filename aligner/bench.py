@@ -0,0 +1,319 @@
+"""
+Micro-benchmark từng stage của assess_pronunciation, chạy offline (không qua
+HTTP) trên audio tổng hợp và/hoặc recording thật.
+
+    python bench.py --output bench.json
+    python bench.py --manifest refs.jsonl --durations 1,5,20,60 --iterations 20
+    PHONEME_BACKEND=stub python bench.py          # không cần weight model
+    python bench.py --output new.json --compare bench.json
+
+Mỗi lượt gọi đúng code path của /align: pipeline.score_utterance_timed, thời
+gian từng stage lấy từ "timings" mà assess_pronunciation tự ghi (cùng số với
+align_stage_seconds trên /metrics) → bench không thể lệch khỏi code thật.
+
+Stage (thứ tự trong assess_pronunciation, xem lap() trong ctc_segm):
+  phonemize_cold : words_to_ipa_direct với IPA cache rỗng (đo riêng, trước lượt chấm)
+  phonemize      : words → IPA (cache đã nóng)
+  forward        : feature extractor + model
+  decode         : argmax + CTC collapse + tra phone
+  normalize      : simple-IPA của phoneme dự đoán
+  per            : PER + backtrace + tách flags theo từ
+  coverage       : words_covered
+  fluency        : calculate_fluency
+  forced_align   : CTC Viterbi reference trên log_probs (không có nếu không align được)
+  gop            : GOP từng phoneme trên các đoạn đã align
+  build_response : build_align_response
+  total          : score_utterance_timed end-to-end (không tính decode file audio)
+
+Mỗi case (audio × text) chạy --iterations lần sau --warmup lần, báo p50 /
+p95 / mean (ms). Allocation đo trong 1 lượt riêng với tracemalloc (peak KiB
+và số block còn sống, cho phonemize_cold và total) để không làm sai số thời
+gian; tracemalloc chỉ thấy allocation qua Python allocator (numpy có, torch
+tensor thì không).
+
+PHONEME_BACKEND=stub thay model bằng logits giả (backends.StubBackend):
+forward gần như 0 ms, các stage sau forward vẫn chạy đủ trên chuỗi phoneme
+có độ dài tương ứng với audio. Kết quả JSON có "meta" (commit, backend,
+thread, version) để so sánh giữa các commit bằng --compare.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from manifest import read_manifest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DURATIONS = "1,5,20,60"
+
+# Reference text ngắn / vừa / dài (số từ ~ 3 / 12 / 40)
+TEXTS = {
+    "short": "hello my friend",
+    "medium": "the quick brown fox jumps over the lazy dog near the river",
+    "long": (
+        "she sells sea shells by the sea shore and the shells she sells are surely "
+        "sea shells so if she sells shells on the sea shore i am sure she sells "
+        "sea shore shells every single summer morning"
+    ),
+}
+
+STAGES = (
+    "phonemize_cold",
+    "phonemize",
+    "forward",
+    "decode",
+    "normalize",
+    "per",
+    "coverage",
+    "fluency",
+    "forced_align",
+    "gop",
+    "build_response",
+    "total",
+)
+
+
+# ----------------- Input -----------------
+def synthetic_audio(seconds: float, seed: int = 0) -> np.ndarray:
+    """Tín hiệu giống giọng nói: hài âm F0 ~120 Hz điều biên theo âm tiết + khoảng lặng."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * 16000)
+    t = np.arange(n, dtype=np.float32) / 16000.0
+    f0 = 120.0 + 15.0 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / 16000.0
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 4.0 * t), 0.0, None)  # ~4 âm tiết/s
+    envelope *= rng.random(n // 8000 + 1).repeat(8000)[:n] > 0.15  # pause 0.5 s thỉnh thoảng
+    audio = 0.3 * voiced * envelope + 0.003 * rng.standard_normal(n)
+    return audio.astype(np.float32)
+
+
+def build_cases(args) -> list[dict]:
+    from ctc_segm import normalize_words
+    from pipeline import decode_audio
+
+    text_names = [t.strip() for t in args.texts.split(",") if t.strip()]
+    cases = []
+    for sec in (float(d) for d in args.durations.split(",") if d.strip()):
+        for name in text_names:
+            cases.append(
+                {
+                    "name": f"synthetic_{sec:g}s/{name}",
+                    "source": "synthetic",
+                    "audio": synthetic_audio(sec),
+                    "words": normalize_words(TEXTS[name]),
+                }
+            )
+    if args.manifest:
+        for entry in read_manifest(args.manifest):
+            with open(entry["audio"], "rb") as f:
+                audio = decode_audio(f)
+            cases.append(
+                {
+                    "name": f"recorded/{entry['id']}",
+                    "source": "recorded",
+                    "audio": audio,
+                    "words": normalize_words(entry["text"]),
+                }
+            )
+    return cases
+
+
+# ----------------- Stages -----------------
+def run_case(audio: np.ndarray, words: list[str], measure) -> dict[str, float]:
+    """
+    1 lượt: phonemize với cache rỗng, rồi score_utterance_timed (code path của
+    /align). measure(stage, fn, *args) bọc 2 lời gọi đó; trả về timings
+    {stage: giây} của assess_pronunciation / build_response.
+    """
+    import ctc_segm
+    from pipeline import score_utterance_timed
+
+    ctc_segm.clear_ipa_cache()
+    measure("phonemize_cold", ctc_segm.words_to_ipa_direct, words)
+    _, score_stats = measure("total", score_utterance_timed, audio, words)
+    return score_stats["timings"]
+
+
+def time_case(case: dict, iterations: int, warmup: int) -> dict:
+    timings = {stage: [] for stage in STAGES}
+
+    def timed(stage, fn, *args):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        timings[stage].append((time.perf_counter() - t0) * 1000.0)
+        return result
+
+    def untimed(stage, fn, *args):
+        return fn(*args)
+
+    for _ in range(warmup):
+        run_case(case["audio"], case["words"], untimed)
+    for _ in range(iterations):
+        for stage, seconds in run_case(case["audio"], case["words"], timed).items():
+            timings.setdefault(stage, []).append(seconds * 1000.0)
+    return {
+        stage: {
+            "p50_ms": round(float(np.percentile(values, 50)), 3),
+            "p95_ms": round(float(np.percentile(values, 95)), 3),
+            "mean_ms": round(float(np.mean(values)), 3),
+        }
+        for stage, values in timings.items()
+        if values
+    }
+
+
+def trace_allocations(case: dict) -> dict:
+    """1 lượt với tracemalloc: peak KiB và số block còn giữ lại (phonemize_cold, total)."""
+    allocations = {}
+
+    def traced(stage, fn, *args):
+        tracemalloc.reset_peak()
+        before_size, _ = tracemalloc.get_traced_memory()
+        before = tracemalloc.take_snapshot()
+        result = fn(*args)
+        size, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+        allocations[stage] = {
+            "peak_kib": round((peak - before_size) / 1024.0, 1),
+            "retained_kib": round((size - before_size) / 1024.0, 1),
+            "retained_blocks": blocks,
+        }
+        return result
+
+    tracemalloc.start()
+    try:
+        run_case(case["audio"], case["words"], traced)
+    finally:
+        tracemalloc.stop()
+    return allocations
+
+
+# ----------------- Report -----------------
+def _git_commit() -> str | None:
+    try:
+        proc = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            check=True,
+        )
+        return proc.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_meta() -> dict:
+    import torch
+    import transformers
+
+    import ctc_segm
+
+    model = ctc_segm.model_stats()
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "backend": model.get("backend"),
+        "precision": model.get("precision"),
+        "model": ctc_segm.MODEL_NAME if model.get("backend") != "stub" else None,
+        "torch_threads": torch.get_num_threads(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare_reports(baseline: dict, current: dict) -> list[dict]:
+    """p50 hiện tại / p50 baseline cho mỗi case × stage có ở cả 2 file."""
+    rows = []
+    for name, case in current["cases"].items():
+        base_case = baseline.get("cases", {}).get(name)
+        if base_case is None:
+            continue
+        for stage, stats in case["timings"].items():
+            base = base_case["timings"].get(stage)
+            if not base or not base["p50_ms"]:
+                continue
+            rows.append(
+                {
+                    "case": name,
+                    "stage": stage,
+                    "baseline_p50_ms": base["p50_ms"],
+                    "p50_ms": stats["p50_ms"],
+                    "ratio": round(stats["p50_ms"] / base["p50_ms"], 3),
+                }
+            )
+    return rows
+
+
+def _print_table(report: dict) -> None:
+    header = f"{'case':<32}" + "".join(f"{s[:11]:>12}" for s in STAGES)
+    print(header)
+    for name, case in report["cases"].items():
+        cells = (case["timings"].get(s) for s in STAGES)
+        print(f"{name[:32]:<32}" + "".join(f"{c['p50_ms']:>12.2f}" if c else f"{'-':>12}" for c in cells))
+    print("(p50 ms; p95 / allocations in the JSON report)")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Per-stage benchmark of the assessment pipeline")
+    parser.add_argument("--durations", default=DEFAULT_DURATIONS, help="synthetic audio lengths in seconds")
+    parser.add_argument("--texts", default=",".join(TEXTS), help=f"reference texts ({', '.join(TEXTS)})")
+    parser.add_argument("--manifest", help="recorded audio (.jsonl / .tsv, see manifest.py)")
+    parser.add_argument("--iterations", type=int, default=20, help="timed runs per case")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed runs per case")
+    parser.add_argument("--no-alloc", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="print p50 ratios against an earlier report")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    import ctc_segm
+
+    ctc_segm.startup(warmup=False)
+
+    report = {"meta": run_meta(), "iterations": args.iterations, "cases": {}}
+    for case in build_cases(args):
+        logger.info(f"bench: {case['name']} ({len(case['audio']) / 16000:.1f}s, {len(case['words'])} words)")
+        entry = {
+            "source": case["source"],
+            "audio_s": round(len(case["audio"]) / 16000.0, 3),
+            "words": len(case["words"]),
+            "timings": time_case(case, max(1, args.iterations), max(0, args.warmup)),
+        }
+        if not args.no_alloc:
+            entry["allocations"] = trace_allocations(case)
+        report["cases"][case["name"]] = entry
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["compare"] = {"baseline_commit": baseline.get("meta", {}).get("commit"), "rows": []}
+        report["compare"]["rows"] = compare_reports(baseline, report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    _print_table(report)
+    for row in report.get("compare", {}).get("rows", []):
+        print(f"  {row['case']:<32} {row['stage']:<15} {row['baseline_p50_ms']:>10.2f} → {row['p50_ms']:>10.2f}  x{row['ratio']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+"""
+So sánh các precision mode (PHONEME_PRECISION) và backend (PHONEME_BACKEND)
+của phoneme model trên 1 bộ recording tham chiếu: latency forward, RSS, và
+độ lệch điểm so với torch/fp32.
+
+    python compare_precision.py refs.jsonl --modes fp32,int8,bf16 --repeat 3
+    python compare_precision.py refs.jsonl --backends torch,onnx --modes fp32
+
+Mỗi biến thể (backend/mode) chạy trong 1 subprocess riêng (model load đúng
+như production với env tương ứng) nên RSS không bị lẫn giữa các biến thể.
+Kết quả in ra dạng JSON (hoặc ghi file với --output).
+
+Backend khác torch chạy ở fp32 (vd. onnx/fp32) phải cho cùng kết quả với
+torch/fp32 trong ngưỡng SCORE_TOLERANCE / WORD_SCORE_TOLERANCE /
+MAX_FLAG_CHANGES (chỉnh bằng --score-tolerance, --word-tolerance,
+--max-flag-changes): vượt ngưỡng → "tolerance" của biến thể có "pass": false
+và lệnh exit 1. Biến thể int8 / bf16 chỉ báo độ lệch, không kiểm tra.
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from manifest import read_manifest
+
+logger = logging.getLogger(__name__)
+
+SCORE_KEYS = ("overall", "accuracy", "fluency", "completeness")
+
+# Ngưỡng so với torch/fp32 cho backend khác ở fp32 (max |Δ| trên cả bộ recording)
+SCORE_TOLERANCE = 0.5  # điểm overall / accuracy / fluency / completeness
+WORD_SCORE_TOLERANCE = 1.0  # điểm từng từ
+MAX_FLAG_CHANGES = 0  # số utterance có flag isCorrect của phoneme khác baseline
+
+
+# ----------------- Worker (1 backend / precision mode) -----------------
+def run_worker(manifest_path: str, repeat: int, warmup: int) -> dict:
+    """Chạy trong subprocess: load model theo env hiện tại rồi chấm."""
+    import ctc_segm
+    from ctc_segm import forward_log_probs_batch, normalize_words
+    from pipeline import decode_audio, score_utterance
+
+    ctc_segm.startup(warmup=False)
+    rss_loaded = ctc_segm.process_rss_mb()
+    entries = read_manifest(manifest_path)
+    items = []
+    for entry in entries:
+        with open(entry["audio"], "rb") as f:
+            items.append((entry, decode_audio(f.read()), normalize_words(entry["text"])))
+
+    for _, mono, _ in items[:warmup]:
+        forward_log_probs_batch([mono])
+
+    results = []
+    for entry, mono, words in items:
+        timings = []
+        for _ in range(max(1, repeat)):
+            t0 = time.perf_counter()
+            log_probs = forward_log_probs_batch([mono])[0]
+            timings.append((time.perf_counter() - t0) * 1000.0)
+        response = score_utterance(mono, words, log_probs)
+        results.append(
+            {
+                "id": entry["id"],
+                "audio_s": len(mono) / 16000.0,
+                "forward_ms": float(np.median(timings)),
+                "scores": {k: response.get(k) for k in SCORE_KEYS},
+                "word_scores": [w["score"] for w in response.get("words", [])],
+                "phoneme_correct": [p["isCorrect"] for p in response.get("phonemes", [])],
+                "argmax": log_probs.argmax(axis=-1).tolist(),
+            }
+        )
+
+    model = ctc_segm.model_stats()
+    return {
+        "backend": model["backend"],
+        "mode": model["precision"],
+        "requested": ctc_segm.PHONEME_PRECISION,
+        "weights_mib": model["weights_mib"],
+        "rss_loaded_mb": rss_loaded,
+        "rss_peak_mb": ctc_segm.process_rss_mb(),
+        "results": results,
+    }
+
+
+# ----------------- Parent: so sánh -----------------
+BASELINE = ("torch", "fp32")
+
+
+def _run_variant(backend: str, mode: str, args) -> dict:
+    env = {**os.environ, "PHONEME_BACKEND": backend, "PHONEME_PRECISION": mode}
+    cmd = [
+        sys.executable,
+        os.path.abspath(__file__),
+        args.manifest,
+        "--worker",
+        "--repeat",
+        str(args.repeat),
+        "--warmup",
+        str(args.warmup),
+    ]
+    logger.info(f"compare_precision: running backend={backend} mode={mode}")
+    proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, check=True, text=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _drift(baseline: dict, other: dict) -> dict:
+    base = {r["id"]: r for r in baseline["results"]}
+    score_diffs = {k: [] for k in SCORE_KEYS}
+    word_diffs, flag_changes, frame_agree = [], 0, []
+    for r in other["results"]:
+        b = base.get(r["id"])
+        if b is None:
+            continue
+        for k in SCORE_KEYS:
+            if r["scores"][k] is not None and b["scores"][k] is not None:
+                score_diffs[k].append(abs(r["scores"][k] - b["scores"][k]))
+        word_diffs.extend(abs(x - y) for x, y in zip(r["word_scores"], b["word_scores"]))
+        flag_changes += r["phoneme_correct"] != b["phoneme_correct"]
+        n = min(len(r["argmax"]), len(b["argmax"]))
+        if n:
+            frame_agree.append(float(np.mean(np.array(r["argmax"][:n]) == np.array(b["argmax"][:n]))))
+
+    def summary(values: list[float]) -> dict:
+        if not values:
+            return {"mean": 0.0, "max": 0.0}
+        return {"mean": round(float(np.mean(values)), 3), "max": round(float(np.max(values)), 3)}
+
+    return {
+        **{f"{k}_abs_diff": summary(v) for k, v in score_diffs.items()},
+        "word_score_abs_diff": summary(word_diffs),
+        "utterances_with_flag_changes": flag_changes,
+        "argmax_frame_agreement": round(float(np.mean(frame_agree)), 4) if frame_agree else None,
+    }
+
+
+def _tolerance_check(drift: dict, args) -> dict:
+    """Vi phạm ngưỡng của 1 biến thể (drift từ _drift) → {"pass", "violations"}."""
+    violations = []
+    for k in SCORE_KEYS:
+        worst = drift[f"{k}_abs_diff"]["max"]
+        if worst > args.score_tolerance:
+            violations.append(f"{k} max abs diff {worst} > {args.score_tolerance}")
+    worst = drift["word_score_abs_diff"]["max"]
+    if worst > args.word_tolerance:
+        violations.append(f"word score max abs diff {worst} > {args.word_tolerance}")
+    if drift["utterances_with_flag_changes"] > args.max_flag_changes:
+        violations.append(
+            f"{drift['utterances_with_flag_changes']} utterances with phoneme flag changes"
+            f" > {args.max_flag_changes}"
+        )
+    return {"pass": not violations, "violations": violations}
+
+
+def compare(args) -> dict:
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    variants = [(b, m) for b in backends for m in modes]
+    if BASELINE not in variants:
+        variants.insert(0, BASELINE)
+    runs = {f"{b}/{m}": _run_variant(b, m, args) for b, m in variants}
+    baseline_key = "/".join(BASELINE)
+    baseline = runs[baseline_key]
+
+    report = {
+        "manifest": args.manifest,
+        "utterances": len(baseline["results"]),
+        "tolerance": {
+            "score": args.score_tolerance,
+            "word_score": args.word_tolerance,
+            "flag_changes": args.max_flag_changes,
+        },
+        "pass": True,
+        "variants": {},
+    }
+    for key, run in runs.items():
+        forward = [r["forward_ms"] for r in run["results"]]
+        audio_s = sum(r["audio_s"] for r in run["results"])
+        entry = {
+            "backend": run["backend"],
+            "effective_mode": run["mode"],
+            "weights_mib": run["weights_mib"],
+            "rss_loaded_mb": round(run["rss_loaded_mb"], 1),
+            "rss_peak_mb": round(run["rss_peak_mb"], 1),
+            "forward_ms_p50": round(float(np.percentile(forward, 50)), 2) if forward else None,
+            "forward_ms_p95": round(float(np.percentile(forward, 95)), 2) if forward else None,
+            "real_time_factor": round(sum(forward) / 1000.0 / audio_s, 4) if audio_s else None,
+        }
+        if key != baseline_key:
+            drift = _drift(baseline, run)
+            entry[f"drift_vs_{baseline_key.replace('/', '_')}"] = drift
+            # Cùng precision, khác backend → phải khớp baseline trong ngưỡng
+            if run["backend"] != BASELINE[0] and run["mode"] == BASELINE[1]:
+                entry["tolerance"] = _tolerance_check(drift, args)
+                if not entry["tolerance"]["pass"]:
+                    report["pass"] = False
+                    logger.error(f"compare_precision: {key} exceeds tolerance: {entry['tolerance']['violations']}")
+        report["variants"][key] = entry
+    return report
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare phoneme model backends / precision modes")
+    parser.add_argument("manifest", help=".jsonl / .tsv list of reference recordings (see manifest.py)")
+    parser.add_argument("--modes", default="fp32,int8,bf16", help="comma-separated precision modes")
+    parser.add_argument("--backends", default="torch", help="comma-separated backends (torch, onnx)")
+    parser.add_argument("--repeat", type=int, default=3, help="forward runs per recording (median)")
+    parser.add_argument("--warmup", type=int, default=2, help="recordings to run once before timing")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument(
+        "--score-tolerance", type=float, default=SCORE_TOLERANCE,
+        help="max abs diff of utterance scores vs torch/fp32 for other fp32 backends",
+    )
+    parser.add_argument(
+        "--word-tolerance", type=float, default=WORD_SCORE_TOLERANCE,
+        help="max abs diff of word scores vs torch/fp32 for other fp32 backends",
+    )
+    parser.add_argument(
+        "--max-flag-changes", type=int, default=MAX_FLAG_CHANGES,
+        help="max utterances whose phoneme isCorrect flags differ from torch/fp32",
+    )
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if args.worker:
+        print(json.dumps(run_worker(args.manifest, args.repeat, args.warmup)))
+        return 0
+
+    report = compare(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    return 0 if report["pass"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
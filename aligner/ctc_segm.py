@@ -1,15 +1,45 @@
 import logging
-import math
 import os
-import difflib
+import re
+import resource
+import threading
+import time
+from collections import OrderedDict
 import numpy as np
 import torch
 import torch.nn.functional as F
 
-from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor
+from transformers import Wav2Vec2Config, Wav2Vec2ForCTC, Wav2Vec2Processor
 from phonemizer import phonemize
+from phonemizer.backend import EspeakBackend
 from phonemizer.separator import Separator
 
+from backends import (
+    BACKENDS,
+    PRECISION_MODES,
+    OnnxBackend,
+    StubBackend,
+    TorchBackend,
+    build_stub_processor,
+    default_onnx_path,
+    export_onnx,
+    feat_extract_output_lengths,
+)
+from lexicon import Lexicon
+from streaming import chunked_log_probs
+from forced_align import FORCED_ALIGNMENT, TokenMapper, align_words
+from gop import phoneme_scores
+from fluency import calculate_fluency
+from alignment import (
+    PhonemeInventory,
+    COST_SCALE,
+    edit_distance_ids,
+    substring_distances_ids,
+    align_ids,
+    OP_MATCH,
+    OP_NAMES,
+)
+
 # ----------------- Logging -----------------
 logging.basicConfig(
     level=logging.INFO,
@@ -17,55 +47,132 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ----------------- Load model (singleton) -----------------
-logger.info("Initializing phoneme CTC model...")
+# ----------------- Process stats -----------------
+def process_rss_mb() -> float:
+    """RSS hiện tại của process (MiB); fallback peak RSS nếu không có /proc."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def process_memory(pid: int | str = "self") -> dict:
+    """
+    RSS / PSS / private / shared (MiB) từ /proc/<pid>/smaps_rollup.
+    private = page chỉ process này giữ (với worker fork: phần RSS tăng thêm),
+    shared = page dùng chung (vd. weight của master, copy-on-write).
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    except OSError:
+        return {"rss_mb": round(process_rss_mb(), 1) if pid == "self" else None}
+    return {
+        "rss_mb": round(fields.get("Rss", 0.0), 1),
+        "pss_mb": round(fields.get("Pss", 0.0), 1),
+        "private_mb": round(fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0), 1),
+        "shared_mb": round(fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0), 1),
+    }
+
+
+# ----------------- Config -----------------
 _device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-logger.info(f"Using device: {_device}")
 
 # Model: facebook/wav2vec2-lv-60-espeak-cv-ft
 # Cho phép override bằng biến môi trường (hữu ích khi chạy local)
 MODEL_NAME = os.getenv("PHONEME_MODEL_PATH", "/opt/phoneme_model")
 
-if not os.path.exists(MODEL_NAME):
-    raise FileNotFoundError(
-        f"Model directory not found at {MODEL_NAME}. "
-        "Make sure the model was downloaded during Docker build, "
-        "or set PHONEME_MODEL_PATH environment variable to point to the model directory."
+# Precision cho inference trên CPU:
+#   fp32 : mặc định
+#   int8 : dynamic quantization các nn.Linear (weight int8, activation quantize lúc chạy)
+#   bf16 : autocast bfloat16 (chỉ khi CPU có lệnh bf16, nếu không → fp32)
+PHONEME_PRECISION = os.getenv("PHONEME_PRECISION", "fp32").strip().lower()
+if PHONEME_PRECISION not in PRECISION_MODES:
+    raise ValueError(
+        f"PHONEME_PRECISION={PHONEME_PRECISION!r} is not one of {PRECISION_MODES}"
     )
-if not os.path.isdir(MODEL_NAME):
-    raise ValueError(f"{MODEL_NAME} exists but is not a directory")
 
-required_files = ["config.json", "preprocessor_config.json"]
-missing_files = [
-    f for f in required_files if not os.path.exists(os.path.join(MODEL_NAME, f))
+# Inference backend: torch | onnx (xem backends.py)
+PHONEME_BACKEND = os.getenv("PHONEME_BACKEND", "torch").strip().lower()
+if PHONEME_BACKEND not in BACKENDS:
+    raise ValueError(f"PHONEME_BACKEND={PHONEME_BACKEND!r} is not one of {BACKENDS}")
+
+_PHONEMIZER_LANGUAGE = os.getenv("PHONEMIZER_LANGUAGE", "en-us")
+_PHONEMIZER_BACKEND = os.getenv("PHONEMIZER_BACKEND", "espeak")
+_PHONEMIZER_SEPARATOR = Separator(phone=" ", syllable="", word="")
+
+# Lexicon IPA tính sẵn (mmap), xem lexicon.py
+_LEXICON_PATH = os.getenv("PRONUNCIATION_LEXICON_PATH", "")
+
+# Audio dài hơn LONG_AUDIO_S: forward theo cửa sổ chồng lấn (xem streaming.chunked_log_probs)
+# thay vì 1 lần trên cả clip → bộ nhớ đỉnh cố định, thời gian tuyến tính. 0 = tắt.
+LONG_AUDIO_S = float(os.getenv("ALIGN_LONG_AUDIO_S", "30"))
+LONG_AUDIO_WINDOW_S = float(os.getenv("ALIGN_LONG_AUDIO_WINDOW_S", "20"))
+LONG_AUDIO_CONTEXT_S = float(os.getenv("ALIGN_LONG_AUDIO_CONTEXT_S", "2"))
+LONG_AUDIO_BATCH = int(os.getenv("ALIGN_LONG_AUDIO_BATCH", "2"))
+
+# Warm-up forward lúc startup: độ dài audio (giây), "" = tắt
+STARTUP_WARMUP_S = [
+    float(x) for x in os.getenv("STARTUP_WARMUP_S", "1,4,10").split(",") if x.strip()
 ]
-if missing_files:
-    all_files = os.listdir(MODEL_NAME) if os.path.exists(MODEL_NAME) else []
-    logger.error(f"Model directory {MODEL_NAME} is missing required files: {missing_files}")
-    logger.error(f"Existing files: {all_files}")
-    raise FileNotFoundError(
-        f"Model directory {MODEL_NAME} is missing required files: {missing_files}. "
-        "Please rebuild Docker image to download the model correctly."
-    )
 
-logger.info(f"✅ Model directory found at: {MODEL_NAME}")
+# ----------------- Startup phases -----------------
+# Model / phonemizer không còn load lúc import: startup() chạy từng phase
+# (load_model → init_phonemizer → warm_up), ghi thời gian từng phase để
+# /readyz và log cho thấy process đang ở đâu.
+_processor: Wav2Vec2Processor | None = None
+_model_config: Wav2Vec2Config | None = None
+_backend = None
+_phonemizer = None
+_phonemizer_lock = threading.Lock()
+_lexicon: Lexicon | None = None
+
+_startup_lock = threading.Lock()
+_startup_t0 = time.perf_counter()
+_startup = {"ready": False, "phase": "pending", "phases_ms": {}, "ready_after_s": None, "error": None}
 
-try:
-    logger.info(f"Loading processor from local path: {MODEL_NAME}")
-    # local_files_only=True và cache_dir=None để không tạo thư mục mới
-    _processor = Wav2Vec2Processor.from_pretrained(
-        MODEL_NAME, 
-        local_files_only=True,
-        cache_dir=None
-    )
 
+def _check_model_dir() -> None:
+    if not os.path.exists(MODEL_NAME):
+        raise FileNotFoundError(
+            f"Model directory not found at {MODEL_NAME}. "
+            "Make sure the model was downloaded during Docker build, "
+            "or set PHONEME_MODEL_PATH environment variable to point to the model directory."
+        )
+    if not os.path.isdir(MODEL_NAME):
+        raise ValueError(f"{MODEL_NAME} exists but is not a directory")
+
+    required_files = ["config.json", "preprocessor_config.json"]
+    missing_files = [
+        f for f in required_files if not os.path.exists(os.path.join(MODEL_NAME, f))
+    ]
+    if missing_files:
+        all_files = os.listdir(MODEL_NAME)
+        logger.error(f"Model directory {MODEL_NAME} is missing required files: {missing_files}")
+        logger.error(f"Existing files: {all_files}")
+        raise FileNotFoundError(
+            f"Model directory {MODEL_NAME} is missing required files: {missing_files}. "
+            "Please rebuild Docker image to download the model correctly."
+        )
+    logger.info(f"✅ Model directory found at: {MODEL_NAME}")
+
+
+def _load_torch_model() -> Wav2Vec2ForCTC:
     logger.info(f"Loading Wav2Vec2ForCTC model from local path: {MODEL_NAME}")
+    # safetensors được đọc qua mmap (không copy qua buffer pickle trung gian)
+    use_safetensors = os.path.exists(os.path.join(MODEL_NAME, "model.safetensors")) or None
     try:
-        _model = (
+        return (
             Wav2Vec2ForCTC.from_pretrained(
                 MODEL_NAME,
                 local_files_only=True,
-                cache_dir=None  # Không dùng cache để tránh tạo thư mục
+                cache_dir=None,  # Không dùng cache để tránh tạo thư mục
+                use_safetensors=use_safetensors,
             )
             .to(_device)
             .eval()
@@ -81,82 +188,441 @@ try:
             "Please rebuild Docker image to download the model correctly."
         ) from load_error
 
-    logger.info("Phoneme CTC model loaded successfully (offline mode)")
-except Exception as e:
-    logger.error(f"Failed to load phoneme model from {MODEL_NAME}: {e}")
-    logger.error("Make sure the model was downloaded and copied to Docker image")
-    raise
 
-logger.info("Loading phonemizer backend...")
-_PHONEMIZER_LANGUAGE = os.getenv("PHONEMIZER_LANGUAGE", "en-us")
-_PHONEMIZER_BACKEND = os.getenv("PHONEMIZER_BACKEND", "espeak")
-_PHONEMIZER_SEPARATOR = Separator(phone=" ", syllable="", word="")
-logger.info("All models (ASR phoneme + phonemizer) loaded successfully")
+def load_model() -> None:
+    """Phase 1: processor + config + inference backend (idempotent)."""
+    global _processor, _model_config, _backend
+    if _backend is not None:
+        return
+    logger.info(f"Initializing phoneme CTC model on {_device}...")
+    if PHONEME_BACKEND == "stub":
+        # Không có weight: logits giả, dùng cho benchmark / test (xem backends.StubBackend)
+        _processor, _model_config = build_stub_processor()
+        _backend = StubBackend(_model_config)
+        logger.warning("Phoneme model backend: stub (synthetic logits, scores are meaningless)")
+        return
+    _check_model_dir()
+    # local_files_only=True và cache_dir=None để không tạo thư mục mới
+    processor = Wav2Vec2Processor.from_pretrained(MODEL_NAME, local_files_only=True, cache_dir=None)
+    config = Wav2Vec2Config.from_pretrained(MODEL_NAME, local_files_only=True)
+
+    if PHONEME_BACKEND == "onnx":
+        onnx_path = default_onnx_path(MODEL_NAME)
+        if not os.path.exists(onnx_path):
+            # Export 1 lần, các lần start sau chỉ load file .onnx (không giữ model torch)
+            export_onnx(_load_torch_model().cpu(), onnx_path)
+        backend = OnnxBackend(onnx_path, config, PHONEME_PRECISION)
+    else:
+        backend = TorchBackend(_load_torch_model(), _device, PHONEME_PRECISION)
+
+    _processor, _model_config, _backend = processor, config, backend
+    logger.info(
+        f"Phoneme model backend: {_backend.name}, precision: {_backend.precision} "
+        f"(weights {_backend.nbytes() / 2**20:.1f} MiB, process RSS {process_rss_mb():.1f} MiB)"
+    )
+
+
+def init_phonemizer() -> None:
+    """Phase 2: phonemizer backend (giữ 1 instance, không tạo lại mỗi lần gọi) + lexicon."""
+    global _phonemizer, _lexicon
+    if _phonemizer is None and _PHONEMIZER_BACKEND == "espeak":
+        _phonemizer = EspeakBackend(
+            _PHONEMIZER_LANGUAGE, preserve_punctuation=False, with_stress=False
+        )
+    _phonemize_words(["hello"])  # load espeak data cho ngôn ngữ
+
+    if _LEXICON_PATH and _lexicon is None:
+        lexicon = Lexicon(_LEXICON_PATH)
+        lex_meta = (lexicon.meta.get("language"), lexicon.meta.get("backend"))
+        if lex_meta != (_PHONEMIZER_LANGUAGE, _PHONEMIZER_BACKEND):
+            logger.warning(
+                f"Lexicon {_LEXICON_PATH} was built for {lex_meta}, "
+                f"runtime uses {(_PHONEMIZER_LANGUAGE, _PHONEMIZER_BACKEND)}; ignoring it"
+            )
+        else:
+            _lexicon = lexicon
+            logger.info(f"Pronunciation lexicon mapped: {_LEXICON_PATH} ({len(_lexicon)} words)")
+
+
+def warm_up(lengths_s: list[float] = STARTUP_WARMUP_S, threads: int | None = None) -> None:
+    """
+    Phase 3: forward trên các độ dài đại diện (từng cái + 1 batch pad) để
+    allocator, kernel (oneDNN / ORT session) được khởi tạo trước request đầu.
+
+    threads=1 khi process sẽ fork worker sau đó: OpenMP thread pool đã chạy
+    song song trong process cha làm worker bị treo ở forward đầu tiên.
+    """
+    if not lengths_s:
+        return
+    rng = np.random.default_rng(0)
+    wavs = [(0.01 * rng.standard_normal(int(sec * 16000))).astype(np.float32) for sec in lengths_s]
+    prev_threads = torch.get_num_threads()
+    if threads:
+        torch.set_num_threads(threads)
+    try:
+        for wav in wavs:
+            forward_log_probs_batch([wav])
+        if len(wavs) > 1:
+            forward_log_probs_batch(wavs)
+    finally:
+        if threads:
+            torch.set_num_threads(prev_threads)
+
+
+def startup(warmup: bool = True, warmup_threads: int | None = None) -> dict:
+    """Chạy các phase startup theo thứ tự (gọi lại sau khi xong → không làm gì)."""
+    with _startup_lock:
+        if _startup["ready"]:
+            return startup_status()
+        phases = [("load_model", load_model), ("init_phonemizer", init_phonemizer)]
+        if warmup:
+            phases.append(("warm_up", lambda: warm_up(threads=warmup_threads)))
+        try:
+            for name, fn in phases:
+                _startup["phase"] = name
+                started = time.perf_counter()
+                fn()
+                _startup["phases_ms"][name] = round((time.perf_counter() - started) * 1000.0, 1)
+                logger.info(f"Startup phase {name}: {_startup['phases_ms'][name]:.0f} ms")
+        except Exception as e:
+            _startup["phase"] = "failed"
+            _startup["error"] = f"{type(e).__name__}: {e}"
+            logger.error(f"Startup failed in phase {name}: {e}")
+            raise
+        _startup["phase"] = "ready"
+        _startup["ready"] = True
+        _startup["ready_after_s"] = round(time.perf_counter() - _startup_t0, 3)
+        logger.info(
+            f"All models (ASR phoneme + phonemizer) ready in {_startup['ready_after_s']:.2f}s "
+            f"{_startup['phases_ms']} (process RSS {process_rss_mb():.1f} MiB)"
+        )
+    return startup_status()
+
+
+def startup_status() -> dict:
+    return {**_startup, "phases_ms": dict(_startup["phases_ms"])}
+
+
+def is_ready() -> bool:
+    return _startup["ready"]
+
 
 # ----------------- Core: audio → phoneme IDs -----------------
 def audio_to_phoneme_ids(
-    wav_16k: np.ndarray, top_k: int = 1
-) -> tuple[np.ndarray, np.ndarray, list[list[int]]]:
+    wav_16k: np.ndarray, top_k: int = 0
+) -> tuple[np.ndarray, np.ndarray, list[list[int]] | None]:
     """
-    Convert audio to phoneme IDs with top-k predictions.
+    Convert audio to phoneme IDs (top-k chỉ tính khi được yêu cầu).
 
     Args:
         wav_16k: float32, mono, 16kHz, [-1,1]
-        top_k: number of top predictions to return per timestep
+        top_k: number of top predictions to return per timestep (0 = không tính)
 
     Returns:
         best_ids: (T,) best predicted phoneme IDs
         log_probs: (T, V) log-probabilities over vocab
-        top_k_ids: list of lists, top-k IDs per timestep
+        top_k_ids: list of lists, top-k IDs per timestep (None khi top_k=0)
     """
-    logger.debug(f"audio_to_phoneme_ids: audio shape={wav_16k.shape}, top_k={top_k}")
+    logger.debug("audio_to_phoneme_ids: audio shape=%s, top_k=%d", wav_16k.shape, top_k)
+    log_probs = forward_log_probs(wav_16k)
+    best_ids = np.argmax(log_probs, axis=-1)
+    return best_ids, log_probs, (top_k_phoneme_ids(log_probs, top_k) if top_k > 0 else None)
+
+
+def forward_log_probs(wav_16k: np.ndarray) -> np.ndarray:
+    """log_probs (T, V) float32 của 1 utterance (NumPy, không copy qua torch)."""
+    if _is_long(wav_16k):
+        return forward_log_probs_long(wav_16k)
+    inputs = _processor(wav_16k, sampling_rate=16000, return_tensors="np")
     with torch.no_grad():
-        inputs = _processor(wav_16k, sampling_rate=16000, return_tensors="pt")
-        input_values = inputs.input_values.to(_device)
-        logits = _model(input_values).logits  # [1, T, V]
-        log_probs = F.log_softmax(logits, dim=-1)[0]  # [T, V]
-        best_ids = torch.argmax(log_probs, dim=-1)  # [T]
+        logits = torch.from_numpy(_backend.logits(inputs.input_values))  # [1, T, V]
+        return F.log_softmax(logits, dim=-1)[0].numpy()  # [T, V]
 
-        # top-k IDs cho từng timestep
-        _, top_k_ids_tensor = torch.topk(
-            log_probs, k=min(top_k, log_probs.size(-1)), dim=-1
-        )  # [T, top_k]
-        top_k_ids = top_k_ids_tensor.cpu().numpy().tolist()
 
-    return best_ids.cpu().numpy(), log_probs.cpu().numpy(), top_k_ids
+def top_k_phoneme_ids(log_probs: np.ndarray, k: int) -> list[list[int]]:
+    """top-k IDs cho từng timestep (giảm dần theo log-prob)."""
+    k = min(k, log_probs.shape[-1])
+    top = np.argpartition(-log_probs, k - 1, axis=-1)[:, :k]
+    order = np.argsort(-np.take_along_axis(log_probs, top, axis=-1), axis=-1)
+    return np.take_along_axis(top, order, axis=-1).tolist()
+
+
+def _is_long(wav: np.ndarray) -> bool:
+    return LONG_AUDIO_S > 0 and len(wav) > LONG_AUDIO_S * 16000
+
+
+def forward_log_probs_long(wav: np.ndarray) -> np.ndarray:
+    """log_probs (T, V) của 1 audio dài, forward theo cửa sổ chồng lấn."""
+    return chunked_log_probs(
+        wav,
+        _forward_log_probs_padded,
+        window_s=LONG_AUDIO_WINDOW_S,
+        context_s=LONG_AUDIO_CONTEXT_S,
+        batch_size=LONG_AUDIO_BATCH,
+    )
+
+
+def forward_log_probs_batch(wavs: list[np.ndarray]) -> list[np.ndarray]:
+    """
+    Chạy 1 forward cho nhiều utterance (pad + attention_mask). Utterance dài
+    hơn ALIGN_LONG_AUDIO_S chạy riêng theo cửa sổ (forward_log_probs_long).
+
+    Args:
+        wavs: list float32 mono 16kHz
+
+    Returns:
+        list log_probs (T_i, V), mỗi phần tử chỉ gồm frames của utterance đó
+    """
+    if not any(_is_long(w) for w in wavs):
+        return _forward_log_probs_padded(wavs)
+    outputs: list[np.ndarray | None] = [None] * len(wavs)
+    short = [i for i, w in enumerate(wavs) if not _is_long(w)]
+    for i, log_probs in zip(short, _forward_log_probs_padded([wavs[i] for i in short])):
+        outputs[i] = log_probs
+    for i, w in enumerate(wavs):
+        if outputs[i] is None:
+            outputs[i] = forward_log_probs_long(w)
+    return outputs
+
+
+def _forward_log_probs_padded(wavs: list[np.ndarray]) -> list[np.ndarray]:
+    if not wavs:
+        return []
+    logger.debug(
+        "forward_log_probs_batch: batch=%d, max_len=%d", len(wavs), max(len(w) for w in wavs)
+    )
+    with torch.no_grad():
+        inputs = _processor(
+            wavs,
+            sampling_rate=16000,
+            return_tensors="np",
+            padding=True,
+            return_attention_mask=True,
+        )
+        logits = _backend.logits(inputs.input_values, inputs.attention_mask)  # [B, T, V]
+        log_probs = F.log_softmax(torch.from_numpy(logits), dim=-1).numpy()
+        frame_lengths = feat_extract_output_lengths(
+            _model_config, inputs.attention_mask.sum(axis=-1)
+        ).tolist()
+    return [log_probs[i, : int(n)] for i, n in enumerate(frame_lengths)]
+
+
+class PhoneTable:
+    """
+    Bảng tra theo id vocab, dựng 1 lần từ tokenizer: phone IPA, dạng
+    normalize_espeak_token và simple-IPA của từng id. id blank / special /
+    word delimiter (và id ngoài vocab) có keep=False.
+    """
+
+    def __init__(self, tokenizer, vocab_size: int = 0):
+        vocab = tokenizer.get_vocab()
+        size = max(vocab_size, max(vocab.values(), default=-1) + 1)
+        phones = [""] * size
+        for tok, i in vocab.items():
+            phones[i] = tok.strip()
+        drop = set(tokenizer.all_special_ids)
+        drop.add(tokenizer.pad_token_id)
+        if getattr(tokenizer, "word_delimiter_token", None) in vocab:
+            drop.add(vocab[tokenizer.word_delimiter_token])
+        self.blank = tokenizer.pad_token_id
+        self.keep = np.array([bool(ph) and i not in drop for i, ph in enumerate(phones)])
+        self.phones = phones
+        self.normalized = [normalize_espeak_token(ph) for ph in phones]
+        self.simple = [simple_ipa(ph) for ph in self.normalized]
+
+
+_phone_table: PhoneTable | None = None
+
+
+def get_phone_table() -> PhoneTable:
+    """PhoneTable của model đang load (tạo lazy sau load_model)."""
+    global _phone_table
+    if _phone_table is None:
+        _phone_table = PhoneTable(_processor.tokenizer, _model_config.vocab_size)
+    return _phone_table
+
+
+def ctc_collapse(ids: np.ndarray) -> np.ndarray:
+    """CTC greedy: gộp id lặp liên tiếp rồi bỏ blank / special → id phoneme."""
+    ids = np.asarray(ids).reshape(-1)
+    if ids.size == 0:
+        return ids
+    first = np.empty(ids.size, dtype=bool)
+    first[0] = True
+    np.not_equal(ids[1:], ids[:-1], out=first[1:])
+    ids = ids[first]
+    return ids[get_phone_table().keep[ids]]
 
 
 def decode_ids_to_phones(ids: np.ndarray) -> tuple[list[str], str]:
-    """Decode phoneme IDs thành list IPA phoneme + raw text."""
-    tensor_ids = torch.from_numpy(ids).unsqueeze(0).long()
-    text = _processor.batch_decode(tensor_ids, skip_special_tokens=True)[0]
-    phones: list[str] = []
-    for p in text.split(" "):
-        p = p.strip()
-        if p:
-            phones.append(p)
-    return phones, text
+    """Decode phoneme IDs (theo frame) thành list IPA phoneme + raw text."""
+    phones = get_phone_table().phones
+    ph_list = [phones[i] for i in ctc_collapse(ids).tolist()]
+    return ph_list, " ".join(ph_list)
 
 
 # ----------------- Word → IPA (phonemizer) -----------------
+def normalize_words(text: str) -> list[str]:
+    return [w for w in re.sub(r'[^a-zA-Z\s]', ' ', text.lower()).split() if w]
+
+
+_IPA_CACHE_SIZE = int(os.getenv("PHONEMIZER_CACHE_SIZE", "20000"))
+
+
+class _IpaCache:
+    """
+    LRU cache IPA theo từ, key = (word, language, backend).
+    Giới hạn số entry; có đếm hit/miss.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max(0, max_size)
+        self._data: OrderedDict[tuple[str, str, str], tuple[str, ...]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple[str, str, str]) -> tuple[str, ...] | None:
+        with self._lock:
+            tokens = self._data.get(key)
+            if tokens is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return tokens
+
+    def put(self, key: tuple[str, str, str], tokens: tuple[str, ...]) -> None:
+        if self.max_size == 0:
+            return
+        with self._lock:
+            self._data[key] = tokens
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_ipa_cache = _IpaCache(_IPA_CACHE_SIZE)
+
+
+def ipa_cache_stats() -> dict:
+    return _ipa_cache.stats()
+
+
+def clear_ipa_cache() -> None:
+    _ipa_cache.clear()
+
+
+def lexicon_stats() -> dict | None:
+    return _lexicon.stats() if _lexicon is not None else None
+
+
+def model_stats() -> dict:
+    if _backend is None:
+        return {"path": MODEL_NAME, "backend": PHONEME_BACKEND, "loaded": False}
+    return {
+        "path": MODEL_NAME,
+        "device": str(_device),
+        "backend": _backend.name,
+        "precision": _backend.precision,
+        "requested_precision": PHONEME_PRECISION,
+        "weights_mib": round(_backend.nbytes() / 2**20, 1),
+    }
+
+
+def scoring_config() -> dict:
+    """Mọi thứ ngoài audio + words ảnh hưởng tới điểm (dùng trong key của result cache)."""
+    return {
+        "model": MODEL_NAME,
+        "backend": _backend.name if _backend is not None else PHONEME_BACKEND,
+        "precision": _backend.precision if _backend is not None else PHONEME_PRECISION,
+        "phonemizer": f"{_PHONEMIZER_BACKEND}/{_PHONEMIZER_LANGUAGE}",
+        "lexicon": _LEXICON_PATH,
+    }
+
+
+def _phonemize_words(words: list[str]) -> list[list[str]]:
+    """
+    Phonemizer/espeak → IPA tokens cho nhiều từ trong 1 lần gọi backend.
+    """
+    if not words:
+        return []
+    if _phonemizer is not None:
+        # 1 instance espeak dùng chung giữa các thread executor → serialize
+        with _phonemizer_lock:
+            ipa_strings = _phonemizer.phonemize(
+                words, separator=_PHONEMIZER_SEPARATOR, strip=True, njobs=1
+            )
+    else:
+        ipa_strings = phonemize(
+            words,
+            language=_PHONEMIZER_LANGUAGE,
+            backend=_PHONEMIZER_BACKEND,
+            strip=True,
+            preserve_punctuation=False,
+            with_stress=False,
+            separator=_PHONEMIZER_SEPARATOR,
+            njobs=1,
+        )
+    return [
+        [tok.strip() for tok in ipa_string.replace("|", " ").split() if tok.strip()]
+        for ipa_string in ipa_strings
+    ]
+
+
 def _phonemize_word(word: str) -> list[str]:
     """
     Phonemizer/espeak → IPA tokens cho 1 từ.
     """
     if not word:
         return []
-    ipa_string = phonemize(
-        word,
-        language=_PHONEMIZER_LANGUAGE,
-        backend=_PHONEMIZER_BACKEND,
-        strip=True,
-        preserve_punctuation=False,
-        with_stress=False,
-        separator=_PHONEMIZER_SEPARATOR,
-        njobs=1,
-    )
-    tokens = [tok.strip() for tok in ipa_string.replace("|", " ").split() if tok.strip()]
-    return tokens
+    return _phonemize_words([word])[0]
+
+
+def phonemize_words_cached(words: list[str]) -> list[list[str]]:
+    """
+    IPA tokens cho từng từ, qua LRU cache. Các từ miss được phonemize chung
+    trong 1 lần gọi backend.
+    """
+    found: dict[str, tuple[str, ...]] = {}
+    misses: list[str] = []
+    for word in dict.fromkeys(words):
+        tokens = _ipa_cache.get((word, _PHONEMIZER_LANGUAGE, _PHONEMIZER_BACKEND))
+        if tokens is None:
+            misses.append(word)
+        else:
+            found[word] = tokens
+
+    if misses:
+        try:
+            phonemized = _phonemize_words(misses)
+        except Exception as e:
+            logger.warning(f"phonemize_words_cached: phonemizer failed for {misses}: {e}")
+            raise
+        for word, tokens in zip(misses, phonemized):
+            if not tokens:
+                raise ValueError(
+                    f"words_to_ipa_direct: phonemizer returned empty IPA for '{word}'"
+                )
+            found[word] = tuple(tokens)
+            _ipa_cache.put((word, _PHONEMIZER_LANGUAGE, _PHONEMIZER_BACKEND), found[word])
+
+    return [list(found[word]) for word in words]
 
 
 def words_to_ipa_direct(
@@ -171,27 +637,29 @@ def words_to_ipa_direct(
         ph_ref_simple     : flat simple-IPA (grouped) cho PER
         ph_by_word_simple : simple-IPA per word
     """
-    logger.debug(f"words_to_ipa_direct (phonemizer): input words={words}")
-    phs_ipa: list[str] = []
-    per_word_ipa: list[list[str]] = []
-
-    for word in words:
-        ipa_tokens: list[str] = []
-        try:
-            ipa_tokens = _phonemize_word(word)
-        except Exception as e:
-            logger.warning(f"words_to_ipa_direct: phonemizer failed for '{word}': {e}")
-            raise
-        if not ipa_tokens:
-            raise ValueError(f"words_to_ipa_direct: phonemizer returned empty IPA for '{word}'")
-        per_word_ipa.append(ipa_tokens)
-        phs_ipa.extend(ipa_tokens)
-
-    ph_ref_simple = ipa_list_to_simple_seq_direct(phs_ipa)
-    ph_by_word_simple = [ipa_list_to_simple_seq_direct(seq) for seq in per_word_ipa]
+    logger.debug("words_to_ipa_direct (phonemizer): input words=%s", words)
+    per_word_ipa: list[list[str] | None] = [None] * len(words)
+    ph_by_word_simple: list[list[str] | None] = [None] * len(words)
+
+    # Lexicon trước, phonemizer chỉ cho từ ngoài lexicon
+    if _lexicon is not None:
+        for i, word in enumerate(words):
+            entry = _lexicon.lookup(word)
+            if entry is not None:
+                per_word_ipa[i], _, ph_by_word_simple[i] = entry
+
+    oov = [i for i, tokens in enumerate(per_word_ipa) if tokens is None]
+    if oov:
+        for i, tokens in zip(oov, phonemize_words_cached([words[i] for i in oov])):
+            per_word_ipa[i] = tokens
+            ph_by_word_simple[i] = ipa_list_to_simple_seq_direct(tokens)
+
+    phs_ipa: list[str] = [tok for tokens in per_word_ipa for tok in tokens]
+    # simple-IPA map từng token → flat = nối các từ
+    ph_ref_simple = [ph for seq in ph_by_word_simple for ph in seq]
 
     logger.debug(
-        f"words_to_ipa_direct: total IPA phonemes={len(phs_ipa)}, per_word={per_word_ipa}"
+        "words_to_ipa_direct: total IPA phonemes=%d, per_word=%s", len(phs_ipa), per_word_ipa
     )
     return phs_ipa, per_word_ipa, ph_ref_simple, ph_by_word_simple
 
@@ -254,6 +722,16 @@ def _simple_ipa_char(ch: str) -> str:
     return ch[0]
 
 
+def simple_ipa(ph_norm: str) -> str:
+    """1 phoneme đã normalize → simple-IPA ("" nếu rỗng)."""
+    if not ph_norm:
+        return ""
+    # Giữ nguyên phoneme dài (có ː) trong simple-IPA
+    if len(ph_norm) > 1 and ph_norm[1] == 'ː':
+        return ph_norm[:2]  # Giữ nguyên 'iː', 'uː', etc.
+    return _simple_ipa_char(ph_norm[0])
+
+
 def ipa_list_to_simple_seq_direct(ph_ipa_list: list[str]) -> list[str]:
     """
     IPA list → simple-IPA (lấy char "nhóm" đầu tiên sau normalize).
@@ -263,44 +741,46 @@ def ipa_list_to_simple_seq_direct(ph_ipa_list: list[str]) -> list[str]:
     for ph in ph_ipa_list:
         if not ph:
             continue
-        ph_norm = normalize_espeak_token(ph)
-        if not ph_norm:
-            continue
-        # Giữ nguyên phoneme dài (có ː) trong simple-IPA
-        if len(ph_norm) > 1 and ph_norm[1] == 'ː':
-            simple.append(ph_norm[:2])  # Giữ nguyên 'iː', 'uː', etc.
-        else:
-            ch = ph_norm[0]
-            if ch:
-                simple.append(_simple_ipa_char(ch))
+        ch = simple_ipa(normalize_espeak_token(ph))
+        if ch:
+            simple.append(ch)
     return simple
 
 
+def ids_to_simple_seq(phone_ids: np.ndarray) -> list[str]:
+    """id phoneme (sau ctc_collapse) → simple-IPA qua PhoneTable (không normalize lại chuỗi)."""
+    simple = get_phone_table().simple
+    return [ch for ch in (simple[i] for i in phone_ids.tolist()) if ch]
+
+
 def ipa_list_to_simple_seq(ph_pred_list: list[str]) -> list[str]:
     """
-    IPA list từ model → simple-IPA sequence (log chi tiết nếu normalize làm rỗng).
+    IPA list từ model → simple-IPA sequence (log chi tiết ở DEBUG).
     """
+    debug = logger.isEnabledFor(logging.DEBUG)
     simple: list[str] = []
     for idx, s in enumerate(ph_pred_list):
         if not s:
             continue
         s_norm = normalize_espeak_token(s)
         if not s_norm:
-            logger.debug(
-                f"ipa_list_to_simple_seq: [{idx}] '{s}' normalized to empty, skipping"
-            )
+            if debug:
+                logger.debug(
+                    f"ipa_list_to_simple_seq: [{idx}] '{s}' normalized to empty, skipping"
+                )
             continue
         # Giữ nguyên phoneme dài (có ː) trong simple-IPA
         if len(s_norm) > 1 and s_norm[1] == 'ː':
             simple.append(s_norm[:2])  # Giữ nguyên 'iː', 'uː', etc.
-            logger.debug(
-                f"ipa_list_to_simple_seq: [{idx}] '{s}' -> '{s_norm}' (long vowel, kept as '{s_norm[:2]}')"
-            )
+            if debug:
+                logger.debug(
+                    f"ipa_list_to_simple_seq: [{idx}] '{s}' -> '{s_norm}' (long vowel, kept as '{s_norm[:2]}')"
+                )
         else:
             ch_original = s_norm[0]
             if ch_original:
                 ch_grouped = _simple_ipa_char(ch_original)
-                if s != s_norm or ch_original != ch_grouped:
+                if debug and (s != s_norm or ch_original != ch_grouped):
                     logger.debug(
                         f"ipa_list_to_simple_seq: [{idx}] '{s}' -> '{s_norm}' "
                         f"-> '{ch_original}' -> grouped '{ch_grouped}'"
@@ -393,63 +873,77 @@ def phoneme_sub_cost(a: str, b: str) -> float:
     
     # Check CONFUSABLE với base characters
     if (a_base, b_base) in CONFUSABLE:
-        logger.debug(f"phoneme_sub_cost: '{a}' -> '{b}' (confusable: cost=0.5)")
+        logger.debug("phoneme_sub_cost: '%s' -> '%s' (confusable: cost=0.5)", a, b)
         return 0.5  # phát âm gần giống → phạt nửa lỗi
-    logger.debug(f"phoneme_sub_cost: '{a}' -> '{b}' (not confusable: cost=1.0)")
+    logger.debug("phoneme_sub_cost: '%s' -> '%s' (not confusable: cost=1.0)", a, b)
     return 1.0  # khác hẳn
 
 
+# Phoneme → int id (theo dạng normalize) + ma trận chi phí từ CONFUSABLE
+_inventory = PhonemeInventory(normalize_ipa_phoneme, CONFUSABLE)
+
+
+def encode_phonemes(seq: list[str]) -> np.ndarray:
+    """list phoneme → int32 id trong _inventory."""
+    return _inventory.encode(seq)
+
+
 def edit_distance_weighted(a: list[str], b: list[str]) -> float:
     """
     Weighted edit distance:
       insert = 1.0
       delete = 1.0
-      substitute = 0.0 / 0.5 / 1.0
-    """
-    m, n = len(a), len(b)
-    dp = [[0.0] * (n + 1) for _ in range(m + 1)]
-
-    for i in range(1, m + 1):
-        dp[i][0] = dp[i - 1][0] + 1.0
-    for j in range(1, n + 1):
-        dp[0][j] = dp[0][j - 1] + 1.0
-
-    for i in range(1, m + 1):
-        for j in range(1, n + 1):
-            dp[i][j] = min(
-                dp[i - 1][j] + 1.0,  # delete
-                dp[i][j - 1] + 1.0,  # insert
-                dp[i - 1][j - 1] + phoneme_sub_cost(a[i - 1], b[j - 1]),  # sub
-            )
-    return dp[m][n]
+      substitute = 0.0 / 0.5 / 1.0 (phoneme_sub_cost)
+    Tính trên id int + ma trận chi phí (alignment.edit_distance_ids).
+    """
+    a_ids = _inventory.encode(a)
+    b_ids = _inventory.encode(b)
+    return edit_distance_ids(a_ids, b_ids, _inventory.costs) / COST_SCALE
 
 
 def sequence_per(ref_simple: list[str], pred_simple: list[str]) -> float:
     """
-    Tính PER trên simple-IPA với sliding window (tránh phạt padding ở cuối).
+    Tính PER trên simple-IPA. Pred dài hơn ref → so với đoạn khớp nhất trong
+    pred (semi-global, tránh phạt padding ở 2 đầu).
     """
     if not ref_simple:
         return 1.0 if pred_simple else 0.0
 
-    Lr = len(ref_simple)
-    Lp = len(pred_simple)
+    ed = substring_distances_ids(
+        [_inventory.encode(ref_simple)], _inventory.encode(pred_simple), _inventory.costs
+    )[0]
+    return ed / COST_SCALE / max(1, len(ref_simple))
+
+# ----------------- Word coverage & alignment flags -----------------
+def _coverage_threshold(n_phonemes: int) -> float:
+    # cho từ ngắn (<=3 phoneme) → cho phép sai 1 phoneme
+    if n_phonemes <= 3:
+        return 1.0
+    return n_phonemes * 0.4
 
-    # pred ngắn hơn/equal → so trực tiếp
-    if Lp <= Lr:
-        ed = edit_distance_weighted(ref_simple, pred_simple)
-        return ed / max(1, Lr)
 
-    # pred dài hơn → sliding window
-    min_ed = math.inf
-    for i in range(0, Lp - Lr + 1):
-        window = pred_simple[i : i + Lr]
-        ed = edit_distance_weighted(ref_simple, window)
-        if ed < min_ed:
-            min_ed = ed
+def words_covered(
+    ph_by_word_simple: list[list[str]], pred_simple_seq: list[str]
+) -> list[bool]:
+    """
+    word_covered cho tất cả các từ trong 1 lần DP batch (simple-IPA).
+    """
+    refs = [[ph for ph in seq if ph] for seq in ph_by_word_simple]
+    non_empty = [i for i, ref in enumerate(refs) if ref]
+    flags = [False] * len(refs)
+    if not non_empty:
+        return flags
+
+    distances = substring_distances_ids(
+        [_inventory.encode(refs[i]) for i in non_empty],
+        _inventory.encode(pred_simple_seq),
+        _inventory.costs,
+    )
+    for i, ed in zip(non_empty, distances):
+        flags[i] = ed / COST_SCALE <= _coverage_threshold(len(refs[i]))
+    return flags
 
-    return min_ed / max(1, Lr)
 
-# ----------------- Word coverage & alignment flags -----------------
 def word_covered(
     ph_seq_word: list[str],
     pred_simple_seq: list[str],
@@ -468,24 +962,39 @@ def word_covered(
     if phoneme_format == "ipa":
         ref_simple = ipa_list_to_simple_seq_direct(ph_seq_word)
     else:  # "simple" hoặc default
-        ref_simple = [ph for ph in ph_seq_word if ph]
-
-    if not ref_simple:
-        return False
+        ref_simple = ph_seq_word
 
-    min_ed = math.inf
-    for i in range(0, max(1, len(pred_simple_seq) - len(ref_simple) + 1)):
-        window = pred_simple_seq[i : i + len(ref_simple)]
-        ed = edit_distance_weighted(ref_simple, window)
-        min_ed = min(min_ed, ed)
+    return words_covered([ref_simple], pred_simple_seq)[0]
 
-    # cho từ ngắn (<=3 phoneme) → cho phép sai 1 phoneme
-    if len(ref_simple) <= 3:    
-        threshold = 1.0
-    else:
-        threshold = len(ref_simple) * 0.4
 
-    return min_ed <= threshold
+def align_phonemes(ref_simple: list[str], pred_simple: list[str]) -> dict:
+    """
+    Align ref_simple với pred_simple (simple-IPA) 1 lần, trả về:
+        per        : Phoneme Error Rate (giống sequence_per)
+        flags      : list[bool] match / not cho từng phoneme ref
+        ops        : list[str] "match" | "confusable" | "substitution" | "deletion"
+        matched    : list[str | None] phoneme pred được ghép với từng phoneme ref
+        credit     : list[float] 1.0 / 0.5 / 0.0 (confusable được nửa điểm)
+    """
+    if not ref_simple:
+        return {
+            "per": 1.0 if pred_simple else 0.0,
+            "flags": [],
+            "ops": [],
+            "matched": [],
+            "credit": [],
+        }
+    aligned = align_ids(
+        _inventory.encode(ref_simple), _inventory.encode(pred_simple), _inventory.costs
+    )
+    ops = aligned["ops"]
+    return {
+        "per": aligned["distance"] / COST_SCALE / len(ref_simple),
+        "flags": (ops == OP_MATCH).tolist(),
+        "ops": [OP_NAMES[op] for op in ops],
+        "matched": [pred_simple[k] if k >= 0 else None for k in aligned["pred_index"]],
+        "credit": aligned["credit"].tolist(),
+    }
 
 
 def compute_phoneme_match_flags(
@@ -494,24 +1003,7 @@ def compute_phoneme_match_flags(
     """
     Align ref_simple với pred_simple (simple-IPA) và trả về list[bool] match / not.
     """
-    if not ref_simple:
-        return []
-    matcher = difflib.SequenceMatcher(a=ref_simple, b=pred_simple or [])
-    flags: list[bool] = []
-    for tag, i1, i2, _, _ in matcher.get_opcodes():
-        length = i2 - i1
-        if length <= 0:
-            continue
-        if tag == "equal":
-            flags.extend([True] * length)
-        else:
-            flags.extend([False] * length)
-
-    if len(flags) < len(ref_simple):
-        flags.extend([False] * (len(ref_simple) - len(flags)))
-    elif len(flags) > len(ref_simple):
-        flags = flags[: len(ref_simple)]
-    return flags
+    return align_phonemes(ref_simple, pred_simple)["flags"]
 
 
 def split_flags_by_lengths(
@@ -530,151 +1022,63 @@ def split_flags_by_lengths(
         idx += length
     return result
 
-# ----------------- Fluency metrics -----------------
-def calculate_fluency(
+# ----------------- Forced alignment (thời gian từ / phoneme) -----------------
+_token_mapper: TokenMapper | None = None
+
+
+def get_token_mapper() -> TokenMapper:
+    """Map phoneme espeak → id vocab của model (tạo lazy sau load_model)."""
+    global _token_mapper
+    if _token_mapper is None:
+        _token_mapper = TokenMapper(_processor.tokenizer.get_vocab(), normalize_espeak_token)
+    return _token_mapper
+
+
+# ----------------- Main API -----------------
+def assess_pronunciation(
     wav_16k: np.ndarray,
     words_ref: list[str],
-    ph_pred_list: list[str],
-    ref_phonemes_per_word: list[list[str]] | None = None,
+    log_probs: np.ndarray | None = None,
+    diagnostics: bool = False,
 ) -> dict:
     """
-    Tính độ trôi chảy (fluency) dựa trên:
-      - Speech rate (từ/giây)
-      - Pause ratio
+    log_probs: (T, V) đã tính sẵn (vd. từ batch forward); None → tự chạy model.
+    Kết quả có "timings": {stage: giây} cho metrics (xem metrics.py), và
+    "trace" (chuỗi trung gian, xem diagnostics.py) khi diagnostics=True.
     """
-    audio_duration = len(wav_16k) / 16000.0
-    if audio_duration <= 0:
-        return {
-            "fluency_score": 0.0,
-            "speech_rate": 0.0,
-            "pause_ratio": 1.0,
-        }
-
-    # Speech rate
-    num_words = len(words_ref)
-    speech_rate = num_words / audio_duration if audio_duration > 0 else 0.0
-
-    ideal_min, ideal_max = 2.0, 4.0
-    acceptable_min, acceptable_max = 0.7, 5.5
-
-    if ideal_min <= speech_rate <= ideal_max:
-        speech_rate_score = 1.0
-    elif acceptable_min <= speech_rate < ideal_min:
-        speech_rate_score = 0.7 + (
-            (speech_rate - acceptable_min) / (ideal_min - acceptable_min)
-        ) * 0.3
-    elif ideal_max < speech_rate <= acceptable_max:
-        speech_rate_score = 1.0 - (
-            (speech_rate - ideal_max) / (acceptable_max - ideal_max)
-        ) * 0.3
-    else:
-        if speech_rate < acceptable_min:
-            speech_rate_score = max(0.3, 0.7 * (speech_rate / acceptable_min))
-        else:
-            speech_rate_score = max(
-                0.3, 0.7 * (1.0 - (speech_rate - acceptable_max) / acceptable_max)
-            )
-
-    # Pause ratio (RMS energy)
-    frame_size = 1600  # 100ms
-    num_frames = len(wav_16k) // frame_size
-    if num_frames > 0:
-        energies: list[float] = []
-        for i in range(num_frames):
-            frame = wav_16k[i * frame_size : (i + 1) * frame_size]
-            rms = np.sqrt(np.mean(frame ** 2))
-            energies.append(rms)
-
-        if energies:
-            energy_threshold = np.percentile(energies, 20)  # 20% thấp nhất = pause
-            pause_frames = sum(1 for e in energies if e < energy_threshold)
-            pause_ratio = pause_frames / len(energies) if len(energies) > 0 else 0.0
-        else:
-            pause_ratio = 0.0
-    else:
-        pause_ratio = 0.0
-
-    ideal_min, ideal_max = 0.05, 0.35
-    acceptable_min, acceptable_max = 0.02, 0.50
-
-    if ideal_min <= pause_ratio <= ideal_max:
-        pause_score = 1.0
-    elif acceptable_min <= pause_ratio < ideal_min:
-        pause_score = 0.8 + (
-            (pause_ratio - acceptable_min) / (ideal_min - acceptable_min)
-        ) * 0.2
-    elif ideal_max < pause_ratio <= acceptable_max:
-        pause_score = 1.0 - (
-            (pause_ratio - ideal_max) / (acceptable_max - ideal_max)
-        ) * 0.3
-    else:
-        if pause_ratio < acceptable_min:
-            pause_score = max(0.4, 0.8 * (pause_ratio / acceptable_min))
-        else:
-            pause_score = max(
-                0.4, 0.7 * (1.0 - (pause_ratio - acceptable_max) / 0.3)
-            )
-
-    # Fluency chỉ dựa trên speech rate + pause ratio
-    fluency_score = (speech_rate_score * 0.5 + pause_score * 0.5) * 100.0
+    timings: dict[str, float] = {}
+    t_stage = time.perf_counter()
 
-    return {
-        "fluency_score": fluency_score,
-        "speech_rate": speech_rate,
-        "pause_ratio": pause_ratio,
-    }
-
-# ----------------- Main API -----------------
-def assess_pronunciation(wav_16k: np.ndarray, words_ref: list[str]) -> dict:
-    logger.info("=" * 60)
-    logger.info("Starting pronunciation assessment")
-    logger.info(
-        f"  Input: {len(words_ref)} words, "
-        f"audio duration={len(wav_16k)/16000:.2f}s, shape={wav_16k.shape}"
-    )
-    logger.info(f"  Words: {words_ref}")
+    def lap(stage: str) -> None:
+        nonlocal t_stage
+        now = time.perf_counter()
+        timings[stage] = now - t_stage
+        t_stage = now
 
     # Step 1: Word → IPA (phonemizer)
-    logger.info("-" * 60)
-    logger.info("Step 1: Converting words to reference phonemes")
     ph_ref_ipa, per_word_ipa, ph_ref_simple_from_words, ph_by_word_simple = (
         words_to_ipa_direct(words_ref)
     )
-    logger.info(
-        f"  → Reference IPA phonemes ({len(ph_ref_ipa)}): "
-        f"{ph_ref_ipa[:30]}{'...' if len(ph_ref_ipa) > 30 else ''}"
-    )
+    lap("phonemize")
 
     ref_simple = ph_ref_simple_from_words
     if not ref_simple and ph_ref_ipa:
         ref_simple = ipa_list_to_simple_seq_direct(ph_ref_ipa)
 
-    # Step 2: Audio → phoneme IDs → IPA
-    logger.info("-" * 60)
-    logger.info("Step 2: Decoding audio to IPA phonemes (Wav2Vec2)")
-    ids, _, top_k_ids = audio_to_phoneme_ids(wav_16k, top_k=3)
+    # Step 2: Audio → phoneme IDs → IPA (CTC greedy trên mảng id, tra PhoneTable)
+    if log_probs is None:
+        log_probs = forward_log_probs(wav_16k)
+        lap("forward")
 
-    ph_pred_list, ph_pred_text = decode_ids_to_phones(ids)
-    logger.info(
-        f"  → Predicted IPA phonemes ({len(ph_pred_list)}): "
-        f"{ph_pred_list[:30]}{'...' if len(ph_pred_list) > 30 else ''}"
-    )
-    logger.debug(
-        f"  → Predicted text: '{ph_pred_text[:200]}{'...' if len(ph_pred_text) > 200 else ''}'"
-    )
-    
-    # Step 3: Normalize predicted IPA phonemes
-    logger.info("-" * 60)
-    logger.info("Step 3: Normalizing predicted IPA phonemes")
-    ph_pred_normalized = [normalize_espeak_token(ph) for ph in ph_pred_list if ph]
-    ph_pred_normalized = [ph for ph in ph_pred_normalized if ph]  # Bỏ các phoneme rỗng sau normalize
-    logger.info(
-        f"  → Normalized IPA phonemes ({len(ph_pred_normalized)}): "
-        f"{ph_pred_normalized[:30]}{'...' if len(ph_pred_normalized) > 30 else ''}"
-    )
-    
-    # Convert sang simple-IPA
-    pred_simple = ipa_list_to_simple_seq(ph_pred_list)
+    table = get_phone_table()
+    phone_ids = ctc_collapse(np.argmax(log_probs, axis=-1))
+    ph_pred_list = [table.phones[i] for i in phone_ids.tolist()]
+    ph_pred_text = " ".join(ph_pred_list)
+    lap("decode")
+
+    # Step 3: Predicted phoneme → simple-IPA (bảng dựng sẵn từ vocab)
+    pred_simple = ids_to_simple_seq(phone_ids)
+    lap("normalize")
 
     # Phoneme correctness cho UI (dùng simple-IPA per word)
     flat_simple_ref: list[str] = []
@@ -683,58 +1087,81 @@ def assess_pronunciation(wav_16k: np.ndarray, words_ref: list[str]) -> dict:
         lengths.append(len(seq))
         flat_simple_ref.extend(seq)
 
-    phoneme_match_flags_flat = compute_phoneme_match_flags(
-        flat_simple_ref, pred_simple
-    )
-    phoneme_correctness_by_word = split_flags_by_lengths(
-        phoneme_match_flags_flat, lengths
-    )
-
-    # Step 4: PER / Accuracy
-    logger.info("-" * 60)
-    logger.info("Step 4: Calculating phoneme accuracy (PER)")
-    logger.info(f"  → Reference simple-IPA ({len(ref_simple)}): {ref_simple}")
-    logger.info(f"  → Predicted simple-IPA ({len(pred_simple)}): {pred_simple}")
-    per = sequence_per(ref_simple, pred_simple)
+    # Step 4: PER / Accuracy + per-phoneme flags (1 lần align, có backtrace)
+    aligned = align_phonemes(flat_simple_ref, pred_simple)
+    phoneme_correctness_by_word = split_flags_by_lengths(aligned["flags"], lengths)
+    phoneme_ops_by_word = split_flags_by_lengths(aligned["ops"], lengths)
+    phoneme_matched_by_word = split_flags_by_lengths(aligned["matched"], lengths)
+    phoneme_credit_by_word = split_flags_by_lengths(aligned["credit"], lengths)
+    per = aligned["per"]
+    lap("per")
     accuracy_ph = (1 - per) * 100.0
-    logger.info(f"  → Phoneme Error Rate (PER): {per:.3f}")
-    logger.info(f"  → Phoneme Accuracy: {accuracy_ph:.1f}%")
 
     # Step 5: Completeness (dựa trên simple-IPA per word)
-    logger.info("-" * 60)
-    logger.info("Step 5: Calculating word completeness")
-    covered = 0
-    total = len(ph_by_word_simple)
-    for word_idx, seq in enumerate(ph_by_word_simple):
-        is_covered = word_covered(seq, pred_simple, phoneme_format="simple")
-        if is_covered:
-            covered += 1
-        logger.debug(
-            f"  Word '{words_ref[word_idx] if word_idx < len(words_ref) else '?'}': "
-            f"{'✅ covered' if is_covered else '❌ not covered'}"
-        )
+    word_covered_flags = words_covered(ph_by_word_simple, pred_simple)
+    lap("coverage")
+    covered = sum(word_covered_flags)
+    completeness = 100.0 * covered / max(1, len(ph_by_word_simple))
 
-    completeness = 100.0 * covered / max(1, total)
-    logger.info(
-        f"  → Completeness: {completeness:.1f}% ({covered}/{total} words covered)"
+    # Step 6: Fluency
+    fluency_metrics = calculate_fluency(
+        wav_16k,
+        words_ref,
+        ph_pred_list,
+        per_word_ipa,
+        log_probs=log_probs,
+        blank_id=_processor.tokenizer.pad_token_id,
     )
+    lap("fluency")
+
+    # Step 7: Forced alignment reference trên log_probs sẵn có → start/end thật
+    times = None
+    if FORCED_ALIGNMENT:
+        times = align_words(
+            log_probs,
+            per_word_ipa,
+            get_token_mapper(),
+            blank=_processor.tokenizer.pad_token_id,
+            duration_ms=1000.0 * len(wav_16k) / 16000,
+        )
+        lap("forced_align")
 
-    # Step 6: Fluency
-    logger.info("-" * 60)
-    logger.info("Step 6: Calculating fluency metrics")
-    fluency_metrics = calculate_fluency(wav_16k, words_ref, ph_pred_list, per_word_ipa)
-    logger.info(
-        f"  → Speech rate: {fluency_metrics['speech_rate']:.2f} words/second"
+    # Step 8: GOP từng phoneme trên các đoạn đã align (điểm liên tục 0..100)
+    gop_by_word = None
+    if times is not None:
+        gop_by_word = phoneme_scores(log_probs, times, blank=_processor.tokenizer.pad_token_id)
+        lap("gop")
+    logger.debug(
+        "assess_pronunciation: %d words, %.2fs audio, per=%.3f completeness=%.1f fluency=%.1f",
+        len(words_ref),
+        len(wav_16k) / 16000,
+        per,
+        completeness,
+        fluency_metrics["fluency_score"],
     )
-    logger.info(f"  → Pause ratio: {fluency_metrics['pause_ratio']:.2%}")
-    logger.info(f"  → Fluency score: {fluency_metrics['fluency_score']:.1f}%")
 
-    logger.info("=" * 60)
-    logger.info("Assessment Summary:")
-    logger.info(f"  Accuracy:    {accuracy_ph:.1f}%")
-    logger.info(f"  Completeness: {completeness:.1f}%")
-    logger.info(f"  Fluency:     {fluency_metrics['fluency_score']:.1f}%")
-    logger.info("=" * 60)
+    trace = None
+    if diagnostics:
+        # Chuỗi trung gian cho diagnostics.py (chỉ khi request bật trace)
+        trace = {
+            "words": words_ref,
+            "audioS": round(len(wav_16k) / 16000, 3),
+            "refIpa": ph_ref_ipa,
+            "refIpaByWord": per_word_ipa,
+            "refSimple": ref_simple,
+            "refSimpleByWord": ph_by_word_simple,
+            "predIpa": ph_pred_list,
+            "predText": ph_pred_text,
+            "predNormalized": [t for t in (table.normalized[i] for i in phone_ids.tolist()) if t],
+            "predSimple": pred_simple,
+            "per": per,
+            "ops": phoneme_ops_by_word,
+            "matched": phoneme_matched_by_word,
+            "wordCovered": word_covered_flags,
+            "fluency": fluency_metrics,
+            "alignment": {k: times[k] for k in ("words", "phonemes")} if times else None,
+            "gop": gop_by_word,
+        }
 
     return {
         "accuracy_ph": accuracy_ph,
@@ -742,14 +1169,28 @@ def assess_pronunciation(wav_16k: np.ndarray, words_ref: list[str]) -> dict:
         "fluency": fluency_metrics["fluency_score"],
         "speech_rate": fluency_metrics["speech_rate"],
         "pause_ratio": fluency_metrics["pause_ratio"],
+        "articulation_rate": fluency_metrics["articulation_rate"],
+        "phone_rate": fluency_metrics["phone_rate"],
+        "pause_count": fluency_metrics["pause_count"],
+        "mean_pause_s": fluency_metrics["mean_pause_s"],
+        "max_pause_s": fluency_metrics["max_pause_s"],
         "ph_ref_flat": ph_ref_simple_from_words,
         "ph_by_word_simple": ph_by_word_simple,
         "ph_by_word_arpa": [],  # Empty list since G2P is removed
         "phoneme_correctness": phoneme_correctness_by_word,
+        "phoneme_ops": phoneme_ops_by_word,
+        "phoneme_matched": phoneme_matched_by_word,
+        "phoneme_credit": phoneme_credit_by_word,
+        "word_covered": word_covered_flags,
         "per_word_ipa": per_word_ipa,
         "ph_by_word_ipa": per_word_ipa,
         "ph_ref_ipa": ph_ref_ipa,
         "ph_pred_list": ph_pred_list,
         "ph_pred_text": ph_pred_text,
         "per": per,
+        "word_times": times["words"] if times else None,
+        "phoneme_times": times["phonemes"] if times else None,
+        "phoneme_gop": gop_by_word,
+        "timings": timings,
+        "trace": trace,
     }
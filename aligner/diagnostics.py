@@ -0,0 +1,86 @@
+"""
+Diagnostic trace theo request: các chuỗi trung gian của assess_pronunciation
+(IPA reference / predicted, simple-IPA, ops, coverage, fluency, timing) gom
+vào 1 dict thay cho log INFO từng phoneme.
+
+Mặc định tắt: đường chấm điểm bình thường không format chuỗi nào. Bật theo
+request hoặc theo tỉ lệ lấy mẫu:
+  - header  X-Align-Diagnostics: response | log
+  - form    diagnostics=response | log   (/align; WebSocket: field trong config)
+  - ALIGN_DIAGNOSTICS_SAMPLE_RATE (0..1, mặc định 0): request không yêu cầu gì
+    vẫn được trace ở mode "log" với xác suất này
+
+Mode:
+  response : trace trả về trong response, key "diagnostics"
+  log      : ghi 1 dòng JSON (ALIGN_DIAGNOSTICS_FILE nếu có, không thì logger
+             "diagnostics" ở INFO)
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+MODES = ("response", "log")
+HEADER = "X-Align-Diagnostics"
+
+SAMPLE_RATE = float(os.getenv("ALIGN_DIAGNOSTICS_SAMPLE_RATE", "0"))
+TRACE_FILE = os.getenv("ALIGN_DIAGNOSTICS_FILE", "").strip() or None
+
+_write_lock = threading.Lock()
+
+
+def resolve_mode(*requested: str | None) -> str | None:
+    """
+    Mode cho 1 request: giá trị hợp lệ đầu tiên trong requested (header, form
+    field, ...), không có thì lấy mẫu theo ALIGN_DIAGNOSTICS_SAMPLE_RATE.
+    """
+    for value in requested:
+        if value:
+            value = str(value).strip().lower()
+            if value in MODES:
+                return value
+            if value in ("1", "true", "on"):
+                return "response"
+    if SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+        return "log"
+    return None
+
+
+def new_trace(**fields) -> dict:
+    return {"traceId": uuid.uuid4().hex, "time": time.time(), **fields}
+
+
+def _to_json(value):
+    # numpy scalar / array (np.bool_, np.float32, ...) trong các chuỗi trung gian
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+def to_json(trace: dict) -> str:
+    return json.dumps(trace, ensure_ascii=False, default=_to_json)
+
+
+def write_trace(trace: dict) -> None:
+    """1 trace = 1 dòng JSON."""
+    line = to_json(trace)
+    if TRACE_FILE is None:
+        logger.info(line)
+        return
+    with _write_lock, open(TRACE_FILE, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def emit(mode: str | None, trace: dict, response: dict) -> dict:
+    """Gắn trace vào response (mode "response") hoặc ghi ra log; trả response."""
+    if mode == "response":
+        response["diagnostics"] = json.loads(to_json(trace))
+    elif mode == "log":
+        write_trace(trace)
+    return response
@@ -0,0 +1,208 @@
+"""
+Executor riêng cho các stage CPU-bound (decode audio, phonemizer, forward, DP).
+
+Event loop của uvicorn chỉ nhận upload / trả response; phần nặng được đẩy
+sang thread pool hoặc process pool. Số luồng intra-op của torch được chia
+theo số worker để N request đồng thời × intra-op threads <= số core.
+
+Cấu hình (env):
+  ALIGN_EXECUTOR          : "thread" (mặc định) | "process"
+  ALIGN_EXECUTOR_WORKERS  : số worker (mặc định min(2, số core))
+  ALIGN_INTRA_OP_THREADS  : override torch.set_num_threads mỗi worker
+  ALIGN_INTEROP_THREADS   : torch.set_num_interop_threads (mặc định 1)
+"""
+
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import torch
+
+from metrics import QUEUE_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_KIND = os.getenv("ALIGN_EXECUTOR", "thread").strip().lower()
+EXECUTOR_WORKERS = int(os.getenv("ALIGN_EXECUTOR_WORKERS", "0"))
+INTRA_OP_THREADS = int(os.getenv("ALIGN_INTRA_OP_THREADS", "0"))
+INTEROP_THREADS = int(os.getenv("ALIGN_INTEROP_THREADS", "1"))
+
+
+def available_cpus() -> int:
+    """Số core thực sự được dùng (affinity + cgroup quota của container)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    try:
+        # cgroup v2: "max 100000" hoặc "200000 100000"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            q, period = f.read().split()[:2]
+            if q != "max":
+                quota = int(q) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                q = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if q > 0:
+                quota = q / period
+        except (OSError, ValueError):
+            pass
+
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+
+def configure_torch_threads(intra_op: int, interop: int = INTEROP_THREADS) -> None:
+    torch.set_num_threads(max(1, intra_op))
+    try:
+        torch.set_num_interop_threads(max(1, interop))
+    except RuntimeError:
+        # Chỉ set được trước khi torch chạy parallel work đầu tiên
+        logger.debug("configure_torch_threads: interop threads already fixed")
+
+
+def _init_process_worker(intra_op: int, interop: int) -> None:
+    configure_torch_threads(intra_op, interop)
+
+
+def _timed_call(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+class InferenceExecutor:
+    """
+    Thread/process pool cho các stage CPU-bound, có thống kê queue depth và
+    mức sử dụng worker.
+    """
+
+    def __init__(
+        self,
+        kind: str = EXECUTOR_KIND,
+        workers: int = EXECUTOR_WORKERS,
+        intra_op_threads: int = INTRA_OP_THREADS,
+        interop_threads: int = INTEROP_THREADS,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"ALIGN_EXECUTOR must be 'thread' or 'process', got '{kind}'")
+        cpus = available_cpus()
+        self.kind = kind
+        self.cpus = cpus
+        self.workers = workers if workers > 0 else min(2, cpus)
+        self.intra_op_threads = (
+            intra_op_threads if intra_op_threads > 0 else max(1, cpus // self.workers)
+        )
+        self.interop_threads = max(1, interop_threads)
+        if self.workers * self.intra_op_threads > cpus:
+            logger.warning(
+                "InferenceExecutor: %d workers × %d intra-op threads > %d cores",
+                self.workers,
+                self.intra_op_threads,
+                cpus,
+            )
+
+        if kind == "thread":
+            # torch threads là global trong process → N worker dùng chung cấu hình
+            configure_torch_threads(self.intra_op_threads, self.interop_threads)
+
+        # Pool tạo lazy ở lần submit đầu, trong đúng process dùng nó: serve.py
+        # import main (tạo executor) trong master rồi mới fork worker; queue /
+        # wakeup pipe của ProcessPoolExecutor tạo trước fork sẽ bị các worker
+        # dùng chung → job / kết quả lẫn giữa các worker.
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._started_at = time.perf_counter()
+        self._submitted = 0
+        self._finished = 0
+        self._failed = 0
+        self._busy_s = 0.0
+        logger.info(
+            "InferenceExecutor: kind=%s workers=%d intra_op=%d interop=%d cpus=%d",
+            self.kind,
+            self.workers,
+            self.intra_op_threads,
+            self.interop_threads,
+            cpus,
+        )
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                if self.kind == "thread":
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="align-infer"
+                    )
+                else:
+                    # fork: worker kế thừa model đã load ở process cha
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("fork"),
+                        initializer=_init_process_worker,
+                        initargs=(self.intra_op_threads, self.interop_threads),
+                    )
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    async def run(self, fn, *args):
+        """Chạy fn(*args) trên pool, await kết quả mà không block event loop."""
+        with self._lock:
+            self._submitted += 1
+        started = time.perf_counter()
+        try:
+            elapsed, result = await asyncio.wrap_future(
+                self._get_pool().submit(_timed_call, fn, *args)
+            )
+        except BaseException:
+            with self._lock:
+                self._finished += 1
+                self._failed += 1
+                self._busy_s += time.perf_counter() - started
+            raise
+        with self._lock:
+            self._finished += 1
+            self._busy_s += elapsed
+        # Thời gian chờ worker rảnh (+ pickle với process pool)
+        QUEUE_WAIT_SECONDS.labels("executor").observe(
+            max(0.0, time.perf_counter() - started - elapsed)
+        )
+        return result
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = self._submitted - self._finished
+            busy_s = self._busy_s
+            submitted, finished, failed = self._submitted, self._finished, self._failed
+        uptime = max(1e-9, time.perf_counter() - self._started_at)
+        running = min(in_flight, self.workers)
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "intra_op_threads": self.intra_op_threads,
+            "interop_threads": self.interop_threads,
+            "cpus": self.cpus,
+            "queue_depth": in_flight - running,
+            "busy_workers": running,
+            "utilisation": running / self.workers,
+            "mean_utilisation": min(1.0, busy_s / (uptime * self.workers)),
+            "submitted": submitted,
+            "finished": finished,
+            "failed": failed,
+        }
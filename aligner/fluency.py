@@ -0,0 +1,181 @@
+"""
+Fluency metrics (vector hóa, không lặp Python theo frame).
+
+- Năng lượng frame: reshape audio thành (n_frames, frame) rồi RMS theo hàng.
+- Pause: các đoạn liên tiếp frame CTC blank (argmax == blank) đủ dài và năng
+  lượng thấp, nằm giữa frame speech đầu tiên và cuối cùng.
+- Speech rate = số từ / tổng thời lượng; articulation rate = số từ / thời
+  gian phát âm thực (bỏ pause và im lặng đầu/cuối).
+
+Cấu hình (env):
+  FLUENCY_MIN_PAUSE_S        : độ dài tối thiểu của 1 pause (mặc định 0.25s)
+  FLUENCY_SILENCE_REL_DB     : frame "im lặng" nếu RMS thấp hơn mức speech
+                               (percentile 95) bao nhiêu dB (mặc định 20)
+"""
+
+import os
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+# Wav2Vec2 conv feature extractor: stride 320 samples = 20ms / frame CTC
+CTC_FRAME_SAMPLES = 320
+
+MIN_PAUSE_S = float(os.getenv("FLUENCY_MIN_PAUSE_S", "0.25"))
+SILENCE_REL_DB = float(os.getenv("FLUENCY_SILENCE_REL_DB", "20"))
+_SILENCE_ABS_RMS = 1e-4
+
+
+def frame_rms(wav_16k: np.ndarray, frame_size: int = CTC_FRAME_SAMPLES) -> np.ndarray:
+    """RMS của từng frame không chồng lấn (view reshape, không copy audio)."""
+    n_frames = len(wav_16k) // frame_size
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = wav_16k[: n_frames * frame_size].reshape(n_frames, frame_size)
+    return np.sqrt(np.einsum("ij,ij->i", frames, frames) / frame_size)
+
+
+def bool_runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Các đoạn True liên tiếp: (starts, lengths)."""
+    padded = np.concatenate(([0], mask.astype(np.int8, copy=False), [0]))
+    edges = np.flatnonzero(np.diff(padded))
+    starts, ends = edges[0::2], edges[1::2]
+    return starts, ends - starts
+
+
+def pause_statistics(
+    wav_16k: np.ndarray,
+    log_probs: np.ndarray | None = None,
+    blank_id: int | None = None,
+) -> dict:
+    """
+    Pause từ CTC blank (nếu có log_probs) kết hợp năng lượng thấp.
+    Không có log_probs → chỉ dùng năng lượng.
+    """
+    frame_s = CTC_FRAME_SAMPLES / SAMPLE_RATE
+    rms = frame_rms(wav_16k)
+    if rms.size:
+        speech_level = float(np.percentile(rms, 95))
+        silent = rms < max(_SILENCE_ABS_RMS, speech_level * 10 ** (-SILENCE_REL_DB / 20))
+    else:
+        silent = np.zeros(0, dtype=bool)
+
+    if log_probs is not None and blank_id is not None and len(log_probs):
+        n = min(len(log_probs), len(silent))
+        blank = np.argmax(log_probs[:n], axis=-1) == blank_id
+        # frame speech = có token non-blank; pause = blank + im lặng
+        non_speech = blank & silent[:n]
+        speech = ~blank
+    else:
+        non_speech = silent
+        speech = ~silent
+
+    speech_idx = np.flatnonzero(speech)
+    if speech_idx.size == 0:
+        return {
+            "speaking_time_s": 0.0,
+            "phonation_time_s": 0.0,
+            "pause_count": 0,
+            "pause_time_s": 0.0,
+            "mean_pause_s": 0.0,
+            "max_pause_s": 0.0,
+            "pause_ratio": 1.0 if len(wav_16k) else 0.0,
+        }
+
+    # Bỏ im lặng đầu/cuối: chỉ xét [frame speech đầu, frame speech cuối]
+    first, last = int(speech_idx[0]), int(speech_idx[-1]) + 1
+    _, lengths = bool_runs(non_speech[first:last])
+    pauses = lengths[lengths * frame_s >= MIN_PAUSE_S] * frame_s
+
+    speaking_time = (last - first) * frame_s
+    pause_time = float(pauses.sum())
+    return {
+        "speaking_time_s": speaking_time,
+        "phonation_time_s": speaking_time - pause_time,
+        "pause_count": int(pauses.size),
+        "pause_time_s": pause_time,
+        "mean_pause_s": float(pauses.mean()) if pauses.size else 0.0,
+        "max_pause_s": float(pauses.max()) if pauses.size else 0.0,
+        "pause_ratio": pause_time / speaking_time if speaking_time > 0 else 0.0,
+    }
+
+
+def _speech_rate_score(speech_rate: float) -> float:
+    ideal_min, ideal_max = 2.0, 4.0
+    acceptable_min, acceptable_max = 0.7, 5.5
+
+    if ideal_min <= speech_rate <= ideal_max:
+        return 1.0
+    if acceptable_min <= speech_rate < ideal_min:
+        return 0.7 + ((speech_rate - acceptable_min) / (ideal_min - acceptable_min)) * 0.3
+    if ideal_max < speech_rate <= acceptable_max:
+        return 1.0 - ((speech_rate - ideal_max) / (acceptable_max - ideal_max)) * 0.3
+    if speech_rate < acceptable_min:
+        return max(0.3, 0.7 * (speech_rate / acceptable_min))
+    return max(0.3, 0.7 * (1.0 - (speech_rate - acceptable_max) / acceptable_max))
+
+
+def _pause_score(pause_ratio: float) -> float:
+    ideal_min, ideal_max = 0.05, 0.35
+    acceptable_min, acceptable_max = 0.02, 0.50
+
+    if ideal_min <= pause_ratio <= ideal_max:
+        return 1.0
+    if acceptable_min <= pause_ratio < ideal_min:
+        return 0.8 + ((pause_ratio - acceptable_min) / (ideal_min - acceptable_min)) * 0.2
+    if ideal_max < pause_ratio <= acceptable_max:
+        return 1.0 - ((pause_ratio - ideal_max) / (acceptable_max - ideal_max)) * 0.3
+    if pause_ratio < acceptable_min:
+        return max(0.4, 0.8 * (pause_ratio / acceptable_min))
+    return max(0.4, 0.7 * (1.0 - (pause_ratio - acceptable_max) / 0.3))
+
+
+def calculate_fluency(
+    wav_16k: np.ndarray,
+    words_ref: list[str],
+    ph_pred_list: list[str],
+    ref_phonemes_per_word: list[list[str]] | None = None,
+    log_probs: np.ndarray | None = None,
+    blank_id: int | None = None,
+) -> dict:
+    """
+    Tính độ trôi chảy (fluency) dựa trên:
+      - Speech rate (từ/giây)
+      - Pause ratio (thời gian pause / thời gian nói, từ CTC blank)
+    Trả thêm articulation rate và thống kê pause.
+    """
+    audio_duration = len(wav_16k) / SAMPLE_RATE
+    if audio_duration <= 0:
+        return {
+            "fluency_score": 0.0,
+            "speech_rate": 0.0,
+            "articulation_rate": 0.0,
+            "phone_rate": 0.0,
+            "pause_ratio": 1.0,
+            "pause_count": 0,
+            "mean_pause_s": 0.0,
+            "max_pause_s": 0.0,
+        }
+
+    num_words = len(words_ref)
+    speech_rate = num_words / audio_duration
+    pauses = pause_statistics(wav_16k, log_probs, blank_id)
+    phonation = pauses["phonation_time_s"]
+    articulation_rate = num_words / phonation if phonation > 0 else 0.0
+    phone_rate = len(ph_pred_list) / phonation if phonation > 0 else 0.0
+
+    # Fluency chỉ dựa trên speech rate + pause ratio
+    fluency_score = (
+        _speech_rate_score(speech_rate) * 0.5 + _pause_score(pauses["pause_ratio"]) * 0.5
+    ) * 100.0
+
+    return {
+        "fluency_score": fluency_score,
+        "speech_rate": speech_rate,
+        "articulation_rate": articulation_rate,
+        "phone_rate": phone_rate,
+        "pause_ratio": pauses["pause_ratio"],
+        "pause_count": pauses["pause_count"],
+        "mean_pause_s": pauses["mean_pause_s"],
+        "max_pause_s": pauses["max_pause_s"],
+    }
@@ -0,0 +1,192 @@
+"""
+CTC forced alignment (Viterbi) của chuỗi phoneme reference trên log-probs
+đã có từ forward → thời gian thật cho từng từ / phoneme, không chạy model
+lần 2.
+
+Chuỗi mở rộng CTC: blank, p1, blank, p2, ..., pN, blank (S = 2N + 1 state).
+Viterbi lặp theo frame, mỗi frame xử lý cả S state bằng NumPy:
+
+    alpha_t[s] = lp[t, ext[s]] + max(alpha_{t-1}[s], alpha_{t-1}[s-1],
+                                     alpha_{t-1}[s-2] nếu ext[s] != blank và != ext[s-2])
+
+Backpointer int8 (T, S), backtrace 1 vòng T bước. Chi phí O(T·S) ~ vài chục
+ms cho clip 60s, nhỏ so với forward.
+
+Phoneme IPA của espeak được map sang id trong vocab của model 1 lần
+(TokenMapper): khớp thẳng → bỏ dấu nhấn → dạng normalize → tách thành các
+token vocab dài nhất; phoneme không map được không tham gia alignment và
+nhận thời gian 0 độ dài tại biên phoneme trước.
+
+Cấu hình (env):
+  ALIGN_FORCED_ALIGNMENT : "1" (mặc định) | "0" tắt (start/end = 0 / độ dài audio như cũ)
+  ALIGN_FORCED_MAX_CELLS : giới hạn T × S (bộ nhớ backpointer, byte), mặc định 5e7
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from streaming import FRAME_STRIDE, SAMPLE_RATE
+
+FORCED_ALIGNMENT = os.getenv("ALIGN_FORCED_ALIGNMENT", "1").strip() not in ("0", "false", "off")
+FORCED_MAX_CELLS = int(float(os.getenv("ALIGN_FORCED_MAX_CELLS", "5e7")))
+
+FRAME_MS = 1000.0 * FRAME_STRIDE / SAMPLE_RATE  # 20ms / frame CTC
+
+_SPECIAL_TOKENS = {"<pad>", "<s>", "</s>", "<unk>", "|"}
+_STRESS_MARKS = str.maketrans("", "", "ˈˌ0123456789")
+
+
+class TokenMapper:
+    """Phoneme IPA (espeak) → tuple id trong vocab CTC, cache theo token."""
+
+    def __init__(self, vocab: dict[str, int], normalize):
+        self._vocab = {tok: i for tok, i in vocab.items() if tok not in _SPECIAL_TOKENS}
+        self._normalize = normalize
+        self._max_len = max((len(tok) for tok in self._vocab), default=1)
+        self._cache: dict[str, tuple[int, ...]] = {}
+        self._lock = threading.Lock()
+
+    def ids(self, token: str) -> tuple[int, ...]:
+        ids = self._cache.get(token)
+        if ids is None:
+            ids = self._map(token)
+            with self._lock:
+                self._cache[token] = ids
+        return ids
+
+    def _map(self, token: str) -> tuple[int, ...]:
+        for candidate in (token, token.translate(_STRESS_MARKS), self._normalize(token)):
+            if candidate in self._vocab:
+                return (self._vocab[candidate],)
+        # Tách tham lam thành các token vocab dài nhất (vd. diphthong không có trong vocab)
+        text, ids, i = token.translate(_STRESS_MARKS), [], 0
+        while i < len(text):
+            for size in range(min(self._max_len, len(text) - i), 0, -1):
+                piece = text[i : i + size]
+                if piece in self._vocab:
+                    ids.append(self._vocab[piece])
+                    i += size
+                    break
+            else:
+                i += 1  # ký tự không có trong vocab (dấu phụ, ...) → bỏ
+        return tuple(ids)
+
+
+def ctc_viterbi(log_probs: np.ndarray, tokens: np.ndarray, blank: int) -> np.ndarray | None:
+    """
+    Đường CTC tốt nhất cho tokens trên log_probs (T, V).
+
+    Returns:
+        int (N, 2) [frame đầu, frame cuối + 1] của từng token, hoặc None nếu
+        không align được (audio quá ngắn cho số token, hoặc vượt FORCED_MAX_CELLS).
+    """
+    n_frames, n_tokens = len(log_probs), len(tokens)
+    n_states = 2 * n_tokens + 1
+    repeats = int(np.count_nonzero(tokens[1:] == tokens[:-1])) if n_tokens else 0
+    if n_tokens == 0 or n_frames < n_tokens + repeats or n_frames * n_states > FORCED_MAX_CELLS:
+        return None
+
+    ext = np.full(n_states, blank, dtype=np.int64)
+    ext[1::2] = tokens
+    # Nhảy s-2 → s chỉ cho state token khác token trước (bỏ qua blank ở giữa)
+    skip_penalty = np.full(n_states, -np.inf, dtype=np.float32)
+    skip_penalty[3::2] = np.where(tokens[1:] != tokens[:-1], 0.0, -np.inf)
+
+    emissions = log_probs.astype(np.float32, copy=False)
+    alpha = np.full(n_states, -np.inf, dtype=np.float32)
+    alpha[:2] = emissions[0, ext[:2]]
+    back = np.zeros((n_frames, n_states), dtype=np.int8)
+    cand = np.full((3, n_states), -np.inf, dtype=np.float32)
+    states = np.arange(n_states)
+    for t in range(1, n_frames):
+        cand[0] = alpha
+        cand[1, 1:] = alpha[:-1]
+        cand[2, 2:] = alpha[:-2] + skip_penalty[2:]
+        choice = cand.argmax(axis=0)
+        back[t] = choice
+        alpha = cand[choice, states] + emissions[t, ext]
+
+    s = n_states - 1 if alpha[-1] >= alpha[-2] else n_states - 2
+    if not np.isfinite(alpha[s]):
+        return None
+    path = np.empty(n_frames, dtype=np.int64)
+    for t in range(n_frames - 1, -1, -1):
+        path[t] = s
+        s -= int(back[t, s])
+
+    # Frame thuộc token k ↔ state 2k+1; path không giảm → searchsorted cho đầu / cuối
+    token_frames = np.flatnonzero(path % 2 == 1)
+    token_of_frame = path[token_frames] // 2
+    k = np.arange(n_tokens)
+    starts = token_frames[np.searchsorted(token_of_frame, k, side="left")]
+    ends = token_frames[np.searchsorted(token_of_frame, k, side="right") - 1] + 1
+    return np.stack([starts, ends], axis=1)
+
+
+def align_words(
+    log_probs: np.ndarray,
+    per_word_ipa: list[list[str]],
+    mapper: TokenMapper,
+    blank: int,
+    duration_ms: float | None = None,
+) -> dict | None:
+    """
+    Forced alignment phoneme reference theo từ.
+
+    Returns:
+        {"words": [[start_ms, end_ms], ...],
+         "phonemes": [[[start_ms, end_ms], ...] cho từng từ],
+         "segments": {"tokens", "spans", "token_phone", "phone_word"}}
+        hoặc None nếu không align được. "segments" (mảng theo token, span
+        theo frame) dùng cho GOP (gop.py).
+    """
+    token_ids: list[int] = []
+    token_phone: list[int] = []  # token → index phoneme (flat)
+    phone_word: list[int] = []
+    for w, phones in enumerate(per_word_ipa):
+        for ph in phones:
+            ids = mapper.ids(ph)
+            token_ids.extend(ids)
+            token_phone.extend([len(phone_word)] * len(ids))
+            phone_word.append(w)
+    tokens = np.asarray(token_ids, dtype=np.int64)
+    spans = ctc_viterbi(log_probs, tokens, blank)
+    if spans is None:
+        return None
+
+    # Phoneme = hợp các token của nó; phoneme không có token → 0 độ dài tại biên trước
+    n_phones = len(phone_word)
+    token_phone_arr = np.asarray(token_phone, dtype=np.int64)
+    phone_start = np.full(n_phones, np.iinfo(np.int64).max, dtype=np.int64)
+    phone_end = np.full(n_phones, -1, dtype=np.int64)
+    np.minimum.at(phone_start, token_phone_arr, spans[:, 0])
+    np.maximum.at(phone_end, token_phone_arr, spans[:, 1])
+    missing = phone_end < 0
+    if missing.any():
+        filled = np.maximum.accumulate(np.where(missing, 0, phone_end))
+        phone_start[missing] = filled[missing]
+        phone_end[missing] = filled[missing]
+
+    limit = np.inf if duration_ms is None else duration_ms
+    starts_ms = np.minimum(np.round(phone_start * FRAME_MS), limit).astype(int).tolist()
+    ends_ms = np.minimum(np.round(phone_end * FRAME_MS), limit).astype(int).tolist()
+
+    phonemes: list[list[list[int]]] = [[] for _ in per_word_ipa]
+    for i, w in enumerate(phone_word):
+        phonemes[w].append([starts_ms[i], ends_ms[i]])
+    words, prev_end = [], 0
+    for spans_w in phonemes:
+        if spans_w:
+            prev_end = spans_w[-1][1]
+            words.append([spans_w[0][0], prev_end])
+        else:
+            words.append([prev_end, prev_end])
+    segments = {
+        "tokens": tokens,
+        "spans": spans,
+        "token_phone": token_phone_arr,
+        "phone_word": phone_word,
+    }
+    return {"words": words, "phonemes": phonemes, "segments": segments}
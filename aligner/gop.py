@@ -0,0 +1,69 @@
+"""
+GOP (goodness of pronunciation) cho từng phoneme reference từ ma trận
+log-posterior CTC và các đoạn frame của forced alignment (forced_align.py).
+
+Với phoneme q chiếm các frame [s, e):
+
+    GOP(q) = 1/(e - s) · Σ_t [ log P(q | t) − max_{v ≠ blank} log P(v | t) ]
+
+≤ 0, bằng 0 khi q là phoneme trội ở mọi frame của đoạn. Điểm = 100 · exp(GOP)
+(trung bình hình học của tỉ lệ posterior, 0..100). Blank bị loại khỏi max vì
+CTC phát blank ở phần lớn frame.
+
+Tổng theo đoạn tính bằng cumsum theo trục thời gian rồi lấy hiệu tại biên
+đoạn, chỉ trên K cột token có trong reference (T+1, K) và max theo frame
+(T+1,): không copy / cumsum cả (T, V), không có vòng lặp Python theo phoneme.
+"""
+
+import numpy as np
+
+
+def segment_gop(
+    log_probs: np.ndarray, tokens: np.ndarray, spans: np.ndarray, blank: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (tổng log-ratio, số frame) của từng token trên đoạn [start, end) của nó.
+
+    log_probs: (T, V); tokens: (N,) id vocab; spans: (N, 2) frame.
+    """
+    # Max trên các cột ≠ blank: 2 slice (view, không copy cả (T, V))
+    before, after = log_probs[:, :blank], log_probs[:, blank + 1 :]
+    if before.shape[1] and after.shape[1]:
+        best = np.maximum(before.max(axis=1), after.max(axis=1))
+    elif before.shape[1] or after.shape[1]:
+        best = (before if before.shape[1] else after).max(axis=1)
+    else:
+        best = log_probs[:, 0]
+    cum_best = np.zeros(len(log_probs) + 1, dtype=np.float64)
+    np.cumsum(best, dtype=np.float64, out=cum_best[1:])
+
+    # Chỉ cumsum K cột của các token có trong reference, không phải cả V
+    columns, column_of = np.unique(tokens, return_inverse=True)
+    cum_lp = np.zeros((len(log_probs) + 1, len(columns)), dtype=np.float64)
+    np.cumsum(log_probs[:, columns], axis=0, dtype=np.float64, out=cum_lp[1:])
+
+    starts, ends = spans[:, 0], spans[:, 1]
+    target = cum_lp[ends, column_of] - cum_lp[starts, column_of]
+    return target - (cum_best[ends] - cum_best[starts]), (ends - starts).astype(np.float64)
+
+
+def phoneme_scores(log_probs: np.ndarray, alignment: dict, blank: int) -> list[list[float | None]]:
+    """
+    Điểm GOP 0..100 cho từng phoneme reference (theo từ, cùng hình dạng
+    per_word_ipa). Phoneme không map được sang vocab → None.
+
+    alignment: kết quả forced_align.align_words (dùng "segments").
+    """
+    seg = alignment["segments"]
+    n_phones = len(seg["phone_word"])
+    sums, frames = segment_gop(log_probs, seg["tokens"], seg["spans"], blank)
+    # Phoneme nhiều token (vd. diphthong tách đôi): gộp theo số frame
+    phone_sum = np.bincount(seg["token_phone"], weights=sums, minlength=n_phones)
+    phone_frames = np.bincount(seg["token_phone"], weights=frames, minlength=n_phones)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = 100.0 * np.exp(phone_sum / phone_frames)
+
+    by_word: list[list[float | None]] = [[] for _ in alignment["phonemes"]]
+    for w, score, n in zip(seg["phone_word"], scores.tolist(), phone_frames.tolist()):
+        by_word[w].append(round(score, 1) if n > 0 else None)
+    return by_word
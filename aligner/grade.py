@@ -0,0 +1,186 @@
+"""
+Chấm hàng loạt offline (không qua HTTP): đọc manifest, chấm bằng
+assess_pronunciation trong 1 pool worker process, ghi kết quả JSONL ngay
+khi từng item xong.
+
+    python grade.py archive.jsonl --output scores.jsonl --workers 4
+    python grade.py archive.csv -o scores.jsonl        # chạy lại: bỏ qua id đã có
+
+Manifest: .jsonl / .tsv / .csv (xem manifest.py). Mỗi dòng output:
+  {"id", "audio", "text", "status": "ok" | "error", "audioS", "elapsedMs",
+   "result": <response /align>}   hoặc   "error": <body lỗi của /align>
+
+Model load 1 lần trong process cha trước khi fork (như serve.py), các worker
+dùng chung weight copy-on-write. Resume: id đã có dòng trong file output
+được bỏ qua (--retry-errors chạy lại các item lỗi, dòng mới append sau dòng
+lỗi cũ → dòng cuối cùng của 1 id là kết quả mới nhất); dòng cuối bị ghi dở
+khi bị ngắt được cắt bỏ. Throughput in ra theo giờ audio / giờ wall-clock.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from manifest import read_manifest
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_EVERY_S = 10.0
+
+
+# ----------------- Worker -----------------
+def _init_worker(threads: int) -> None:
+    from executor import configure_torch_threads
+
+    gc.enable()
+    configure_torch_threads(threads)
+
+
+def grade_one(entry: dict) -> dict:
+    """1 item manifest → 1 dòng output (không raise)."""
+    from ctc_segm import normalize_words
+    from pipeline import InvalidAudio, check_audio, check_words, decode_audio, score_utterance
+
+    started = time.perf_counter()
+    record = {"id": entry["id"], "audio": entry["audio"], "text": entry["text"]}
+    try:
+        with open(entry["audio"], "rb") as f:
+            mono = decode_audio(f)
+        record["audioS"] = round(mono.size / 16000.0, 3)
+        words_ref = normalize_words(entry["text"])
+        error = check_audio(mono) or check_words(words_ref)
+        if error is not None:
+            record.update(status="error", error=error[0])
+        else:
+            record.update(status="ok", result=score_utterance(mono, words_ref))
+    except InvalidAudio as e:
+        record.update(status="error", error={"error": "invalid_audio", "detail": str(e)})
+    except Exception as e:
+        record.update(
+            status="error",
+            error={"error": "internal_error", "detail": str(e), "type": type(e).__name__},
+        )
+    record["elapsedMs"] = round((time.perf_counter() - started) * 1000.0, 1)
+    return record
+
+
+# ----------------- Resume -----------------
+def load_done(output: str, retry_errors: bool) -> set[str]:
+    """
+    id đã chấm trong file output. Dòng cuối ghi dở (bị ngắt giữa chừng) được
+    cắt khỏi file để append tiếp không làm hỏng JSONL.
+    """
+    done: set[str] = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            logger.warning(f"grade: dropping partial last line of {output}")
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("status") == "ok" or not retry_errors:
+            done.add(record["id"])
+    return done
+
+
+# ----------------- Main -----------------
+class Progress:
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.audio_s = 0.0
+        self.started = time.perf_counter()
+        self._last_log = self.started
+
+    def add(self, record: dict) -> None:
+        self.done += 1
+        self.failed += record["status"] != "ok"
+        self.audio_s += record.get("audioS", 0.0)
+        now = time.perf_counter()
+        if now - self._last_log >= PROGRESS_EVERY_S:
+            self._last_log = now
+            logger.info(f"grade: {self.done}/{self.total} ({self.failed} errors), {self.summary()}")
+
+    def summary(self) -> str:
+        wall_s = max(1e-9, time.perf_counter() - self.started)
+        return (
+            f"{self.audio_s / 3600:.3f} audio-h in {wall_s:.1f}s wall "
+            f"→ {self.audio_s / wall_s:.1f} audio-h / wall-h"
+        )
+
+
+def grade(args) -> int:
+    from executor import available_cpus
+
+    entries = read_manifest(args.manifest)
+    ids = [e["id"] for e in entries]
+    if len(set(ids)) != len(ids):
+        logger.warning("grade: manifest has duplicate ids, resume will treat them as one item")
+    done = set() if args.overwrite else load_done(args.output, args.retry_errors)
+    todo = [e for e in entries if e["id"] not in done]
+    logger.info(f"grade: {len(entries)} items in manifest, {len(done)} already graded, {len(todo)} to go")
+    if not todo:
+        return 0
+
+    cpus = available_cpus()
+    workers = max(1, min(args.workers or cpus, len(todo)))
+    threads = args.threads or max(1, cpus // workers)
+
+    # Load model 1 lần trước fork: worker dùng chung weight (copy-on-write).
+    # Chưa chạy forward nào nhiều thread trong process cha → fork an toàn.
+    import ctc_segm
+    from executor import configure_torch_threads
+
+    configure_torch_threads(1)
+    gc.disable()
+    ctc_segm.startup(warmup=False)
+    for name in ("ctc_segm", "pipeline"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    gc.freeze()
+
+    progress = Progress(len(todo))
+    mode = "w" if args.overwrite else "a"
+    ctx = multiprocessing.get_context("fork")
+    with open(args.output, mode, encoding="utf-8") as out, ctx.Pool(
+        workers, initializer=_init_worker, initargs=(threads,)
+    ) as pool:
+        for record in pool.imap_unordered(grade_one, todo, chunksize=args.chunksize):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            progress.add(record)
+
+    logger.info(
+        f"grade: done {progress.done} items ({progress.failed} errors) with "
+        f"{workers} workers × {threads} threads, {progress.summary()}"
+    )
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline bulk pronunciation grading")
+    parser.add_argument("manifest", help=".jsonl / .tsv / .csv list of recordings (see manifest.py)")
+    parser.add_argument("-o", "--output", required=True, help="JSONL results (appended, resumable)")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: cores)")
+    parser.add_argument("--threads", type=int, default=0, help="torch threads per worker (default: cores / workers)")
+    parser.add_argument("--chunksize", type=int, default=1, help="items handed to a worker at a time")
+    parser.add_argument("--retry-errors", action="store_true", help="re-grade items whose last result was an error")
+    parser.add_argument("--overwrite", action="store_true", help="ignore and replace an existing output file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    return grade(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
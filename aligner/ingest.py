@@ -0,0 +1,151 @@
+"""
+Nhận upload audio với bộ nhớ bị chặn trên mỗi request.
+
+- BodyLimitMiddleware (ASGI): body của POST /align, /align/batch lớn hơn
+  ALIGN_MAX_REQUEST_BYTES → 413 ngay, trước khi parse multipart
+  (Content-Length nếu có, không thì đếm dần các chunk đang nhận).
+- Starlette parse multipart thẳng vào SpooledTemporaryFile (RAM tới 1 MiB,
+  sau đó ra file tạm); handler không .read() cả file mà kiểm tra kích thước
+  (check_upload) rồi decode_audio đọc từ file đó theo block vào buffer
+  float32 mono 16 kHz cấp phát 1 lần.
+- Độ dài audio (header của file) > ALIGN_MAX_AUDIO_S → 413 trước khi decode.
+
+Peak memory ~ buffer output (4 byte × 16000 × giây audio) + 1 block decode
++ ≤ 1 MiB spool mỗi file.
+
+Cấu hình (env):
+  ALIGN_MAX_UPLOAD_BYTES  : kích thước tối đa 1 file audio (mặc định 32 MiB, 0 = không giới hạn)
+  ALIGN_MAX_REQUEST_BYTES : body tối đa 1 request multipart (mặc định 256 MiB, 0 = không giới hạn)
+  ALIGN_MAX_AUDIO_S       : độ dài audio tối đa (mặc định 300s, 0 = không giới hạn)
+"""
+
+import os
+
+from fastapi import UploadFile
+from fastapi.responses import JSONResponse
+
+from metrics import ERRORS
+from pipeline import AudioTooLong
+
+MAX_UPLOAD_BYTES = int(os.getenv("ALIGN_MAX_UPLOAD_BYTES", str(32 * 2**20)))
+MAX_REQUEST_BYTES = int(os.getenv("ALIGN_MAX_REQUEST_BYTES", str(256 * 2**20)))
+MAX_AUDIO_S = float(os.getenv("ALIGN_MAX_AUDIO_S", "300"))
+
+MIN_UPLOAD_BYTES = 100
+LIMITED_PATHS = ("/align", "/align/batch")
+
+
+def payload_too_large(size: int, limit: int, what: str) -> tuple[dict, int]:
+    return (
+        {
+            "error": "payload_too_large",
+            "detail": f"{what} is {size} bytes, limit is {limit} bytes",
+            "maxBytes": limit,
+        },
+        413,
+    )
+
+
+def audio_too_long(e: AudioTooLong) -> tuple[dict, int]:
+    return (
+        {
+            "error": "audio_too_long",
+            "detail": f"Audio must be <= {e.max_s:g}s",
+            "durationMs": int(round(e.duration_s * 1000)),
+            "maxDurationMs": int(round(e.max_s * 1000)),
+        },
+        413,
+    )
+
+
+def invalid_audio(detail: str) -> tuple[dict, int]:
+    return {"error": "invalid_audio", "detail": detail}, 400
+
+
+def upload_size(upload: UploadFile) -> int:
+    """Kích thước file đã nhận (không đọc nội dung)."""
+    if upload.size is not None:
+        return upload.size
+    f = upload.file
+    pos = f.tell()
+    size = f.seek(0, os.SEEK_END)
+    f.seek(pos)
+    return size
+
+
+def check_upload(upload: UploadFile) -> tuple[dict, int] | None:
+    """Kích thước 1 file audio (quá nhỏ → 400, quá lớn → 413)."""
+    size = upload_size(upload)
+    if MAX_UPLOAD_BYTES > 0 and size > MAX_UPLOAD_BYTES:
+        return payload_too_large(size, MAX_UPLOAD_BYTES, "Audio file")
+    if size < MIN_UPLOAD_BYTES:
+        return invalid_audio("Audio file is empty or too small")
+    return None
+
+
+class BodyLimitMiddleware:
+    """
+    413 cho POST có body > max_bytes ở các path giới hạn. Body vượt giới hạn
+    giữa chừng (không có / khai sai Content-Length): ngừng nhận, bỏ response
+    của app (lỗi parse body) và trả 413.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES, paths: tuple[str, ...] = LIMITED_PATHS):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if (
+            self.max_bytes <= 0
+            or scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        try:
+            declared = int(headers.get(b"content-length", b""))
+        except ValueError:
+            declared = None
+        if declared is not None and declared > self.max_bytes:
+            await self._reject(scope, receive, send, declared)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded:
+                return
+            started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not started:
+            await self._reject(scope, receive, send, received)
+
+    async def _reject(self, scope, receive, send, size: int) -> None:
+        body, status_code = payload_too_large(size, self.max_bytes, "Request body")
+        ERRORS.labels(body["error"]).inc()
+        await JSONResponse(body, status_code=status_code)(scope, receive, send)
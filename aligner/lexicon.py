@@ -0,0 +1,293 @@
+"""
+Pronunciation lexicon: IPA tính sẵn cho danh sách từ, lưu file nhị phân và
+mmap lúc startup (không gọi espeak cho các từ có trong lexicon).
+
+Build (vd. từ vocabulary export của MongoDB decks):
+    mongoexport --collection vocabularies --fields front --out vocab.jsonl
+    python lexicon.py build vocab.jsonl lexicon.bin --field front
+
+Runtime:
+    PRONUNCIATION_LEXICON_PATH=/app/lexicon.bin
+
+File được map read-only (MAP_SHARED) nên mọi worker process dùng chung page
+cache của cùng 1 file.
+
+Format (little-endian, version LEXICON_VERSION):
+    header   : magic "VPLX", version u32, n_entries u32, n_symbols u32,
+               n_sections u32, rồi n_sections × (offset u64, nbytes u64)
+    sections : meta (JSON), bảng symbol (offsets u32 + blob utf-8),
+               từ đã sort (offsets u32 + blob utf-8),
+               IPA / normalized / simple-IPA của từng từ (offsets u32 + ids u16)
+"""
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LEXICON_MAGIC = b"VPLX"
+LEXICON_VERSION = 1
+
+_HEADER = struct.Struct("<4sIIII")
+_SECTION = struct.Struct("<QQ")
+_SECTIONS = (
+    "meta",
+    "sym_offsets",
+    "sym_blob",
+    "word_offsets",
+    "word_blob",
+    "ipa_offsets",
+    "ipa_ids",
+    "norm_offsets",
+    "norm_ids",
+    "simple_offsets",
+    "simple_ids",
+)
+_ALIGN = 8
+
+
+class Lexicon:
+    """Lexicon read-only trên mmap. lookup() không copy mảng id."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n_entries, n_symbols, n_sections = _HEADER.unpack_from(self._mm, 0)
+        if magic != LEXICON_MAGIC:
+            raise ValueError(f"{path} is not a pronunciation lexicon (bad magic)")
+        if version != LEXICON_VERSION:
+            raise ValueError(
+                f"{path}: lexicon version {version} != supported {LEXICON_VERSION}"
+            )
+        if n_sections != len(_SECTIONS):
+            raise ValueError(f"{path}: unexpected section count {n_sections}")
+
+        sections = {}
+        for i, name in enumerate(_SECTIONS):
+            sections[name] = _SECTION.unpack_from(self._mm, _HEADER.size + i * _SECTION.size)
+
+        def view(name: str, dtype) -> np.ndarray:
+            offset, nbytes = sections[name]
+            return np.frombuffer(
+                self._mm, dtype=dtype, count=nbytes // np.dtype(dtype).itemsize, offset=offset
+            )
+
+        def blob(name: str) -> memoryview:
+            offset, nbytes = sections[name]
+            return memoryview(self._mm)[offset : offset + nbytes]
+
+        self.n_entries = n_entries
+        self.meta = json.loads(bytes(blob("meta")).decode("utf-8"))
+
+        # Bảng symbol nhỏ (vài trăm) → decode 1 lần
+        sym_offsets = view("sym_offsets", "<u4")
+        sym_blob = bytes(blob("sym_blob"))
+        self._symbols = [
+            sym_blob[sym_offsets[i] : sym_offsets[i + 1]].decode("utf-8")
+            for i in range(n_symbols)
+        ]
+
+        self._word_offsets = view("word_offsets", "<u4")
+        self._word_blob = blob("word_blob")
+        self._ipa = (view("ipa_offsets", "<u4"), view("ipa_ids", "<u2"))
+        self._norm = (view("norm_offsets", "<u4"), view("norm_ids", "<u2"))
+        self._simple = (view("simple_offsets", "<u4"), view("simple_ids", "<u2"))
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return self.n_entries
+
+    def _word_at(self, idx: int) -> bytes:
+        return self._word_blob[self._word_offsets[idx] : self._word_offsets[idx + 1]].tobytes()
+
+    def _find(self, word: str) -> int:
+        key = word.encode("utf-8")
+        lo, hi = 0, self.n_entries
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._word_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_entries and self._word_at(lo) == key:
+            return lo
+        return -1
+
+    def _tokens(self, table: tuple[np.ndarray, np.ndarray], idx: int) -> list[str]:
+        offsets, ids = table
+        return [self._symbols[i] for i in ids[offsets[idx] : offsets[idx + 1]]]
+
+    def lookup(self, word: str) -> tuple[list[str], list[str], list[str]] | None:
+        """word → (ipa_tokens, normalized_tokens, simple_ipa) hoặc None."""
+        idx = self._find(word)
+        if idx < 0:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return (
+            self._tokens(self._ipa, idx),
+            self._tokens(self._norm, idx),
+            self._tokens(self._simple, idx),
+        )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": self.n_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# ----------------- Build -----------------
+def write_lexicon(
+    path: str,
+    entries: dict[str, tuple[list[str], list[str], list[str]]],
+    meta: dict,
+) -> None:
+    """Ghi lexicon: entries[word] = (ipa_tokens, normalized_tokens, simple_ipa)."""
+    symbols: dict[str, int] = {}
+
+    def intern(tokens: list[str]) -> list[int]:
+        return [symbols.setdefault(tok, len(symbols)) for tok in tokens]
+
+    words = sorted(entries, key=lambda w: w.encode("utf-8"))
+    word_bytes = [w.encode("utf-8") for w in words]
+    tables = {"ipa": [], "norm": [], "simple": []}
+    for w in words:
+        ipa, norm, simple = entries[w]
+        tables["ipa"].append(intern(ipa))
+        tables["norm"].append(intern(norm))
+        tables["simple"].append(intern(simple))
+    if len(symbols) > np.iinfo(np.uint16).max:
+        raise ValueError(f"too many distinct symbols for u16 ids: {len(symbols)}")
+
+    def offsets(lengths: list[int]) -> bytes:
+        return np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype("<u4").tobytes()
+
+    sym_bytes = [s.encode("utf-8") for s in sorted(symbols, key=symbols.get)]
+    payload = {
+        "meta": json.dumps({**meta, "n_entries": len(words)}, ensure_ascii=False).encode("utf-8"),
+        "sym_offsets": offsets([len(b) for b in sym_bytes]),
+        "sym_blob": b"".join(sym_bytes),
+        "word_offsets": offsets([len(b) for b in word_bytes]),
+        "word_blob": b"".join(word_bytes),
+    }
+    for name, seqs in tables.items():
+        payload[f"{name}_offsets"] = offsets([len(s) for s in seqs])
+        payload[f"{name}_ids"] = np.array(
+            [i for s in seqs for i in s], dtype="<u2"
+        ).tobytes()
+
+    header_size = _HEADER.size + _SECTION.size * len(_SECTIONS)
+    pos = -(-header_size // _ALIGN) * _ALIGN
+    table = []
+    for name in _SECTIONS:
+        table.append((pos, len(payload[name])))
+        pos = -(-(pos + len(payload[name])) // _ALIGN) * _ALIGN
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(LEXICON_MAGIC, LEXICON_VERSION, len(words), len(symbols), len(_SECTIONS)))
+        for offset, nbytes in table:
+            f.write(_SECTION.pack(offset, nbytes))
+        for name, (offset, _) in zip(_SECTIONS, table):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(payload[name])
+    os.replace(tmp_path, path)
+
+
+def read_word_list(path: str, field: str = "front") -> list[str]:
+    """
+    Đọc danh sách từ/cụm từ: .txt (mỗi dòng 1 mục), .json (array) hoặc
+    .jsonl (mongoexport) — với object thì lấy `field`.
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            items = json.load(f)
+        elif path.endswith(".jsonl"):
+            items = [json.loads(line) for line in f if line.strip()]
+        else:
+            items = [line.strip() for line in f if line.strip()]
+    texts = []
+    for item in items:
+        text = item.get(field) if isinstance(item, dict) else item
+        if isinstance(text, str) and text.strip():
+            texts.append(text)
+    return texts
+
+
+def build_lexicon(texts: list[str], output: str, chunk_size: int = 1000) -> int:
+    """Phonemize toàn bộ từ (theo logic của ctc_segm) rồi ghi lexicon."""
+    import ctc_segm
+
+    ctc_segm.init_phonemizer()  # chỉ cần phonemizer, không load model
+    words = sorted({w for text in texts for w in ctc_segm.normalize_words(text)})
+    logger.info(f"build_lexicon: {len(words)} unique words from {len(texts)} entries")
+    entries: dict[str, tuple[list[str], list[str], list[str]]] = {}
+    for start in range(0, len(words), chunk_size):
+        chunk = words[start : start + chunk_size]
+        for word, ipa in zip(chunk, ctc_segm._phonemize_words(chunk)):
+            if not ipa:
+                logger.warning(f"build_lexicon: empty IPA for '{word}', skipped")
+                continue
+            norm = [ctc_segm.normalize_espeak_token(tok) for tok in ipa]
+            simple = ctc_segm.ipa_list_to_simple_seq_direct(ipa)
+            entries[word] = (ipa, norm, simple)
+        logger.info(f"build_lexicon: {min(start + chunk_size, len(words))}/{len(words)}")
+
+    write_lexicon(
+        output,
+        entries,
+        {
+            "language": ctc_segm._PHONEMIZER_LANGUAGE,
+            "backend": ctc_segm._PHONEMIZER_BACKEND,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+    )
+    logger.info(f"build_lexicon: wrote {len(entries)} entries to {output}")
+    return len(entries)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Pronunciation lexicon tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="precompute IPA for a word list")
+    build.add_argument("input", help=".txt / .json / .jsonl word list")
+    build.add_argument("output", help="lexicon file to write")
+    build.add_argument("--field", default="front", help="field to read from JSON objects")
+
+    show = sub.add_parser("lookup", help="look words up in a lexicon file")
+    show.add_argument("lexicon")
+    show.add_argument("words", nargs="+")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if args.command == "build":
+        build_lexicon(read_word_list(args.input, args.field), args.output)
+    else:
+        lex = Lexicon(args.lexicon)
+        print(json.dumps(lex.meta, ensure_ascii=False))
+        for word in args.words:
+            print(word, lex.lookup(word))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -30,11 +30,42 @@ Lưu ý: Không nhận diện phonemes thực tế từ audio, mà so sánh audi
 mong đợi từ text để tính score. Đây là phương pháp "forced alignment" với scoring.
 """
 
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
-import io, numpy as np, soundfile as sf, re
+from fastapi import FastAPI, UploadFile, File, Form, Header, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
+import asyncio, json, os, time, numpy as np
 import logging
-from ctc_segm import assess_pronunciation, word_covered, ipa_list_to_simple_seq
+from ctc_segm import (
+    forward_log_probs_batch,
+    ipa_cache_stats,
+    is_ready,
+    lexicon_stats,
+    model_stats,
+    normalize_words,
+    process_memory,
+    scoring_config,
+    startup,
+    startup_status,
+)
+from batching import InferenceBatcher, BATCH_MAX_SIZE, plan_batches
+from executor import InferenceExecutor
+from resample import StreamResampler
+from streaming import AudioBuffer, WindowPlanner, decode_pcm, stream_config
+from pipeline import AudioTooLong, InvalidAudio, check_audio, check_words, decode_audio, score_utterance_timed
+from ingest import BodyLimitMiddleware, MAX_AUDIO_S, audio_too_long, check_upload, invalid_audio, upload_size
+import diagnostics
+from result_cache import ResultCache, result_key
+from metrics import (
+    AUDIO_SECONDS,
+    ERRORS,
+    REFERENCE_PHONEMES,
+    REFERENCE_WORDS,
+    REQUEST_BYTES,
+    REQUEST_SECONDS,
+    STAGE_SECONDS,
+    observe_forward,
+    observe_stages,
+    render as render_metrics,
+)
 
 # Setup logging
 logging.basicConfig(
@@ -46,225 +77,486 @@ logger = logging.getLogger(__name__)
 logging.getLogger("python_multipart").setLevel(logging.WARNING)
 
 app = FastAPI()
+# Body quá lớn → 413 trước khi parse multipart (xem ingest.py)
+app.add_middleware(BodyLimitMiddleware)
 logger.info("FastAPI app initialized")
 
-def normalize_words(text: str):
-    return [w for w in re.sub(r'[^a-zA-Z\s]', ' ', text.lower()).split() if w]
-
-def resample_to_16k(mono: np.ndarray, sr: int) -> np.ndarray:
-    target_sr = 16000
-    if sr == target_sr:
-        return mono.astype("float32", copy=False)
-    if len(mono) == 0:
-        return mono.astype("float32", copy=False)
-    new_len = int(round(len(mono) * target_sr / float(sr)))
-    x_old = np.linspace(0.0, 1.0, num=len(mono), endpoint=False, dtype=np.float32)
-    x_new = np.linspace(0.0, 1.0, num=max(1, new_len), endpoint=False, dtype=np.float32)
-    mono_16k = np.interp(x_new, x_old, mono.astype("float32")).astype("float32")
-    return mono_16k
+# Stage CPU-bound (decode, phonemizer, forward, DP) chạy ngoài event loop
+_executor = InferenceExecutor()
+# Gom các forward đồng thời (ALIGN_BATCH_MAX_SIZE=1 → mỗi request tự chạy model)
+_batcher = (
+    InferenceBatcher(forward_log_probs_batch, executor=_executor)
+    if BATCH_MAX_SIZE > 1
+    else None
+)
+# Số item tối đa của 1 request /align/batch
+BATCH_MAX_ITEMS = int(os.getenv("ALIGN_BATCH_MAX_ITEMS", "64"))
+# Response theo nội dung audio + words (ALIGN_RESULT_CACHE_SIZE=0 → tắt)
+_result_cache = ResultCache()
+
+@app.on_event("startup")
+async def _startup():
+    # Load model / phonemizer / warm-up ở background: server nhận kết nối ngay
+    # (/healthz trả 200), /readyz chỉ 200 khi mọi phase xong. ALIGN_EXECUTOR=process
+    # fork worker ở lần submit đầu tiên, tức là sau khi model đã load
+    # → warm-up 1 thread (xem ctc_segm.warm_up). Chạy qua serve.py: master đã
+    # startup xong trước khi fork, startup() ở đây không làm gì.
+    warmup_threads = 1 if _executor.kind == "process" else None
+    app.state.startup_task = asyncio.create_task(
+        asyncio.to_thread(startup, True, warmup_threads)
+    )
+
+@app.on_event("shutdown")
+async def _shutdown():
+    if _batcher is not None:
+        await _batcher.close()
+    _executor.shutdown(wait=False)
+
+async def forward_one(wav_16k: np.ndarray) -> np.ndarray:
+    """log_probs (T, V) cho 1 đoạn audio, qua batcher nếu bật."""
+    if _batcher is not None:
+        return await _batcher.submit(wav_16k)
+    started = time.perf_counter()
+    log_probs = (await _executor.run(forward_log_probs_batch, [wav_16k]))[0]
+    forward_s = time.perf_counter() - started
+    STAGE_SECONDS.labels("forward").observe(forward_s)
+    observe_forward(forward_s, len(wav_16k) / 16000.0)
+    return log_probs
+
+async def score_one(
+    mono: np.ndarray,
+    words_ref: list[str],
+    diagnostics_on: bool = False,
+    log_probs: np.ndarray | None = None,
+) -> tuple[dict, dict]:
+    """
+    forward (qua batcher nếu bật, bỏ qua nếu đã có log_probs) + chấm điểm 1
+    utterance, ghi metrics từng stage.
+    """
+    if log_probs is None and _batcher is not None:
+        log_probs = await _batcher.submit(mono)
+    response, score_stats = await _executor.run(
+        score_utterance_timed, mono, words_ref, log_probs, diagnostics_on
+    )
+    observe_stages(score_stats["timings"])
+    if "forward" in score_stats["timings"]:  # batching tắt: forward chạy trong assess_pronunciation
+        observe_forward(score_stats["timings"]["forward"], mono.size / 16000.0)
+    REFERENCE_PHONEMES.observe(score_stats["reference_phonemes"])
+    return response, score_stats
+
+async def decode_upload(upload: UploadFile) -> np.ndarray:
+    """
+    Decode file upload (spool của Starlette) theo block, không đọc cả file
+    vào bộ nhớ; raise AudioTooLong nếu dài hơn ALIGN_MAX_AUDIO_S, InvalidAudio
+    nếu không decode được.
+    """
+    t_stage = time.perf_counter()
+    if _executor.kind == "process":
+        # File object không pickle được → decode trong thread của process này
+        mono = await asyncio.to_thread(decode_audio, upload.file, MAX_AUDIO_S)
+    else:
+        mono = await _executor.run(decode_audio, upload.file, MAX_AUDIO_S)
+    STAGE_SECONDS.labels("decode_audio").observe(time.perf_counter() - t_stage)
+    AUDIO_SECONDS.observe(mono.size / 16000.0)
+    return mono
+
+def internal_error_body(e: Exception) -> dict:
+    import traceback
+    error_trace = traceback.format_exc()
+    logger.error(f"[ALIGNER][ERROR] {str(e)}")
+    logger.error(f"[ALIGNER][TRACEBACK] {error_trace}")
+    # Also print to stdout for docker logs
+    print(f"[ALIGNER][ERROR] {str(e)}")
+    print(f"[ALIGNER][TRACEBACK] {error_trace}")
+    return {
+        "error": "internal_error",
+        "detail": str(e),
+        "type": type(e).__name__,
+    }
+
+def error_response(body: dict, status_code: int, headers: dict | None = None) -> JSONResponse:
+    """JSONResponse lỗi + đếm align_errors_total theo body["error"]."""
+    ERRORS.labels(body.get("error", "unknown")).inc()
+    return JSONResponse(body, status_code=status_code, headers=headers)
+
+def not_ready_response() -> JSONResponse:
+    status = startup_status()
+    return error_response(
+        {
+            "error": "not_ready",
+            "detail": f"Model is starting up (phase: {status['phase']})",
+            "phase": status["phase"],
+        },
+        status_code=503,
+        headers={"Retry-After": "5"},
+    )
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: process sống và startup không lỗi (đang load vẫn là 200)."""
+    status = startup_status()
+    if status["error"] is not None:
+        return JSONResponse({"status": "failed", **status}, status_code=500)
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: model + phonemizer đã load và warm-up xong."""
+    status = startup_status()
+    return JSONResponse(
+        {"status": "ready" if status["ready"] else "starting", **status},
+        status_code=200 if status["ready"] else 503,
+    )
+
+@app.get("/stats")
+async def stats():
+    return {
+        "startup": startup_status(),
+        "model": model_stats(),
+        "memory": {"pid": os.getpid(), **process_memory()},
+        "executor": _executor.stats(),
+        "batching": _batcher.stats() if _batcher is not None else None,
+        "result_cache": _result_cache.stats(),
+        # ALIGN_EXECUTOR=process: cache nằm trong từng worker, số liệu ở đây là của process cha
+        "ipa_cache": ipa_cache_stats(),
+        "lexicon": lexicon_stats(),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 @app.post("/align")
 async def align(
     audio: UploadFile = File(...),
     referenceText: str = Form(...),
     languageCode: str = Form("en-US"),
+    diagnostics_mode: str | None = Form(None, alias="diagnostics"),
+    x_align_diagnostics: str | None = Header(None),
 ):
-    logger.info(f"Received alignment request: referenceText='{referenceText}', languageCode='{languageCode}'")
+    started = time.perf_counter()
+    mode = diagnostics.resolve_mode(x_align_diagnostics, diagnostics_mode)
+    response = await _align(audio, referenceText, languageCode, mode)
+    REQUEST_SECONDS.labels("/align", str(response.status_code)).observe(time.perf_counter() - started)
+    return response
+
+async def _align(
+    audio: UploadFile, referenceText: str, languageCode: str, mode: str | None
+) -> JSONResponse:
+    """mode: diagnostics mode của request (None = tắt, xem diagnostics.py)."""
+    if not is_ready():
+        return not_ready_response()
     try:
-        logger.debug("Reading audio file...")
-        wav_bytes = await audio.read()
-        logger.debug(f"Audio file size: {len(wav_bytes)} bytes")
-        if not wav_bytes or len(wav_bytes) < 100:
-            return JSONResponse(
-                {
-                    "error": "invalid_audio",
-                    "detail": "Audio file is empty or too small",
-                },
-                status_code=400,
-            )
-        
-        audio_f, sr = sf.read(io.BytesIO(wav_bytes), dtype="float32", always_2d=True)
-        mono = audio_f.mean(axis=1)
-        mono = resample_to_16k(mono, sr)
-
-        # Validate audio length (require at least 0.2s) and non-silence
-        duration_ms = int(round(mono.size / 16000.0 * 1000))
-        if mono.size < int(0.2 * 16000):
-            return JSONResponse(
-                {
-                    "error": "audio_too_short",
-                    "detail": "Audio must be >= 0.2s",
-                    "durationMs": duration_ms,
-                },
-                status_code=400,
-            )
-        rms = float(np.sqrt(np.mean(np.square(mono))) or 0.0)
-        if rms < 1e-4:  # near-silent recording
-            return JSONResponse(
-                {
-                    "error": "audio_silent",
-                    "detail": "Audio level too low",
-                    "durationMs": duration_ms,
-                    "rms": rms,
-                },
-                status_code=400,
-            )
+        # Body đã được Starlette spool (RAM / file tạm) trước khi vào handler
+        request_bytes = upload_size(audio)
+        REQUEST_BYTES.observe(request_bytes)
+        error = check_upload(audio)
+        if error is not None:
+            return error_response(error[0], status_code=error[1])
+
+        try:
+            mono = await decode_upload(audio)
+        except AudioTooLong as e:
+            error = audio_too_long(e)
+            return error_response(error[0], status_code=error[1])
+        except InvalidAudio as e:
+            error = invalid_audio(str(e))
+            return error_response(error[0], status_code=error[1])
+
+        error = check_audio(mono)
+        if error is not None:
+            return error_response(error[0], status_code=error[1])
 
         words_ref = normalize_words(referenceText)
-        if not words_ref:
-            return JSONResponse(
-                {
-                    "error": "invalid_text",
-                    "detail": "Reference text contains no valid words",
-                },
-                status_code=400,
-            )
+        REFERENCE_WORDS.observe(len(words_ref))
+        error = check_words(words_ref)
+        if error is not None:
+            return error_response(error[0], status_code=error[1])
 
         # ===== Phoneme sequence assessment =====
         # So sánh IPA reference (từ phonemizer) vs IPA predicted (từ model) bằng edit distance
-        logger.info("Starting phoneme sequence assessment...")
-        logger.info("  Process: Audio → IPA phonemes → Compare with IPA reference → Scores")
-        
-        result = assess_pronunciation(mono, words_ref)
-        
-        accuracy_ph = result["accuracy_ph"]
-        completeness = result["completeness"]
-        fluency = result["fluency"]  # Sử dụng fluency từ calculate_fluency()
-        speech_rate = result.get("speech_rate", 0.0)
-        pause_ratio = result.get("pause_ratio", 0.0)
-        
-        duration_ms = int(round(mono.size / 16000.0 * 1000))
-        
-        logger.info(
-            "Assessment results: accuracy=%.1f%%, completeness=%.1f%%, "
-            "fluency=%.1f%% (speech_rate=%.2f wps, pause=%.2f%%)",
-            accuracy_ph,
-            completeness,
-            fluency,
-            speech_rate,
-            pause_ratio * 100,
-        )
+        if mode is None and _result_cache.enabled:
+            # Retry / nộp lại cùng recording: trả response đã lưu, request trùng đang chạy thì chờ
+            key = await asyncio.to_thread(result_key, mono, words_ref, scoring_config())
 
-        # Overall score: weighted combination
-        overall = 0.4 * accuracy_ph + 0.4 * fluency + 0.2 * completeness
-        logger.info(f"Overall score: {overall:.1f}% (0.4*accuracy + 0.4*fluency + 0.2*completeness)")
-
-        # Build words response (simplified - no timings)
-        words_response = []
-        ph_ref_flat = result["ph_ref_flat"]
-        # Sử dụng IPA
-        ph_by_word = result.get("ph_by_word_ipa")
-        if not ph_by_word:
-            logger.error("ph_by_word_ipa not found in result")
-            ph_by_word = []
-        phoneme_correctness = result.get("phoneme_correctness") or []
-        
-        # Tính word scores dựa trên phoneme coverage
-        word_scores = []
-        ph_idx = 0
-        for word_idx, word in enumerate(words_ref):
-            word_ph_count = len(ph_by_word[word_idx]) if word_idx < len(ph_by_word) else 0
-            # Word score = average của phoneme accuracy (đơn giản hóa)
-            word_score = accuracy_ph  # Tạm thời dùng accuracy_ph cho tất cả words
-            word_scores.append(word_score)
-            
-            words_response.append({
-                "text": word,
-                "start": 0,  # No timing available
-                "end": duration_ms,
-                "score": round(word_score, 1)
-            })
+            async def compute() -> dict:
+                return (await score_one(mono, words_ref))[0]
 
-        # Build phonemes response (simplified)
-        phonemes_response = []
-        ph_idx = 0
-        for word_idx, word_ph_list in enumerate(ph_by_word):
-            correctness_for_word = (
-                phoneme_correctness[word_idx]
-                if word_idx < len(phoneme_correctness)
-                else []
-            )
-            logger.info(f"[RESULT][WORD #{word_idx}] '{words_ref[word_idx] if word_idx < len(words_ref) else '?'}'")
-            for ph_idx, ph in enumerate(word_ph_list):
-                is_correct = (
-                    correctness_for_word[ph_idx]
-                    if ph_idx < len(correctness_for_word)
-                    else False
-                )
-                phonemes_response.append({
-                    "wordIndex": word_idx,
-                    "p": ph,
-                    "start": 0,  # No timing available
-                    "end": duration_ms,
-                    "score": 100.0 if is_correct else 0.0,
-                    "isCorrect": is_correct
-                })
-                logger.info(
-                    f"    Phoneme {ph_idx:02d}: {ph:<4} -> {'✅' if is_correct else '❌'}"
-                )
-
-        # Build mistakes: words with low completeness
-        mistakes = []
-        pred_simple = ipa_list_to_simple_seq(result["ph_pred_list"])
-        for word_idx, word in enumerate(words_ref):
-            # Check if word is covered (from completeness calculation)
-            ph_seq_word = ph_by_word[word_idx] if word_idx < len(ph_by_word) else []
-            correctness_for_word = (
-                phoneme_correctness[word_idx]
-                if word_idx < len(phoneme_correctness)
-                else []
+            response, _ = await _result_cache.get_or_compute(key, compute)
+            return JSONResponse(response)
+
+        response, score_stats = await score_one(mono, words_ref, mode is not None)
+        if mode is not None:
+            trace = diagnostics.new_trace(
+                endpoint="/align",
+                referenceText=referenceText,
+                languageCode=languageCode,
+                requestBytes=request_bytes,
+                scores={k: response[k] for k in ("overall", "accuracy", "fluency", "completeness")},
+                **score_stats["trace"],
             )
-            
-            if not word_covered(ph_seq_word, pred_simple):
-                mistakes.append({
-                    "wordIndex": word_idx,
-                    "word": word,
-                    "wordScore": round(accuracy_ph, 1),
-                    "start": 0,
-                    "end": duration_ms,
-                    "phonemes": [
-                        {
-                            "p": ph,
-                            "score": 100.0 if (
-                                ph_idx < len(correctness_for_word)
-                                and correctness_for_word[ph_idx]
-                            ) else 0.0,
-                            "isCorrect": correctness_for_word[ph_idx]
-                            if ph_idx < len(correctness_for_word)
-                            else False,
-                            "start": 0,
-                            "end": duration_ms
-                        }
-                        for ph_idx, ph in enumerate(ph_seq_word)
-                    ]
+            diagnostics.emit(mode, trace, response)
+        return JSONResponse(response)
+    except Exception as e:
+        return error_response(internal_error_body(e), status_code=500)
+
+
+@app.post("/align/batch")
+async def align_batch(
+    audio: list[UploadFile] = File(...),
+    referenceText: list[str] = Form(...),
+    languageCode: str = Form("en-US"),
+    id: list[str] | None = Form(None),
+):
+    """
+    Chấm nhiều utterance trong 1 request: các field `audio` / `referenceText`
+    (và `id` nếu có) lặp lại, ghép theo thứ tự. Trả về {"results": [...]} với
+    mỗi item là response cùng schema /align (hoặc body lỗi của /align), kèm
+    "index", "id", "status".
+    """
+    started = time.perf_counter()
+    response = await _align_batch(audio, referenceText, id)
+    REQUEST_SECONDS.labels("/align/batch", str(response.status_code)).observe(
+        time.perf_counter() - started
+    )
+    return response
+
+async def _align_batch(
+    files: list[UploadFile], texts: list[str], ids: list[str] | None
+) -> JSONResponse:
+    if not is_ready():
+        return not_ready_response()
+    n = len(files)
+    ids = ids or [str(i) for i in range(n)]
+    if len(texts) != n or len(ids) != n:
+        return error_response(
+            {
+                "error": "invalid_batch",
+                "detail": f"Got {n} audio files, {len(texts)} referenceText and {len(ids)} id fields",
+            },
+            status_code=400,
+        )
+    if n > BATCH_MAX_ITEMS:
+        return error_response(
+            {
+                "error": "too_many_items",
+                "detail": f"At most {BATCH_MAX_ITEMS} items per batch",
+            },
+            status_code=413,
+        )
+
+    results: list[dict | None] = [None] * n
+
+    def item_error(i: int, body: dict, status_code: int) -> None:
+        ERRORS.labels(body.get("error", "unknown")).inc()
+        results[i] = {"index": i, "id": ids[i], "status": status_code, **body}
+
+    def item_ok(i: int, response: dict) -> None:
+        results[i] = {"index": i, "id": ids[i], "status": 200, **response}
+
+    async def prepare(i: int) -> tuple[np.ndarray, list[str]] | None:
+        """Đọc + decode + validate 1 item (chạy song song trên executor)."""
+        try:
+            REQUEST_BYTES.observe(upload_size(files[i]))
+            error = check_upload(files[i])
+            if error is not None:
+                item_error(i, error[0], error[1])
+                return None
+            mono = await decode_upload(files[i])
+        except AudioTooLong as e:
+            item_error(i, *audio_too_long(e))
+            return None
+        except InvalidAudio as e:
+            item_error(i, *invalid_audio(str(e)))
+            return None
+        except Exception as e:
+            item_error(i, internal_error_body(e), 500)
+            return None
+        words_ref = normalize_words(texts[i])
+        REFERENCE_WORDS.observe(len(words_ref))
+        error = check_audio(mono) or check_words(words_ref)
+        if error is not None:
+            item_error(i, error[0], error[1])
+            return None
+        return mono, words_ref
+
+    prepared = await asyncio.gather(*(prepare(i) for i in range(n)))
+
+    # Item đã có trong result cache thì không chạy lại
+    pending: list[int] = []
+    keys: dict[int, str] = {}
+    for i, item in enumerate(prepared):
+        if item is None:
+            continue
+        if _result_cache.enabled:
+            keys[i] = await asyncio.to_thread(result_key, item[0], item[1], scoring_config())
+            cached = _result_cache.get(keys[i])
+            _result_cache.record("hits" if cached is not None else "misses")
+            if cached is not None:
+                item_ok(i, dict(cached))
+                continue
+        pending.append(i)
+
+    async def score(i: int, log_probs: np.ndarray) -> None:
+        try:
+            response, _ = await score_one(*prepared[i], log_probs=log_probs)
+        except Exception as e:
+            item_error(i, internal_error_body(e), 500)
+            return
+        if i in keys:
+            _result_cache.put(keys[i], response)
+        item_ok(i, dict(response))
+
+    async def run_batch(batch: list[int]) -> None:
+        """1 forward có padding cho cả batch (cùng length bucket), rồi chấm từng item."""
+        wavs = [prepared[i][0] for i in batch]
+        try:
+            t_stage = time.perf_counter()
+            outputs = await _executor.run(forward_log_probs_batch, wavs)
+            forward_s = time.perf_counter() - t_stage
+        except Exception as e:
+            body = internal_error_body(e)
+            for i in batch:
+                item_error(i, dict(body), 500)
+            return
+        STAGE_SECONDS.labels("forward").observe(forward_s)
+        observe_forward(forward_s, sum(w.size for w in wavs) / 16000.0)
+        await asyncio.gather(*(score(i, lp) for i, lp in zip(batch, outputs)))
+
+    batches = plan_batches([prepared[i][0].size for i in pending], BATCH_MAX_SIZE)
+    await asyncio.gather(*(run_batch([pending[j] for j in batch]) for batch in batches))
+
+    return JSONResponse({
+        "count": n,
+        "failed": sum(r["status"] != 200 for r in results),
+        "results": results,
+    })
+
+
+@app.websocket("/align/stream")
+async def align_stream(ws: WebSocket):
+    """
+    Streaming assessment: model chạy dần trên các cửa sổ chồng lấn trong lúc
+    người học đang nói; khi stream kết thúc chỉ còn cửa sổ cuối + chấm điểm.
+
+    Protocol:
+      1. text JSON: {"referenceText", "sampleRate"=16000, "channels"=1,
+                     "encoding"="pcm_s16le"|"pcm_f32le", "languageCode"}
+         sampleRate 4000..192000, channels 1..8 (khác → invalid_config)
+      2. binary: PCM chunks (interleaved nếu nhiều kênh)
+         ← server gửi {"event": "progress", "receivedMs", "processedMs"}
+      3. text JSON: {"event": "end"}
+         ← server gửi kết quả cùng schema với /align (hoặc {"error", ...}) rồi đóng
+    """
+    await ws.accept()
+    if not is_ready():
+        await ws.send_json(json.loads(not_ready_response().body))
+        await ws.close(code=1013)  # try again later
+        return
+    inference: asyncio.Task | None = None
+    try:
+        config = await ws.receive_json()
+        referenceText = str(config.get("referenceText", ""))
+        mode = diagnostics.resolve_mode(
+            ws.headers.get(diagnostics.HEADER), config.get("diagnostics")
+        )
+        words_ref = normalize_words(referenceText)
+        error = check_words(words_ref)
+        if error is None:
+            try:
+                sample_rate, channels, encoding = stream_config(config)
+            except ValueError as e:
+                error = ({"error": "invalid_config", "detail": str(e)}, 400)
+            else:
+                resampler = StreamResampler(sample_rate, channels)
+        if error is not None:
+            ERRORS.labels(error[0]["error"]).inc()
+            await ws.send_json(error[0])
+            await ws.close(code=1008)
+            return
+
+        audio = AudioBuffer()
+        planner = WindowPlanner()
+        leftover = b""
+
+        async def run_ready_windows():
+            while (window := planner.next_window(audio.size)) is not None:
+                planner.commit(window, await forward_one(audio.view(*window)))
+                await ws.send_json({
+                    "event": "progress",
+                    "receivedMs": round(audio.size / 16.0),
+                    "processedMs": planner.committed * 20,
                 })
 
-        logger.info(f"Found {len(mistakes)} words with low coverage")
-
-        return JSONResponse({
-            "overall": round(overall, 1),
-            "accuracy": round(accuracy_ph, 1),
-            "fluency": round(fluency, 1),
-            "completeness": round(completeness, 1),
-            "wordAccuracy": round(accuracy_ph, 1),  # Simplified
-            "words": words_response,
-            "phonemes": phonemes_response,
-            "mistakes": mistakes
-        })
+        while True:
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes") is not None:
+                frames, leftover = decode_pcm(leftover + message["bytes"], encoding, channels)
+                audio.append(resampler.process(frames))
+                if MAX_AUDIO_S > 0 and audio.size > MAX_AUDIO_S * 16000:
+                    error = audio_too_long(AudioTooLong(audio.size / 16000.0, MAX_AUDIO_S))
+                    ERRORS.labels(error[0]["error"]).inc()
+                    await ws.send_json(error[0])
+                    await ws.close(code=1009)  # message too big
+                    return
+                if inference is None or inference.done():
+                    if inference is not None:
+                        inference.result()  # lỗi forward trước đó → raise
+                    inference = asyncio.create_task(run_ready_windows())
+            elif message.get("text") is not None:
+                if json.loads(message["text"]).get("event") == "end":
+                    break
+
+        # Stream kết thúc: chỉ còn các cửa sổ chưa chạy + cửa sổ cuối
+        audio.append(resampler.flush())
+        if inference is not None:
+            await inference
+        await run_ready_windows()
+
+        mono = audio.view()
+        error = check_audio(mono)
+        if error is not None:
+            ERRORS.labels(error[0]["error"]).inc()
+            await ws.send_json(error[0])
+            await ws.close(code=1008)
+            return
+        window = planner.next_window(audio.size, final=True)
+        if window is not None:
+            planner.commit(window, await forward_one(audio.view(*window)), final=True)
+
+        response, score_stats = await _executor.run(
+            score_utterance_timed, mono, words_ref, planner.log_probs(), mode is not None
+        )
+        observe_stages(score_stats["timings"])
+        if mode is not None:
+            trace = diagnostics.new_trace(
+                endpoint="/align/stream",
+                referenceText=referenceText,
+                scores={k: response[k] for k in ("overall", "accuracy", "fluency", "completeness")},
+                **score_stats["trace"],
+            )
+            diagnostics.emit(mode, trace, response)
+        await ws.send_json(response)
+        await ws.close()
+    except WebSocketDisconnect:
+        logger.info("Streaming client disconnected")
     except Exception as e:
         import traceback
-        error_trace = traceback.format_exc()
-        logger.error(f"[ALIGNER][ERROR] {str(e)}")
-        logger.error(f"[ALIGNER][TRACEBACK] {error_trace}")
-        # Also print to stdout for docker logs
-        print(f"[ALIGNER][ERROR] {str(e)}")
-        print(f"[ALIGNER][TRACEBACK] {error_trace}")
-        return JSONResponse(
-            {
+        logger.error(f"[ALIGNER][STREAM][ERROR] {str(e)}")
+        logger.error(f"[ALIGNER][STREAM][TRACEBACK] {traceback.format_exc()}")
+        ERRORS.labels("internal_error").inc()
+        try:
+            await ws.send_json({
                 "error": "internal_error",
                 "detail": str(e),
                 "type": type(e).__name__,
-            },
-            status_code=500,
-        )
-
+            })
+            await ws.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        if inference is not None and not inference.done():
+            inference.cancel()
@@ -0,0 +1,75 @@
+"""
+Danh sách recording tham chiếu cho các tool offline (so sánh precision,
+benchmark, chấm hàng loạt).
+
+Format hỗ trợ:
+  .jsonl : mỗi dòng {"audio": "...", "text": "...", "id": "..."}
+           (chấp nhận "referenceText" thay cho "text", "path" thay cho "audio")
+  .tsv   : mỗi dòng  <audio path>\t<reference text>[\t<id>]
+  .csv   : có header (cột audio|path, text|referenceText, id tùy chọn) hoặc
+           không header: <audio path>,<reference text>[,<id>]
+
+Đường dẫn audio tương đối được tính từ thư mục chứa manifest.
+"""
+
+import csv
+import json
+import os
+
+
+def _entry(audio: str, text: str, item_id: str | None, base_dir: str, line_no: int) -> dict:
+    if not audio or not text:
+        raise ValueError(f"manifest line {line_no}: audio path and text are required")
+    path = audio if os.path.isabs(audio) else os.path.join(base_dir, audio)
+    return {"id": item_id or audio, "audio": path, "text": text}
+
+
+_AUDIO_COLUMNS = ("audio", "path")
+_TEXT_COLUMNS = ("text", "referenceText")
+
+
+def _read_csv(path: str, base_dir: str) -> list[dict]:
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = [row for row in csv.reader(f) if row and not row[0].startswith("#")]
+    if not rows:
+        return []
+    header = [c.strip() for c in rows[0]]
+    if any(c in header for c in _AUDIO_COLUMNS):
+        audio_col = next(header.index(c) for c in _AUDIO_COLUMNS if c in header)
+        text_col = next((header.index(c) for c in _TEXT_COLUMNS if c in header), 1)
+        id_col = header.index("id") if "id" in header else None
+        rows, first_line = rows[1:], 2
+    else:
+        audio_col, text_col, id_col, first_line = 0, 1, 2, 1
+
+    def field(row: list[str], col: int | None) -> str | None:
+        return row[col].strip() if col is not None and col < len(row) else None
+
+    return [
+        _entry(field(row, audio_col), field(row, text_col), field(row, id_col), base_dir, line_no)
+        for line_no, row in enumerate(rows, first_line)
+    ]
+
+
+def read_manifest(path: str) -> list[dict]:
+    """Manifest → list {"id", "audio" (đường dẫn tuyệt đối hoặc theo cwd), "text"}."""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    if path.endswith(".csv"):
+        return _read_csv(path, base_dir)
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+                audio = item.get("audio") or item.get("path")
+                text = item.get("text") or item.get("referenceText")
+                item_id = item.get("id")
+            else:
+                fields = line.split("\t")
+                audio, text = fields[0], fields[1] if len(fields) > 1 else ""
+                item_id = fields[2] if len(fields) > 2 else None
+            entries.append(_entry(audio, text, item_id, base_dir, line_no))
+    return entries
@@ -0,0 +1,111 @@
+"""
+Prometheus metrics cho aligner (GET /metrics).
+
+Mọi observe() đều chạy trong process uvicorn: các stage chạy trên executor
+(kể cả ALIGN_EXECUTOR=process) trả thời gian về cùng kết quả
+(assess_pronunciation → "timings"), nên không cần collector trong worker
+của pool. Chi phí mỗi observe ~1 µs, ~20 lần / request.
+
+Nhiều worker process (serve.py, ALIGN_WORKERS > 1): đặt
+PROMETHEUS_MULTIPROC_DIR (serve.py tự tạo nếu chưa có) để /metrics của bất
+kỳ worker nào cũng trả số gộp của cả nhóm.
+
+Metric:
+  align_stage_seconds{stage}              : thời gian từng stage của main.align / assess_pronunciation
+  align_request_seconds{endpoint,status}  : end-to-end mỗi request
+  align_queue_wait_seconds{queue}         : chờ trong hàng đợi executor / batcher
+  align_forward_seconds_per_audio_second  : forward time / độ dài audio (RTF của model)
+  align_audio_duration_seconds            : độ dài audio sau decode
+  align_reference_words / _phonemes       : độ dài reference text
+  align_request_bytes                     : kích thước upload
+  align_errors_total{error}               : response lỗi theo mã "error"
+  align_result_cache_total{result}        : lookup result cache (hits / misses / coalesced)
+"""
+
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+_LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+STAGE_SECONDS = Histogram(
+    "align_stage_seconds",
+    "Time spent in each pipeline stage",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "align_request_seconds",
+    "End-to-end request latency",
+    ["endpoint", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "align_queue_wait_seconds",
+    "Time spent waiting for an executor worker or a batch",
+    ["queue"],
+    buckets=_LATENCY_BUCKETS,
+)
+FORWARD_RTF = Histogram(
+    "align_forward_seconds_per_audio_second",
+    "Model forward time divided by audio duration",
+    buckets=(0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0),
+)
+AUDIO_SECONDS = Histogram(
+    "align_audio_duration_seconds",
+    "Decoded audio duration",
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300),
+)
+REFERENCE_WORDS = Histogram(
+    "align_reference_words",
+    "Number of words in the reference text",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+REFERENCE_PHONEMES = Histogram(
+    "align_reference_phonemes",
+    "Number of phonemes in the reference text",
+    buckets=(5, 10, 25, 50, 100, 250, 500, 1000),
+)
+REQUEST_BYTES = Histogram(
+    "align_request_bytes",
+    "Uploaded audio size in bytes",
+    buckets=(1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7, 3e7),
+)
+ERRORS = Counter("align_errors", "Error responses by error code", ["error"])
+RESULT_CACHE = Counter("align_result_cache", "Result cache lookups by outcome", ["result"])
+
+
+def observe_stages(timings: dict[str, float]) -> None:
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def observe_forward(forward_s: float, audio_s: float) -> None:
+    if audio_s > 0:
+        FORWARD_RTF.observe(forward_s / audio_s)
+
+
+def render() -> tuple[bytes, str]:
+    """(body, content type) cho /metrics."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """Gọi từ master khi 1 worker thoát (multiprocess mode)."""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
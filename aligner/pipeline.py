@@ -0,0 +1,276 @@
+"""
+Chấm điểm 1 utterance → response của /align.
+
+Dùng chung cho /align, /align/stream (WebSocket) và các entry point khác để
+mọi nơi trả về cùng schema.
+"""
+
+import io
+import logging
+import time
+from typing import BinaryIO
+
+import numpy as np
+import soundfile as sf
+
+from ctc_segm import assess_pronunciation
+from resample import resample_blocks
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+MIN_AUDIO_S = 0.2
+MIN_RMS = 1e-4
+DECODE_BLOCK_FRAMES = 1 << 16
+
+
+class AudioTooLong(ValueError):
+    """Audio dài hơn giới hạn (phát hiện từ header hoặc trong lúc decode)."""
+
+    def __init__(self, duration_s: float, max_s: float):
+        super().__init__(f"Audio is {duration_s:.1f}s, limit is {max_s:g}s")
+        self.duration_s = duration_s
+        self.max_s = max_s
+
+
+class InvalidAudio(ValueError):
+    """File upload không decode được (không phải audio / format không hỗ trợ / hỏng)."""
+
+
+def decode_audio(source: bytes | BinaryIO, max_duration_s: float = 0.0) -> np.ndarray:
+    """
+    Audio (bytes hoặc file object có seek, vd. file spool của upload) → float32
+    mono 16kHz (downmix + polyphase resample theo block, ghi vào buffer cấp
+    phát 1 lần). max_duration_s > 0: audio dài hơn → AudioTooLong, kiểm tra
+    từ header trước khi decode (format không ghi số frame: trong lúc decode).
+    File không decode được → InvalidAudio.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    else:
+        source.seek(0)
+    try:
+        with sf.SoundFile(source) as f:
+            max_frames = int(max_duration_s * f.samplerate) if max_duration_s > 0 else 0
+            known = f.frames > 0
+            if max_frames and known and f.frames > max_frames:
+                raise AudioTooLong(f.frames / f.samplerate, max_duration_s)
+            blocks = f.blocks(blocksize=DECODE_BLOCK_FRAMES, dtype="float32", always_2d=True)
+            if max_frames and not known:
+                blocks = _limit_blocks(blocks, max_frames, f.samplerate, max_duration_s)
+            return resample_blocks(blocks, f.samplerate, f.channels, n_frames=f.frames)
+    except RuntimeError as e:  # sf.LibsndfileError là RuntimeError
+        # error_string: lỗi của libsndfile, không kèm repr của file object
+        raise InvalidAudio(f"Could not decode audio file: {getattr(e, 'error_string', e)}") from e
+
+
+def _limit_blocks(blocks, max_frames: int, samplerate: int, max_duration_s: float):
+    total = 0
+    for block in blocks:
+        total += len(block)
+        if total > max_frames:
+            raise AudioTooLong(total / samplerate, max_duration_s)
+        yield block
+
+
+def duration_ms_of(mono: np.ndarray) -> int:
+    return int(round(mono.size / float(SAMPLE_RATE) * 1000))
+
+
+def check_audio(mono: np.ndarray) -> tuple[dict, int] | None:
+    """Validate audio length (require at least 0.2s) and non-silence."""
+    duration_ms = duration_ms_of(mono)
+    if mono.size < int(MIN_AUDIO_S * SAMPLE_RATE):
+        return (
+            {
+                "error": "audio_too_short",
+                "detail": "Audio must be >= 0.2s",
+                "durationMs": duration_ms,
+            },
+            400,
+        )
+    rms = float(np.sqrt(np.mean(np.square(mono))) or 0.0)
+    if rms < MIN_RMS:  # near-silent recording
+        return (
+            {
+                "error": "audio_silent",
+                "detail": "Audio level too low",
+                "durationMs": duration_ms,
+                "rms": rms,
+            },
+            400,
+        )
+    return None
+
+
+def check_words(words_ref: list[str]) -> tuple[dict, int] | None:
+    if not words_ref:
+        return (
+            {
+                "error": "invalid_text",
+                "detail": "Reference text contains no valid words",
+            },
+            400,
+        )
+    return None
+
+
+def score_utterance(
+    mono: np.ndarray, words_ref: list[str], log_probs: np.ndarray | None = None
+) -> dict:
+    """assess_pronunciation + build response (CPU-bound, chạy trên executor)."""
+    return score_utterance_timed(mono, words_ref, log_probs)[0]
+
+
+def score_utterance_timed(
+    mono: np.ndarray,
+    words_ref: list[str],
+    log_probs: np.ndarray | None = None,
+    diagnostics: bool = False,
+) -> tuple[dict, dict]:
+    """
+    Như score_utterance, kèm stats cho metrics:
+    {"timings": {stage: giây}, "reference_phonemes": int, "trace": dict | None}.
+    "trace" chỉ có khi diagnostics=True (xem diagnostics.py).
+    """
+    result = assess_pronunciation(mono, words_ref, log_probs, diagnostics)
+    started = time.perf_counter()
+    response = build_align_response(result, words_ref, duration_ms_of(mono))
+    timings = {**result["timings"], "build_response": time.perf_counter() - started}
+    trace = result["trace"]
+    if trace is not None:
+        trace["timingsMs"] = {k: round(v * 1000.0, 3) for k, v in timings.items()}
+    return response, {
+        "timings": timings,
+        "reference_phonemes": len(result["ph_ref_flat"]),
+        "trace": trace,
+    }
+
+
+def build_align_response(result: dict, words_ref: list[str], duration_ms: int) -> dict:
+    accuracy_ph = result["accuracy_ph"]
+    completeness = result["completeness"]
+    fluency = result["fluency"]  # Sử dụng fluency từ calculate_fluency()
+    speech_rate = result.get("speech_rate", 0.0)
+    pause_ratio = result.get("pause_ratio", 0.0)
+    
+    # Overall score: weighted combination
+    overall = 0.4 * accuracy_ph + 0.4 * fluency + 0.2 * completeness
+    logger.debug(
+        "Assessment results: overall=%.1f%%, accuracy=%.1f%%, completeness=%.1f%%, "
+        "fluency=%.1f%% (speech_rate=%.2f wps, pause=%.2f%%)",
+        overall,
+        accuracy_ph,
+        completeness,
+        fluency,
+        speech_rate,
+        pause_ratio * 100,
+    )
+
+    # Thời gian từ forced alignment (forced_align.py); không có → cả audio
+    word_times = result.get("word_times") or []
+    phoneme_times = result.get("phoneme_times") or []
+
+    def word_span(word_idx: int) -> tuple[int, int]:
+        if word_idx < len(word_times):
+            return tuple(word_times[word_idx])
+        return 0, duration_ms
+
+    def phoneme_span(word_idx: int, ph_idx: int) -> tuple[int, int]:
+        seq = phoneme_times[word_idx] if word_idx < len(phoneme_times) else []
+        return tuple(seq[ph_idx]) if ph_idx < len(seq) else (0, duration_ms)
+
+    # Build words response
+    words_response = []
+    # Sử dụng IPA
+    ph_by_word = result.get("ph_by_word_ipa")
+    if not ph_by_word:
+        logger.error("ph_by_word_ipa not found in result")
+        ph_by_word = []
+    phoneme_correctness = result.get("phoneme_correctness") or []
+    phoneme_ops = result.get("phoneme_ops") or []
+    phoneme_matched = result.get("phoneme_matched") or []
+    phoneme_credit = result.get("phoneme_credit") or []
+    phoneme_gop = result.get("phoneme_gop") or []
+
+    def phoneme_entry(word_idx: int, ph_idx: int, ph: str) -> dict:
+        def at(by_word, default):
+            seq = by_word[word_idx] if word_idx < len(by_word) else []
+            return seq[ph_idx] if ph_idx < len(seq) else default
+
+        start, end = phoneme_span(word_idx, ph_idx)
+        # GOP (gop.py) nếu phoneme được align, không thì credit của edit alignment
+        score = at(phoneme_gop, None)
+        if score is None:
+            score = round(100.0 * at(phoneme_credit, 0.0), 1)
+        return {
+            "p": ph,
+            "start": start,
+            "end": end,
+            "score": score,
+            "isCorrect": at(phoneme_correctness, False),
+            "status": at(phoneme_ops, "deletion"),
+            "predicted": at(phoneme_matched, None),
+        }
+
+    phoneme_entries = [
+        [phoneme_entry(word_idx, ph_idx, ph) for ph_idx, ph in enumerate(ph_by_word[word_idx])]
+        if word_idx < len(ph_by_word)
+        else []
+        for word_idx in range(len(words_ref))
+    ]
+
+    # Word score = trung bình điểm phoneme của từ (GOP / credit như trên);
+    # từ không có phoneme (phonemizer trả rỗng) → accuracy_ph
+    word_scores = []
+    for word_idx, word in enumerate(words_ref):
+        entries = phoneme_entries[word_idx]
+        if entries:
+            word_score = sum(e["score"] for e in entries) / len(entries)
+        else:
+            word_score = accuracy_ph
+        word_scores.append(word_score)
+
+        start, end = word_span(word_idx)
+        words_response.append({
+            "text": word,
+            "start": start,
+            "end": end,
+            "score": round(word_score, 1)
+        })
+
+    # Build phonemes response
+    phonemes_response = [
+        {"wordIndex": word_idx, **entry}
+        for word_idx, entries in enumerate(phoneme_entries)
+        for entry in entries
+    ]
+
+    # Build mistakes: words with low completeness
+    mistakes = []
+    word_covered_flags = result["word_covered"]
+    for word_idx, word in enumerate(words_ref):
+        # Check if word is covered (from completeness calculation)
+        if not (word_idx < len(word_covered_flags) and word_covered_flags[word_idx]):
+            start, end = word_span(word_idx)
+            mistakes.append({
+                "wordIndex": word_idx,
+                "word": word,
+                "wordScore": round(word_scores[word_idx], 1),
+                "start": start,
+                "end": end,
+                "phonemes": phoneme_entries[word_idx],
+            })
+
+    logger.debug("Found %d words with low coverage", len(mistakes))
+
+    return {
+        "overall": round(overall, 1),
+        "accuracy": round(accuracy_ph, 1),
+        "fluency": round(fluency, 1),
+        "completeness": round(completeness, 1),
+        "wordAccuracy": round(accuracy_ph, 1),  # Simplified
+        "words": words_response,
+        "phonemes": phonemes_response,
+        "mistakes": mistakes
+    }
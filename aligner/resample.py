@@ -0,0 +1,170 @@
+"""
+Resample audio về 16kHz bằng polyphase filter bank (thay cho np.interp).
+
+- Filter low-pass windowed-sinc (Kaiser) thiết kế 1 lần cho mỗi cặp
+  (src_sr, 16000), tách thành `up` phase × `taps` hệ số, cache theo ratio.
+- StreamResampler nhận từng block (frames, channels), downmix trong block rồi
+  resample luôn → không cần giữ bản stereo / mono full-length trung gian.
+- float32 từ đầu đến cuối.
+
+Cấu hình (env):
+  RESAMPLE_ZERO_CROSSINGS : nửa độ dài filter tính theo zero-crossing (mặc định 16)
+"""
+
+import functools
+import math
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+TARGET_SR = 16000
+
+ZERO_CROSSINGS = int(os.getenv("RESAMPLE_ZERO_CROSSINGS", "16"))
+_ROLLOFF = 0.945
+_KAISER_BETA = 8.6
+
+
+@functools.lru_cache(maxsize=16)
+def polyphase_filter_bank(src_sr: int, dst_sr: int = TARGET_SR) -> tuple[np.ndarray, int, int, int]:
+    """
+    Returns:
+        bank : float32 (up, taps), bank[p, k] = h[p + up*k], đã đảo chiều k
+               để nhân trực tiếp với cửa sổ input tăng dần
+        up, down : dst_sr / src_sr rút gọn
+        half : nửa độ dài filter (đơn vị sample ở tần số up*src_sr)
+    """
+    g = math.gcd(int(src_sr), int(dst_sr))
+    up, down = dst_sr // g, src_sr // g
+    ratio = max(up, down)
+    half = ZERO_CROSSINGS * ratio
+    length = 2 * half + 1
+
+    m = np.arange(length, dtype=np.float64) - half
+    cutoff = _ROLLOFF / ratio
+    h = cutoff * np.sinc(cutoff * m) * np.kaiser(length, _KAISER_BETA) * up
+
+    taps = -(-length // up)
+    h = np.concatenate([h, np.zeros(taps * up - length)])
+    bank = h.reshape(taps, up).T[:, ::-1]
+    return np.ascontiguousarray(bank, dtype=np.float32), up, down, half
+
+
+class StreamResampler:
+    """
+    Resample + downmix theo block, giữ lại đủ history giữa các block.
+
+        rs = StreamResampler(44100, channels=2)
+        for block in blocks:
+            out.append(rs.process(block))
+        out.append(rs.flush())
+    """
+
+    def __init__(self, src_sr: int, channels: int = 1, dst_sr: int = TARGET_SR):
+        self.src_sr = int(src_sr)
+        self.dst_sr = int(dst_sr)
+        self.channels = int(channels)
+        self._passthrough = self.src_sr == self.dst_sr
+        self._n_in = 0
+        self._n_out = 0
+        if not self._passthrough:
+            self._bank, self._up, self._down, self._half = polyphase_filter_bank(
+                self.src_sr, self.dst_sr
+            )
+            self._taps = self._bank.shape[1]
+            # Buffer input (mono) với zero ở trước sample 0; _offset = index tuyệt đối của _buf[0]
+            self._buf = np.zeros(self._taps, dtype=np.float32)
+            self._offset = -self._taps
+
+    def output_length(self, n_in: int) -> int:
+        """Số sample output cho n_in sample input."""
+        if self._passthrough:
+            return n_in
+        return -(-n_in * self._up // self._down)
+
+    def _downmix(self, block: np.ndarray) -> np.ndarray:
+        if block.ndim == 1:
+            return block.astype(np.float32, copy=False)
+        if block.shape[1] == 1:
+            return block[:, 0].astype(np.float32, copy=False)
+        return block.mean(axis=1, dtype=np.float32)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """block: (frames,) hoặc (frames, channels) → float32 mono 16kHz."""
+        mono = self._downmix(block)
+        self._n_in += len(mono)
+        if self._passthrough:
+            return mono
+        self._buf = np.concatenate([self._buf, mono])
+        # Output n cần input tới index (n*down + half) // up
+        last = self._offset + len(self._buf) - 1
+        n_end = (self._up * last + self._up - 1 - self._half) // self._down + 1
+        return self._emit(min(n_end, self.output_length(self._n_in)))
+
+    def flush(self) -> np.ndarray:
+        """Phần output còn lại (đệm zero sau sample cuối)."""
+        if self._passthrough:
+            return np.zeros(0, dtype=np.float32)
+        pad = self._half // self._up + self._taps + 1
+        self._buf = np.concatenate([self._buf, np.zeros(pad, dtype=np.float32)])
+        return self._emit(self.output_length(self._n_in))
+
+    def _emit(self, n_end: int) -> np.ndarray:
+        count = n_end - self._n_out
+        if count <= 0:
+            return np.zeros(0, dtype=np.float32)
+        up, down, half, taps = self._up, self._down, self._half, self._taps
+        buf = self._buf
+        y = np.empty(count, dtype=np.float32)
+        itemsize = buf.itemsize
+        # Output cùng phase cách nhau `up` sample; input tương ứng cách nhau `down`
+        for j0 in range(min(up, count)):
+            t0 = (self._n_out + j0) * down + half
+            phase, base0 = t0 % up, t0 // up
+            start = base0 - (taps - 1) - self._offset
+            rows = len(range(j0, count, up))
+            windows = as_strided(
+                buf[start:], shape=(rows, taps), strides=(down * itemsize, itemsize)
+            )
+            y[j0::up] = windows @ self._bank[phase]
+
+        self._n_out = n_end
+        # Bỏ phần input không còn cần cho output tiếp theo
+        keep_from = (self._n_out * down + half) // up - (taps - 1) - self._offset
+        if keep_from > 0:
+            self._buf = buf[keep_from:].copy()
+            self._offset += keep_from
+        return y
+
+
+def resample_blocks(
+    blocks, src_sr: int, channels: int = 1, n_frames: int | None = None
+) -> np.ndarray:
+    """
+    Downmix + resample 1 dãy block (frames, channels) → float32 mono 16kHz.
+    Biết trước n_frames → ghi thẳng vào buffer output cấp phát 1 lần.
+    """
+    rs = StreamResampler(src_sr, channels)
+    if not n_frames or n_frames <= 0:
+        parts = [rs.process(block) for block in blocks]
+        parts.append(rs.flush())
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+
+    out = np.empty(rs.output_length(n_frames), dtype=np.float32)
+    pos = 0
+    for block in blocks:
+        chunk = rs.process(block)
+        out[pos : pos + len(chunk)] = chunk
+        pos += len(chunk)
+    tail = rs.flush()
+    out[pos : pos + len(tail)] = tail
+    return out[: pos + len(tail)]
+
+
+def resample_to_16k(mono: np.ndarray, sr: int, block_size: int = 1 << 16) -> np.ndarray:
+    """Resample cả mảng (mono hoặc (frames, channels)) theo block."""
+    channels = 1 if mono.ndim == 1 else mono.shape[1]
+    if int(sr) == TARGET_SR:
+        return StreamResampler(sr, channels).process(mono)
+    blocks = (mono[start : start + block_size] for start in range(0, len(mono), block_size))
+    return resample_blocks(blocks, sr, channels, n_frames=len(mono))
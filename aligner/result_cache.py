@@ -0,0 +1,137 @@
+"""
+Cache response của /align theo nội dung (content-addressed) + single-flight.
+
+Key = blake2b(audio 16 kHz float32 sau decode, words đã normalize, cấu hình
+chấm điểm) → cùng 1 recording gửi lại (retry từ Node API, người học nộp lại)
+trả ngay response đã lưu, không chạy lại model. Các request giống nhau đang
+chạy đồng thời chỉ tính 1 lần, các request sau chờ kết quả của request đầu.
+
+Chỉ cache response thành công; request có diagnostics không đi qua cache.
+Cache nằm trong từng process (serve.py với nhiều worker: mỗi worker 1 cache).
+
+Cấu hình (env):
+  ALIGN_RESULT_CACHE_SIZE  : số response tối đa (mặc định 1024, 0 = tắt)
+  ALIGN_RESULT_CACHE_TTL_S : thời gian sống của 1 entry (mặc định 600s)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import RESULT_CACHE
+
+RESULT_CACHE_SIZE = int(os.getenv("ALIGN_RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL_S = float(os.getenv("ALIGN_RESULT_CACHE_TTL_S", "600"))
+
+
+def result_key(mono: np.ndarray, words_ref: list[str], config: dict) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    h.update(json.dumps(config, sort_keys=True).encode("utf-8"))
+    h.update(b"\0")
+    h.update("\x1f".join(words_ref).encode("utf-8"))
+    h.update(b"\0")
+    h.update(np.ascontiguousarray(mono, dtype=np.float32).data)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    LRU + TTL cho response dict, kèm single-flight: get_or_compute(key, fn)
+    chỉ chạy fn 1 lần cho các lời gọi đồng thời cùng key.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, ttl_s: float = RESULT_CACHE_TTL_S):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self._data: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expired = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expired += 1
+                return None
+            self._data.move_to_end(key)
+            return response
+
+    def put(self, key: str, response: dict) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_s, response)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def record(self, result: str) -> None:
+        """Đếm 1 lookup: "hits" | "misses" | "coalesced" (cả lookup làm ngoài get_or_compute)."""
+        with self._lock:
+            setattr(self, result, getattr(self, result) + 1)
+        RESULT_CACHE.labels(result).inc()
+
+    async def get_or_compute(self, key: str, compute) -> tuple[dict, str]:
+        """
+        (response, "hits" | "misses" | "coalesced"). compute() là coroutine
+        function trả response dict; lỗi của nó không được cache và được raise
+        cho mọi request đang chờ. Response trả về là bản copy nông (caller có
+        thể thêm key ở top level).
+        """
+        response = self.get(key)
+        if response is not None:
+            self.record("hits")
+            return dict(response), "hits"
+
+        task = self._inflight.get(key)
+        if task is not None:
+            result = "coalesced"
+        else:
+            result = "misses"
+            # Task riêng: request đầu bị hủy (client ngắt) không làm hỏng các request đang chờ
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        self.record(result)
+        return dict(await asyncio.shield(task)), result
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result())
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "in_flight": len(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
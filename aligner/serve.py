@@ -0,0 +1,246 @@
+"""
+Pre-fork serving: master load model / processor / lexicon 1 lần rồi fork N
+worker uvicorn dùng chung 1 listening socket.
+
+    ALIGN_WORKERS=4 python serve.py
+
+Khác với `uvicorn --workers N` (mỗi worker tự import ctc_segm và giữ 1 bản
+model riêng), weight tensor ở đây nằm trong page của master và được các
+worker chia sẻ copy-on-write:
+  - gc.disable() trong master từ đầu, gc.freeze() ngay trước fork → các
+    object đã load nằm ở permanent generation, GC trong worker không duyệt
+    (không ghi gc header) nên không làm bẩn page của master.
+  - Warm-up trong master chạy 1 thread (OpenMP pool tạo trước fork làm
+    worker treo, xem ctc_segm.warm_up); ONNX session tạo lại trong worker.
+
+Cấu hình (env):
+  ALIGN_WORKERS          : số worker process (mặc định 1)
+  ALIGN_HOST, ALIGN_PORT : địa chỉ listen (mặc định 0.0.0.0:8000)
+  ALIGN_MEMORY_REPORT_S  : log bảng bộ nhớ master + worker sau N giây (mặc định 30, 0 = tắt)
+  ALIGN_EXECUTOR_WORKERS : mặc định 1 thread inference mỗi worker process
+  ALIGN_EXECUTOR=process : pool con được tạo trong từng worker sau fork (lần
+                           submit đầu), không dùng chung queue của master
+  ALIGN_INTRA_OP_THREADS : mặc định số core / ALIGN_WORKERS
+  PROMETHEUS_MULTIPROC_DIR : thư mục metrics dùng chung giữa các worker (mặc
+                           định tạo thư mục tạm khi ALIGN_WORKERS > 1, xem metrics.py)
+
+Đo RSS tăng thêm mỗi worker
+---------------------------
+RSS của worker đếm cả page dùng chung với master, nên cộng RSS các process
+sẽ đếm weight N lần. Dùng /proc/<pid>/smaps_rollup (ctc_segm.process_memory):
+  private = Private_Clean + Private_Dirty : page chỉ worker đó giữ
+            = RSS tăng thêm khi thêm 1 worker
+  shared  = page dùng chung (weight, code, module đã import trong master)
+  pss     = RSS với page dùng chung chia đều cho các process
+Tổng bộ nhớ thật của cả nhóm = Σ pss (master + các worker).
+
+Bảng này được log sau ALIGN_MEMORY_REPORT_S, mỗi worker trả số của mình ở
+GET /stats → "memory", hoặc đo từ ngoài:
+    python serve.py --memory-report <master pid>
+
+Số đo tham khảo (1 vCPU, model cỡ wav2vec2-base 95M params = 361 MiB
+safetensors, ALIGN_WORKERS=4, sau 200 request /align chia cho các worker):
+                              private / worker     tổng PSS
+    serve.py (pre-fork)       115-294, TB 199 MiB  1916 MiB  (master private 58 MiB)
+    uvicorn --workers 4       566-719, TB 645 MiB  3208 MiB
+Phần private còn lại của worker pre-fork là activation / allocator của các
+forward đã chạy, không phải weight (shared ~890 MiB mỗi worker).
+"""
+
+import argparse
+import gc
+import importlib
+import logging
+import os
+import signal
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+logger = logging.getLogger("serve")
+
+WORKERS = int(os.getenv("ALIGN_WORKERS", "1"))
+HOST = os.getenv("ALIGN_HOST", "0.0.0.0")
+PORT = int(os.getenv("ALIGN_PORT", "8000"))
+MEMORY_REPORT_S = float(os.getenv("ALIGN_MEMORY_REPORT_S", "30"))
+
+
+def _children_of(pid: int) -> list[int]:
+    children = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                children.extend(int(c) for c in f.read().split())
+    except OSError:
+        pass
+    return sorted(set(children))
+
+
+def memory_report(master_pid: int, worker_pids: list[int] | None = None) -> dict:
+    """Bộ nhớ master + từng worker, kèm private trung bình / worker và tổng PSS."""
+    from ctc_segm import process_memory
+
+    worker_pids = _children_of(master_pid) if worker_pids is None else worker_pids
+    master = {"pid": master_pid, **process_memory(master_pid)}
+    workers = [{"pid": pid, **process_memory(pid)} for pid in worker_pids]
+    private = [w.get("private_mb") or 0.0 for w in workers]
+    return {
+        "master": master,
+        "workers": workers,
+        "per_worker_private_mb": round(sum(private) / len(private), 1) if private else None,
+        "total_pss_mb": round(sum((p.get("pss_mb") or 0.0) for p in [master, *workers]), 1),
+    }
+
+
+def _log_memory_report(report: dict) -> None:
+    logger.info("Memory (MiB)      pid      rss      pss  private   shared")
+    for role, rows in (("master", [report["master"]]), ("worker", report["workers"])):
+        for row in rows:
+            logger.info(
+                f"  {role:<8} {row['pid']:>8} {row.get('rss_mb', 0):>8} {row.get('pss_mb', 0):>8} "
+                f"{row.get('private_mb', 0):>8} {row.get('shared_mb', 0):>8}"
+            )
+    logger.info(
+        f"  per-worker incremental (private) ≈ {report['per_worker_private_mb']} MiB, "
+        f"total PSS {report['total_pss_mb']} MiB"
+    )
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(sock: socket.socket, app) -> None:
+    import uvicorn
+
+    gc.enable()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_config=None, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(sock: socket.socket, app) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(sock, app)
+        except BaseException:
+            logger.exception("Worker crashed")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def _prepare_metrics_dir(workers: int) -> str | None:
+    """
+    Multiprocess mode của prometheus_client phải bật trước khi import metrics.
+    Trả về thư mục tạm đã tạo (xóa khi dừng), None nếu dùng thư mục có sẵn.
+    """
+    created = None
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        if workers <= 1:
+            return None
+        path = created = tempfile.mkdtemp(prefix="align-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    os.makedirs(path, exist_ok=True)
+    # Số liệu của lần chạy trước không còn ý nghĩa
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))
+    return created
+
+
+def serve(workers: int, host: str, port: int) -> int:
+    metrics_dir = _prepare_metrics_dir(workers)
+    from executor import available_cpus
+    from metrics import mark_process_dead
+
+    # Chia core cho các worker process (executor.py đọc env lúc import)
+    os.environ.setdefault("ALIGN_EXECUTOR_WORKERS", "1")
+    os.environ.setdefault("ALIGN_INTRA_OP_THREADS", str(max(1, available_cpus() // workers)))
+
+    # Không GC trong lúc load: tránh lỗ hổng / dịch chuyển object trong page sẽ share
+    gc.disable()
+    import ctc_segm
+
+    ctc_segm.startup(warmup=True, warmup_threads=1)
+    app = importlib.import_module("main").app
+    sock = _bind_socket(host, port)
+
+    gc.freeze()
+    logger.info(
+        f"Master {os.getpid()} ready: {gc.get_freeze_count()} objects frozen, "
+        f"forking {workers} workers on {host}:{port}"
+    )
+    children = {_spawn(sock, app) for _ in range(workers)}
+
+    stopping = False
+
+    def _stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    report_at = time.monotonic() + MEMORY_REPORT_S if MEMORY_REPORT_S > 0 else None
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if report_at is not None and time.monotonic() >= report_at:
+                report_at = None
+                _log_memory_report(memory_report(os.getpid(), sorted(children)))
+            time.sleep(0.5)
+            continue
+        children.discard(pid)
+        mark_process_dead(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} exited ({os.waitstatus_to_exitcode(status)}); restarting")
+            time.sleep(1.0)
+            children.add(_spawn(sock, app))
+    sock.close()
+    if metrics_dir is not None:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+    logger.info("All workers stopped")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Pre-fork aligner server")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument(
+        "--memory-report", type=int, metavar="MASTER_PID", help="print memory of a running server and exit"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s",
+    )
+
+    if args.memory_report:
+        report = memory_report(args.memory_report)
+        _log_memory_report(report)
+        return 0
+    return serve(max(1, args.workers), args.host, args.port)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
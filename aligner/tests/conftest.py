@@ -0,0 +1,11 @@
+"""
+Test cho các kernel NumPy của aligner (không cần model / espeak).
+
+    cd aligner && python -m pytest -q tests
+"""
+
+import os
+import sys
+
+# Module của aligner là file phẳng, import theo tên (giống khi chạy main.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
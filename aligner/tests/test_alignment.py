@@ -0,0 +1,81 @@
+"""alignment.py so với DP Python thuần (edit_distance_weighted trước khi vector hóa)."""
+
+import numpy as np
+
+from alignment import COST_SCALE, PhonemeInventory, align_ids, edit_distance_ids, substring_distances_ids
+
+# Aspirated / flap → cùng phoneme sau normalize; (t, d), (i, ɪ) confusable
+TOKENS = ["t", "tʰ", "ɾ", "d", "k", "kʰ", "i", "iː", "ɪ", "ə", "æ", "s", "z", "ʃ"]
+CONFUSABLE = {("t", "d"), ("d", "t"), ("i", "ɪ"), ("ɪ", "i"), ("s", "z"), ("z", "s")}
+
+
+def normalize(token: str) -> str:
+    token = token.replace("ʰ", "").replace("ː", "")
+    return "t" if token == "ɾ" else token
+
+
+def sub_cost(a: str, b: str) -> float:
+    a, b = normalize(a), normalize(b)
+    if a == b:
+        return 0.0
+    if (a[:1], b[:1]) in CONFUSABLE:
+        return 0.5
+    return 1.0
+
+
+def reference_distance(a: list[str], b: list[str], semiglobal: bool = False) -> float:
+    """DP O(m·n) từng ô; semiglobal: gap ở 2 đầu b miễn phí."""
+    m, n = len(a), len(b)
+    dp = [[0.0] * (n + 1) for _ in range(m + 1)]
+    for i in range(1, m + 1):
+        dp[i][0] = dp[i - 1][0] + 1.0
+    for j in range(1, n + 1):
+        dp[0][j] = 0.0 if semiglobal else dp[0][j - 1] + 1.0
+    for i in range(1, m + 1):
+        for j in range(1, n + 1):
+            dp[i][j] = min(
+                dp[i - 1][j] + 1.0,
+                dp[i][j - 1] + 1.0,
+                dp[i - 1][j - 1] + sub_cost(a[i - 1], b[j - 1]),
+            )
+    return min(dp[m]) if semiglobal else dp[m][n]
+
+
+def random_sequences(rng, count: int, max_len: int = 12):
+    for _ in range(count):
+        a = list(rng.choice(TOKENS, size=rng.integers(0, max_len + 1)))
+        b = list(rng.choice(TOKENS, size=rng.integers(0, max_len + 1)))
+        yield a, b
+
+
+def test_edit_distance_matches_reference():
+    rng = np.random.default_rng(0)
+    inventory = PhonemeInventory(normalize, CONFUSABLE)
+    for a, b in random_sequences(rng, 500):
+        ids_a, ids_b = inventory.encode(a), inventory.encode(b)
+        got = edit_distance_ids(ids_a, ids_b, inventory.costs)
+        assert got == COST_SCALE * reference_distance(a, b), (a, b)
+
+
+def test_substring_distances_match_reference():
+    rng = np.random.default_rng(1)
+    inventory = PhonemeInventory(normalize, CONFUSABLE)
+    for _ in range(100):
+        pred = list(rng.choice(TOKENS, size=rng.integers(0, 20)))
+        refs = [list(rng.choice(TOKENS, size=rng.integers(0, 8))) for _ in range(rng.integers(1, 6))]
+        got = substring_distances_ids(
+            [inventory.encode(r) for r in refs], inventory.encode(pred), inventory.costs
+        )
+        expected = [COST_SCALE * reference_distance(r, pred, len(pred) > len(r)) for r in refs]
+        assert got.tolist() == expected, (refs, pred)
+
+
+def test_align_ids_distance_matches_reference():
+    rng = np.random.default_rng(2)
+    inventory = PhonemeInventory(normalize, CONFUSABLE)
+    for a, b in random_sequences(rng, 300):
+        result = align_ids(inventory.encode(a), inventory.encode(b), inventory.costs)
+        # ref rỗng: mọi phoneme pred tính là insertion (PER = 1 nếu có pred)
+        expected = COST_SCALE * reference_distance(a, b, len(b) > len(a) > 0)
+        assert result["distance"] == expected, (a, b)
+        assert len(result["ops"]) == len(a)
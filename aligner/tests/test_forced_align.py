@@ -0,0 +1,74 @@
+"""ctc_viterbi so với Viterbi CTC Python thuần (so điểm đường tốt nhất, đường có thể khác khi hòa)."""
+
+import math
+
+import numpy as np
+
+from forced_align import ctc_viterbi
+
+BLANK = 0
+
+
+def reference_best_score(log_probs: np.ndarray, tokens: list[int]) -> float:
+    """max log-prob trên mọi đường CTC của tokens (-inf nếu không có đường nào)."""
+    ext = [BLANK]
+    for tok in tokens:
+        ext += [tok, BLANK]
+    n_states = len(ext)
+    alpha = [-math.inf] * n_states
+    alpha[0] = float(log_probs[0, ext[0]])
+    if n_states > 1:
+        alpha[1] = float(log_probs[0, ext[1]])
+    for t in range(1, len(log_probs)):
+        new = [-math.inf] * n_states
+        for s in range(n_states):
+            best = alpha[s]
+            if s >= 1:
+                best = max(best, alpha[s - 1])
+            if s >= 2 and ext[s] != BLANK and ext[s] != ext[s - 2]:
+                best = max(best, alpha[s - 2])
+            new[s] = best + float(log_probs[t, ext[s]])
+        alpha = new
+    return max(alpha[-1], alpha[-2]) if n_states > 1 else alpha[-1]
+
+
+def path_score(log_probs: np.ndarray, tokens: list[int], spans: np.ndarray) -> float:
+    """Điểm đường suy ra từ spans (frame ngoài các span = blank), kiểm tra tính hợp lệ."""
+    labels = np.full(len(log_probs), BLANK)
+    prev_end = 0
+    for k, (start, end) in enumerate(spans.tolist()):
+        assert prev_end <= start < end <= len(log_probs)
+        if k and tokens[k] == tokens[k - 1]:
+            assert start > prev_end  # token lặp phải có blank ở giữa
+        labels[start:end] = tokens[k]
+        prev_end = end
+    return float(log_probs[np.arange(len(log_probs)), labels].astype(np.float64).sum())
+
+
+def random_log_probs(rng, n_frames: int, vocab: int) -> np.ndarray:
+    logits = rng.standard_normal((n_frames, vocab)) * 3.0
+    logits[:, BLANK] += 2.0  # blank trội như model CTC thật
+    return (logits - np.logaddexp.reduce(logits, axis=1, keepdims=True)).astype(np.float32)
+
+
+def test_matches_reference_viterbi():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        vocab = int(rng.integers(2, 8))
+        tokens = rng.integers(1, vocab, size=rng.integers(1, 8)).tolist()
+        log_probs = random_log_probs(rng, int(rng.integers(1, 40)), vocab)
+        spans = ctc_viterbi(log_probs, np.asarray(tokens), BLANK)
+        expected = reference_best_score(log_probs, tokens)
+        if spans is None:
+            assert expected == -math.inf, tokens
+            continue
+        assert spans.shape == (len(tokens), 2)
+        assert math.isclose(path_score(log_probs, tokens, spans), expected, rel_tol=1e-5, abs_tol=1e-3)
+
+
+def test_too_short_returns_none():
+    log_probs = random_log_probs(np.random.default_rng(1), 3, 4)
+    # "a a" cần ít nhất 3 frame (a, blank, a); "a a a" cần 5
+    assert ctc_viterbi(log_probs, np.array([1, 1]), BLANK) is not None
+    assert ctc_viterbi(log_probs, np.array([1, 1, 1]), BLANK) is None
+    assert ctc_viterbi(log_probs, np.array([], dtype=np.int64), BLANK) is None
@@ -0,0 +1,61 @@
+"""segment_gop / phoneme_scores so với tổng Python thuần theo từng frame."""
+
+import math
+
+import numpy as np
+
+from gop import phoneme_scores, segment_gop
+
+
+def reference_segment(log_probs: np.ndarray, token: int, start: int, end: int, blank: int = 0) -> float:
+    total = 0.0
+    for t in range(start, end):
+        best = max(float(v) for i, v in enumerate(log_probs[t]) if i != blank)
+        total += float(log_probs[t, token]) - best
+    return total
+
+
+def random_case(rng, vocab: int, blank: int, n_frames: int = 200, n_tokens: int = 30):
+    logits = rng.standard_normal((n_frames, vocab))
+    log_probs = (logits - np.logaddexp.reduce(logits, axis=1, keepdims=True)).astype(np.float32)
+    non_blank = [v for v in range(vocab) if v != blank]
+    tokens = rng.choice(non_blank, size=n_tokens)
+    bounds = np.sort(rng.choice(np.arange(n_frames + 1), size=2 * n_tokens, replace=False))
+    return log_probs, tokens, bounds.reshape(n_tokens, 2)
+
+
+def test_segment_gop_matches_reference():
+    rng = np.random.default_rng(0)
+    # blank ở đầu / cuối / giữa vocab, và vocab chỉ 2 cột
+    for vocab, blank in ((40, 0), (40, 39), (40, 13), (2, 0), (2, 1)):
+        log_probs, tokens, spans = random_case(rng, vocab, blank)
+        sums, frames = segment_gop(log_probs, tokens, spans, blank)
+        for k, (start, end) in enumerate(spans.tolist()):
+            expected = reference_segment(log_probs, int(tokens[k]), start, end, blank)
+            assert math.isclose(sums[k], expected, rel_tol=1e-6, abs_tol=1e-4)
+            assert frames[k] == end - start
+
+
+def test_phoneme_scores_merge_tokens_and_skip_unmapped():
+    rng = np.random.default_rng(1)
+    log_probs, tokens, spans = random_case(rng, 10, 0, n_tokens=3)
+    # phoneme 0 = token 0 + 1 (vd. diphthong tách đôi), phoneme 1 không có token, phoneme 2 = token 2
+    alignment = {
+        "phonemes": [[None, None], [None]],
+        "segments": {
+            "tokens": tokens,
+            "spans": spans,
+            "token_phone": np.array([0, 0, 2]),
+            "phone_word": [0, 0, 1],
+        },
+    }
+    scores = phoneme_scores(log_probs, alignment, 0)
+
+    def score(token_spans) -> float:
+        total = sum(reference_segment(log_probs, int(tokens[k]), *spans[k]) for k in token_spans)
+        n = sum(int(spans[k][1] - spans[k][0]) for k in token_spans)
+        return 100.0 * math.exp(total / n)
+
+    assert abs(scores[0][0] - score([0, 1])) <= 0.05 + 1e-6
+    assert scores[0][1] is None
+    assert abs(scores[1][0] - score([2])) <= 0.05 + 1e-6
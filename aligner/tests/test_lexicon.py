@@ -0,0 +1,41 @@
+"""write_lexicon → Lexicon (mmap) round-trip."""
+
+import numpy as np
+import pytest
+
+from lexicon import Lexicon, write_lexicon
+
+SYMBOLS = ["h", "ə", "l", "oʊ", "ˈɛ", "t", "tʰ", "ɾ", "ŋ", "iː", "ʃ", "ð", "æ", "ɹ", "aɪ"]
+WORDS = ["hello", "world", "café", "naïve", "a", "zebra", "ngủ", "đường", "x-ray", "it's", "aa", "ab", "b"]
+
+
+def random_entries(rng) -> dict[str, tuple[list[str], list[str], list[str]]]:
+    entries = {}
+    for word in WORDS:
+        ipa = list(rng.choice(SYMBOLS, size=rng.integers(1, 8)))
+        norm = [tok.replace("ˈ", "").replace("ʰ", "") for tok in ipa]
+        simple = list(rng.choice(SYMBOLS, size=rng.integers(0, 8)))  # có thể rỗng
+        entries[word] = (ipa, norm, simple)
+    return entries
+
+
+def test_round_trip(tmp_path):
+    entries = random_entries(np.random.default_rng(0))
+    path = str(tmp_path / "lexicon.bin")
+    write_lexicon(path, entries, {"language": "en-us"})
+
+    lex = Lexicon(path)
+    assert len(lex) == len(entries)
+    assert lex.meta["language"] == "en-us" and lex.meta["n_entries"] == len(entries)
+    for word, expected in entries.items():
+        assert lex.lookup(word) == expected, word
+    for missing in ("", "hell", "helloo", "zzz", "Hello", "cafe"):
+        assert lex.lookup(missing) is None, missing
+    assert lex.stats()["hits"] == len(entries)
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not_a_lexicon.bin"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        Lexicon(str(path))
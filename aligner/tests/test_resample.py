@@ -0,0 +1,61 @@
+"""StreamResampler so với tích chập polyphase trực tiếp (từng sample output)."""
+
+import numpy as np
+
+from resample import StreamResampler, polyphase_filter_bank, resample_blocks
+
+
+def reference_resample(x: np.ndarray, src_sr: int, dst_sr: int = 16000) -> np.ndarray:
+    """y[n] = Σ_k x[k] · h(n·down − k·up), h là filter gốc (dựng lại từ bank)."""
+    bank, up, down, half = polyphase_filter_bank(src_sr, dst_sr)
+    taps = bank.shape[1]
+    h = bank[:, ::-1].T.reshape(-1).astype(np.float64)  # h[k·up + p] = bank[p, taps-1-k]
+    n_out = -(-len(x) * up // down)
+    k = np.arange(len(x))
+    y = np.zeros(n_out)
+    for n in range(n_out):
+        idx = n * down - k * up + half
+        valid = (idx >= 0) & (idx < taps * up)
+        y[n] = np.dot(x[valid], h[idx[valid]])
+    return y
+
+
+def stream(x: np.ndarray, src_sr: int, block_sizes, channels: int = 1) -> np.ndarray:
+    rs = StreamResampler(src_sr, channels)
+    parts, pos, i = [], 0, 0
+    while pos < len(x):
+        size = block_sizes[i % len(block_sizes)]
+        parts.append(rs.process(x[pos : pos + size]))
+        pos += size
+        i += 1
+    parts.append(rs.flush())
+    return np.concatenate(parts)
+
+
+def test_matches_direct_convolution():
+    rng = np.random.default_rng(0)
+    for src_sr in (8000, 22050, 44100, 48000):
+        x = rng.standard_normal(int(0.05 * src_sr)).astype(np.float32)
+        expected = reference_resample(x.astype(np.float64), src_sr)
+        got = stream(x, src_sr, [len(x)])
+        assert len(got) == len(expected)
+        np.testing.assert_allclose(got, expected, atol=1e-4)
+
+
+def test_block_size_does_not_change_output():
+    rng = np.random.default_rng(1)
+    x = rng.standard_normal(22050).astype(np.float32)
+    whole = stream(x, 44100, [len(x)])
+    for sizes in ([1], [7, 300, 4096], [1000]):
+        np.testing.assert_allclose(stream(x, 44100, sizes), whole, atol=1e-5)
+
+
+def test_stereo_downmix_and_passthrough():
+    rng = np.random.default_rng(2)
+    stereo = rng.standard_normal((4800, 2)).astype(np.float32)
+    mono = stereo.mean(axis=1)
+    downmixed = stream(stereo, 48000, [1024], channels=2)
+    np.testing.assert_allclose(downmixed, stream(mono, 48000, [1024]), atol=1e-6)
+
+    x = rng.standard_normal(1600).astype(np.float32)
+    np.testing.assert_array_equal(resample_blocks([x[:1000], x[1000:]], 16000, n_frames=len(x)), x)